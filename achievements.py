@@ -0,0 +1,94 @@
+import threading
+from collections import namedtuple
+
+# ==========================
+# 🏅 Achievement Engine
+# ==========================
+# Achievements, titles and badges are declared as rules over named
+# counters. When a player record is saved the engine reads the counters,
+# compares them with the values it saw last time, and evaluates only the
+# rules that depend on a counter that changed. Unlocks are written into the
+# record (record["achievements"], ["titles"], ["badges"]) together with
+# achievements_count, so the commands and the Hall of Fame just read them.
+
+# counter name -> how to read it from a player record
+COUNTERS = {
+    "quests_done": lambda r: r.get("quests_done", 0),
+    "battles_won": lambda r: r.get("battles_won", 0),
+    "gacha_pulls": lambda r: r.get("gacha_pulls", 0),
+    "marriages": lambda r: len(r.get("married", [])),
+    "daily_streak": lambda r: r.get("daily_streak", 0),
+    "donor": lambda r: int(bool(r.get("donor", False))),
+    "achievements_count": lambda r: len(r.get("achievements", [])),
+}
+COUNTER_NAMES = tuple(COUNTERS)
+
+Rule = namedtuple("Rule", "key kind name desc counter threshold")
+
+RULES = (
+    Rule("novice_adventurer", "achievements", "Novice Adventurer", "Complete your first quest", "quests_done", 1),
+    Rule("battle_rookie", "achievements", "Battle Rookie", "Win your first battle", "battles_won", 1),
+    Rule("collector", "achievements", "Collector", "Summon 5 items via gacha", "gacha_pulls", 5),
+    Rule("lover", "achievements", "Lover", "Marry a character", "marriages", 1),
+
+    Rule("quest_master", "titles", "📜 Quest Master", "Complete 50 quests", "quests_done", 50),
+    Rule("arena_champion", "titles", "⚔️ Arena Champion", "Win 100 battles", "battles_won", 100),
+    Rule("patron", "titles", "💖 Patron of Adventure", "Support the bot", "donor", 1),
+    Rule("streak_legend", "titles", "📅 Streak Legend", "Reach a 30-day daily streak", "daily_streak", 30),
+    Rule("achievement_hunter", "titles", "🏅 Achievement Hunter", "Unlock an achievement", "achievements_count", 1),
+
+    Rule("supporter", "badges", "💖 Supporter", "Donate to the bot", "donor", 1),
+    Rule("veteran", "badges", "⚔️ Veteran Player", "Complete 100 quests", "quests_done", 100),
+)
+
+RULES_BY_KEY = {rule.key: rule for rule in RULES}
+RULES_BY_COUNTER = {name: tuple(r for r in RULES if r.counter == name) for name in COUNTER_NAMES}
+
+def rules_of(kind):
+    return tuple(r for r in RULES if r.kind == kind)
+
+def unlocked(record, kind):
+    # Unlocked rules of one kind, in declaration order
+    keys = set(record.get(kind, []))
+    return [r for r in rules_of(kind) if r.key in keys]
+
+class AchievementEngine:
+    def __init__(self):
+        self._seen = {}  # user_id -> counter values tuple at the last evaluation
+        self._lock = threading.Lock()
+
+    def observe(self, user_id, record):
+        # Evaluate rules whose counters changed; returns the newly unlocked rules
+        new = []
+        while True:
+            values = tuple(COUNTERS[name](record) for name in COUNTER_NAMES)
+            with self._lock:
+                before = self._seen.get(user_id)
+                self._seen[user_id] = values
+            changed = [name for i, name in enumerate(COUNTER_NAMES) if before is None or before[i] != values[i]]
+            if not changed:
+                break
+            unlocks = []
+            for name in changed:
+                value = values[COUNTER_NAMES.index(name)]
+                for rule in RULES_BY_COUNTER[name]:
+                    if value >= rule.threshold and rule.key not in record.get(rule.kind, []):
+                        unlocks.append(rule)
+            if not unlocks:
+                break
+            for rule in unlocks:
+                record.setdefault(rule.kind, []).append(rule.key)
+            record["achievements_count"] = len(record.get("achievements", []))
+            new.extend(unlocks)  # loop again: achievements_count may unlock titles
+        if record.get("achievements_count", 0) != len(record.get("achievements", [])):
+            record["achievements_count"] = len(record.get("achievements", []))
+        return new
+
+    def rebuild(self, records):
+        # Evaluate every rule once for every player; returns changed records
+        changed = {}
+        for user_id, record in records:
+            count = record.get("achievements_count")
+            if self.observe(user_id, record) or record.get("achievements_count") != count:
+                changed[user_id] = record
+        return changed
@@ -1,73 +1,379 @@
-import os, json, random
+import os, queue, random, signal, threading, functools
+from types import SimpleNamespace
+import storage, players, leaderboards, catalog, drops, views, webserver, workers, metrics, scheduler, history, ledger, ratelimit, media, inventory as inv, achievements as ach, events as ev, missions as mis, guilds
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext
-pip install --upgrade setuptools
-pip install --upgrade apscheduler
+from telegram.error import TelegramError
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext, JobQueue, ExtBot
+from telegram.ext import TypeHandler, DispatcherHandlerStop
+from outbox import Outbox, Broadcaster
 # ==========================
 # 🔒 Security & Data Handling
 # ==========================
 DATA_FILE = "users.json"
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # set in Replit Secrets
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")  # sqlite | json
+DB_FILE = os.getenv("DB_FILE", "users.db")
+GUILD_FILE = os.getenv("GUILD_FILE", "guilds.json")
+GUILD_DB = os.getenv("GUILD_DB", "guilds.db")
+USERS_FLUSH_INTERVAL = float(os.getenv("USERS_FLUSH_INTERVAL", "5"))  # seconds
+USERS_FLUSH_THRESHOLD = int(os.getenv("USERS_FLUSH_THRESHOLD", "200"))  # dirty players
+BROADCAST_FILE = os.getenv("BROADCAST_FILE", "broadcasts.json")  # broadcast checkpoints
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+RESET_TZ = os.getenv("RESET_TZ", "UTC")           # timezone of the daily reset
+RESET_TIME = os.getenv("RESET_TIME", "00:00")     # HH:MM in RESET_TZ
+RESET_STATE_FILE = os.getenv("RESET_STATE_FILE", "resets.json")
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")  # quest log / journal / report event log
+LEDGER_DIR = os.getenv("LEDGER_DIR", "ledger")  # append-only coin ledger + snapshots
+THROTTLE = os.getenv("THROTTLE", "1") != "0"    # per-user rate limits (off for load tests)
+MEDIA_CACHE_FILE = os.getenv("MEDIA_CACHE_FILE", "media_cache.json")  # image url -> Telegram file_id
+MEDIA_WARM_CHAT = os.getenv("MEDIA_WARM_CHAT")  # chat used to pre-upload card images (optional)
+MEDIA_PREWARM_INTERVAL = int(os.getenv("MEDIA_PREWARM_INTERVAL", "600"))  # seconds
+
+# All player state lives in memory as players.Player records (upgraded to
+# the current schema as they load); dirty players are flushed in the background
+store = storage.CachedStore(
+    storage.open_store(STORAGE_BACKEND, DB_FILE if STORAGE_BACKEND == "sqlite" else DATA_FILE),
+    flush_interval=USERS_FLUSH_INTERVAL,
+    flush_threshold=USERS_FLUSH_THRESHOLD,
+    load=players.Player.load
+)
+
+# First run on the SQLite backend: import the legacy users.json once
+if STORAGE_BACKEND == "sqlite" and store.count() == 0 and os.path.exists(DATA_FILE):
+    migrated = storage.migrate_json(DATA_FILE, store)
+    if migrated:
+        print(f"✅ Imported {migrated} players from {DATA_FILE}")
+
+# Full histories live in the event log; records keep only the recent few
+history_log = history.EventLog(HISTORY_DB)
+store.put_many(history.migrate_records(store.scan(), history_log))
+
+new_player = players.new_player
+
+# Every coin change is appended to the ledger; after a crash its balances
+# win over records that hadn't been flushed yet
+coin_ledger = ledger.Ledger(LEDGER_DIR)
+corrected = ledger.reconcile(coin_ledger, store, new_record=new_player)
+if corrected:
+    print(f"📒 Restored {corrected} coin balances from the ledger")
+store.before_flush = coin_ledger.flush
+print(f"📒 Ledger replayed {coin_ledger.replayed} events in {coin_ledger.replay_seconds:.2f}s")
+
+# Achievements, titles and badges unlock as counters change (see achievements.py);
+# the first pass backfills unlocks and achievements_count for existing players
+trophies = ach.AchievementEngine()
+store.put_many(trophies.rebuild(store.scan()))
+
+# Sorted indexes for /leaderboard, /ranking and /halloffame, kept current by
+# the leaderboard subscriber (see Domain Events)
+boards = leaderboards.Leaderboards()
+boards.rebuild(store.scan())
+
+# Guild documents live in their own store; membership and aggregates are
+# indexed in memory (see guilds.py)
+guild_store = storage.CachedStore(
+    storage.open_store(STORAGE_BACKEND, GUILD_DB if STORAGE_BACKEND == "sqlite" else GUILD_FILE),
+    flush_interval=USERS_FLUSH_INTERVAL
+)
+guild_index = guilds.Guilds(guild_store)
+store.put_many(guild_index.rebuild(store.scan()))
+
+# Handlers emit domain events; counters, achievements, missions, journal and
+# leaderboards catch up in batches on the bus thread
+bus = ev.EventBus()
+
+# Active daily/weekly missions, drawn from the pool per period (see missions.py)
+mission_board = mis.MissionBoard()
 
 def load_users():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump({}, f, indent=2)
-        return {}
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # Inside an update this is the update's view (see storage.UnitOfWork),
+    # so every handler and helper shares one read per player. Outside one
+    # (jobs, scripts) it's a fresh lazy view over the in-memory store.
+    unit = storage.current_unit()
+    if unit is not None:
+        return unit.users
+    return storage.UserMap(store)
 
 def save_users(users):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, indent=2)
+    # Inside an update the write is deferred to the end of the update
+    unit = storage.current_unit()
+    if unit is not None and users is unit.users:
+        unit.dirty = True
+        return
+    write_users(users)
+
+def update_unit():
+    return storage.UnitOfWork(store, commit_update, bus.publish)
+
+def commit_update(users):
+    # The one write at the end of an update, timed as its own "handler"
+    with metrics.registry.handler("commit_update"):
+        write_users(users)
+
+def write_users(users):
+    # Marks the touched records dirty; the flusher writes them out later.
+    # Achievements and leaderboards follow from the PlayerSaved ev.
+    with metrics.registry.phase("storage"):
+        records = users.touched() if isinstance(users, storage.UserMap) else users
+        store.put_many(records)
+    bus.publish(*[ev.PlayerSaved(user_id) for user_id in records])
+
+def emit(*new):
+    # Inside an update events wait for the commit (see storage.UnitOfWork).
+    # Stamped now, so subscribers know when the action happened.
+    new = ev.stamped(new)
+    unit = storage.current_unit()
+    if unit is not None:
+        unit.events.extend(new)
+    else:
+        bus.publish(*new)
+
+def change_coins(user_id, data, delta, reason, note=""):
+    # The only way coins change: updates the record and appends to the ledger
+    data["coins"] = data.get("coins", 0) + delta
+    coin_ledger.record(user_id, reason, delta, data["coins"], note)
+    emit(ev.CoinsChanged(user_id, delta, data["coins"], reason))
+
+def user_locked(handler):
+    # Runs the handler while holding the caller's lock, so concurrent updates
+    # from one player can't interleave their load -> modify -> save cycles
+    @functools.wraps(handler)
+    def wrapper(update, context):
+        user = getattr(update, "effective_user", None) or update.from_user
+        with storage.user_lock(str(user.id)):
+            return handler(update, context)
+    return wrapper
+
+# ==========================
+# 📣 Domain Events
+# ==========================
+# Subscribers run on the bus thread, one batch at a time. Each one folds its
+# batch per player and writes all the players it changed in one go.
+def update_players(user_ids, change):
+    # change(user_id, record) returns True if it changed the record
+    changed = {}
+    for user_id in user_ids:
+        with storage.user_lock(user_id):
+            data = store.get(user_id)
+            if data is not None and change(user_id, data):
+                changed[user_id] = data
+    if changed:
+        write_users(changed)
+
+# event type -> counter it bumps
+COUNTED = {
+    ev.QuestCompleted: "quests_done",
+    ev.BattleWon: "battles_won",
+    ev.GachaPulled: "gacha_pulls",
+    ev.ItemUpgraded: "upgrades_done",
+}
+
+def count_events(batch):
+    deltas = {}
+    for event in batch:
+        if isinstance(event, ev.ItemUpgraded) and not event.success:
+            continue
+        counts = deltas.setdefault(event.user_id, {})
+        field = COUNTED[type(event)]
+        counts[field] = counts.get(field, 0) + (event.pulls if isinstance(event, ev.GachaPulled) else 1)
+
+    def bump(user_id, data):
+        for field, n in deltas[user_id].items():
+            data[field] = data.get(field, 0) + n
+        return True
+    update_players(deltas, bump)
+
+def track_missions(batch):
+    deltas = mission_board.progress(batch, resets.day_of)
+
+    def bump(user_id, data):
+        progress = data.setdefault("mission_progress", {})
+        for key, n in deltas[user_id].items():
+            progress[key] = progress.get(key, 0) + n
+        return True
+    update_players(deltas, bump)
+
+def journal_line(event):
+    # Journal text for an event worth remembering, or None
+    if isinstance(event, ev.ItemAcquired) and event.rarity in ("Epic", "Legendary"):
+        return f"Obtained {RARITY_EMOJIS[event.rarity]} {event.rarity} {event.name} ({event.source})"
+    if isinstance(event, ev.ItemUpgraded) and event.success:
+        return f"Upgraded {event.name} to {RARITY_EMOJIS[event.rarity]} {event.rarity}"
+    return None
+
+def write_journal(batch):
+    entries, today = {}, datetime.date.today().isoformat()
+    for event in batch:
+        line = journal_line(event)
+        if line:
+            entries.setdefault(event.user_id, []).append(line)
+
+    def append(user_id, data):
+        for line in entries[user_id]:
+            history.record(data, "journal", {"date": today, "event": line}, history_log, user_id)
+        return True
+    update_players(entries, append)
+
+def check_achievements(batch):
+    unlocked = {}
+
+    def observe(user_id, data):
+        count = data.get("achievements_count")
+        rules = trophies.observe(user_id, data)
+        if rules:
+            unlocked[user_id] = rules
+        return bool(rules) or data.get("achievements_count") != count
+    update_players({event.user_id for event in batch}, observe)
+    for user_id, rules in unlocked.items():
+        for rule in rules:
+            outbox.send(user_id, f"🏅 Unlocked: <b>{rule.name}</b>\n{rule.desc}", parse_mode="HTML")
+
+def update_guilds(batch):
+    totals, wins, saved = {}, {}, set()
+    for event in batch:
+        if isinstance(event, ev.PlayerSaved):
+            saved.add(event.user_id)
+            continue
+        amounts = totals.setdefault(event.guild, {})
+        if isinstance(event, ev.GuildWarWon):
+            amounts["wars_won"] = amounts.get("wars_won", 0) + 1
+            won = wins.setdefault(event.user_id, [0, 0])
+            won[0] += 1
+            won[1] += event.reward
+        else:
+            amounts["coins"] = amounts.get("coins", 0) + event.coins
+    guild_index.add(totals)
+
+    def bump(user_id, data):
+        data["guild_wins"] = data.get("guild_wins", 0) + wins[user_id][0]
+        data["guild_rewards"] = data.get("guild_rewards", 0) + wins[user_id][1]
+        return True
+    update_players(wins, bump)
+    for user_id in saved:
+        record = store.get(user_id)
+        if record is not None:
+            guild_index.observe(user_id, record)
+
+def update_boards(batch):
+    saved = set()
+    for event in batch:
+        if isinstance(event, ev.CoinsChanged):
+            boards["coins"].update(event.user_id, event.balance)
+        else:
+            saved.add(event.user_id)
+    for user_id in saved:
+        record = store.get(user_id)
+        if record is not None:
+            boards.observe(user_id, record)
+
+bus.subscribe("counters", count_events, *COUNTED)
+bus.subscribe("missions", track_missions, *mis.EVENT_TYPES)
+bus.subscribe("journal", write_journal, ev.ItemAcquired, ev.ItemUpgraded)
+bus.subscribe("achievements", check_achievements, ev.PlayerSaved)
+bus.subscribe("leaderboards", update_boards, ev.CoinsChanged, ev.PlayerSaved)
+bus.subscribe("guilds", update_guilds, ev.GuildWarWon, ev.GuildDonated, ev.PlayerSaved)
 
 # ==========================
 # 🎲 Utility Functions
 # ==========================
 RARITY_EMOJIS = {"Common":"⚪","Rare":"🔵","Epic":"🟣","Legendary":"🟡"}
 
+QUEST_DROPS = drops.DropTable.from_tiers("Quest", drops.QUEST_TIERS)
+
 def summon_item():
-    roll = random.randint(1,100)
-    if roll <= 60:
-        return {"name": random.choice(["Potion","Scroll"]), "rarity":"Common"}
-    elif roll <= 85:
-        return {"name": random.choice(["Sword","Armor","Gem"]), "rarity":"Rare"}
-    elif roll <= 95:
-        return {"name": random.choice(["Magic Staff","Dragon Scale"]), "rarity":"Epic"}
-    else:
-        return {"name": random.choice(["Excalibur","Phoenix Feather"]), "rarity":"Legendary"}
+    drop = QUEST_DROPS.draw()
+    return {"name": drop.name, "rarity": drop.rarity}
+
+# ==========================
+# 🎴 Character Catalog
+# ==========================
+# All faction rosters, parsed once at startup and indexed by id/faction/rarity
+CATALOG = catalog.load_catalog()
+
+def random_character(rarity=None, faction=None):
+    return CATALOG.random(rarity=rarity, faction=faction)
+
+# Gacha banners: "standard" plus one character banner per faction
+BANNERS = drops.build_banners(CATALOG)
+
+# ==========================
+# 🚦 Anti-Spam Throttle
+# ==========================
+# Runs in group -2, before every other handler: a throttled update is
+# dropped before any handler or the store sees it (limits in ratelimit.py)
+limiter = ratelimit.Throttle()
+
+def throttle_updates(update: Update, context: CallbackContext):
+    if not THROTTLE or update.effective_user is None:
+        return
+    wait, warn = limiter.check(update.effective_user.id, ratelimit.action_of(update))
+    if not wait:
+        return
+    text = f"⏳ Slow down! Try again in {wait:.0f}s." if wait >= 1 else "⏳ Slow down!"
+    if update.callback_query is not None:
+        update.callback_query.answer(text)
+    elif warn and update.effective_message is not None:
+        update.effective_message.reply_text(text)
+    raise DispatcherHandlerStop()
+
+# ==========================
+# 🧾 Player Middleware
+# ==========================
+# Runs in group -1, after the throttle, inside the update's unit of work.
+# Loads the caller's record once and hands it to the handlers as
+# context.player (context.users is the update's UserMap; changes are
+# committed once when the update is done). Players who haven't used /start
+# are turned away here, except for the commands and buttons below.
+OPEN_COMMANDS = {
+    "start", "help", "about", "credits", "news", "events", "patchnotes", "donate",
+    "characters", "card", "leaderboard", "halloffame", "ranking", "rarity", "lore", "codex",
+    "guilds", "guildleaderboard",
+    "shop", "smash", "marry", "propose", "menu", "mainmenu",
+    "admin", "broadcast", "moderation", "audit",
+}
+# callback data prefixes; roster pages and shop_browse belong to the open /characters and /shop
+OPEN_BUTTONS = ("menu_", "story_", "admin_", "mod_", "page_roster_", "shop_browse")
+
+def needs_player(update):
+    if update.callback_query is not None:
+        return not (update.callback_query.data or "").startswith(OPEN_BUTTONS)
+    command = ratelimit.action_of(update)
+    return command is not None and command not in OPEN_COMMANDS
+
+def ask_to_start(update):
+    if update.callback_query is not None:
+        update.callback_query.answer("❌ Please use /start first.", show_alert=True)
+    elif update.effective_message is not None:
+        update.effective_message.reply_text("❌ Please use /start first.")
+
+def load_player(update: Update, context: CallbackContext):
+    if update.effective_user is None:
+        return
+    context.users = load_users()
+    context.player = context.users.get(str(update.effective_user.id))
+    if context.player is None and needs_player(update):
+        ask_to_start(update)
+        raise DispatcherHandlerStop()
 
 # ==========================
 # 🏁 Core Commands
 # ==========================
+@user_locked
 def start(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
     if user_id not in users:
-        users[user_id] = {"coins":1000,"characters":[],"items":[],"guild":None,"rating":1000}
+        users[user_id] = new_player()
+        change_coins(user_id, users[user_id], 1000, "start")
         save_users(users)
         update.message.reply_text("🎉 Welcome to RPG Bot! You received 1000 coins to begin.")
     else:
         update.message.reply_text("👋 You're already registered. Use /quest /battle /shop /inventory /leaderboard etc.")
 
-# ==========================
-# 📜 Quest System
-# ==========================
-def quest(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-    reward = random.choice([150,300,500])
-    item = summon_item()
-    users[user_id]["coins"] += reward
-    users[user_id]["items"].append(item)
-    save_users(users)
-    update.message.reply_text(
-        f"📜 Quest Complete!\nReward: {reward} coins + {RARITY_EMOJIS[item['rarity']]} {item['rarity']} {item['name']}"
-    )
-
 # ==========================
 # ⚔️ Battle System
 # ==========================
+@user_locked
 def battle(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
@@ -75,8 +381,9 @@ def battle(update: Update, context: CallbackContext):
     player_power = len(users[user_id]["characters"]) + users[user_id]["rating"]//100
     if player_power >= enemy_power:
         reward = random.randint(100,500)
-        users[user_id]["coins"] += reward
+        change_coins(user_id, users[user_id], reward, "battle")
         save_users(users)
+        emit(ev.BattleWon(user_id, reward))
         update.message.reply_text(f"⚔️ Victory! You earned {reward} coins.")
     else:
         update.message.reply_text("⚔️ Defeat... Better luck next time!")
@@ -91,6 +398,7 @@ def shop(update: Update, context: CallbackContext):
     ]
     update.message.reply_text("🛒 Shop Menu", reply_markup=InlineKeyboardMarkup(keyboard))
 
+@user_locked
 def shop_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -100,9 +408,10 @@ def shop_buttons(update: Update, context: CallbackContext):
         query.edit_message_text("🛍 Items:\n- Potion (200)\n- Sword (500)\n- Armor (800)")
     elif query.data == "shop_buy_potion":
         if users[user_id]["coins"] >= 200:
-            users[user_id]["coins"] -= 200
-            users[user_id]["items"].append({"name":"Potion","rarity":"Common"})
+            change_coins(user_id, users[user_id], -200, "shop", "Potion")
+            inv.add_item(users[user_id], "Potion", "Common")
             save_users(users)
+            emit(ev.ItemAcquired(user_id, "Potion", "Common", "shop"))
             query.edit_message_text("💸 You bought a Potion!")
         else:
             query.edit_message_text("⚠️ Not enough coins.")
@@ -110,41 +419,44 @@ def shop_buttons(update: Update, context: CallbackContext):
 # ==========================
 # 📦 Inventory System
 # ==========================
+def inventory_lines(data):
+    lines, current = [], None
+    for rarity, name, count in inv.stacks(data):
+        if rarity != current:
+            if current is not None:
+                lines.append("")
+            lines.append(f"{RARITY_EMOJIS.get(rarity, '')} <b>{rarity}</b>")
+            current = rarity
+        lines.append(f"- {name}" + (f" x{count}" if count > 1 else ""))
+    return lines
+
 def inventory(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
-    users = load_users()
-    items = users[user_id].get("items",[])
-    if not items:
+    if not inv.items_of(context.player):
         update.message.reply_text("📦 Inventory empty.")
         return
-    grouped = {"Common":[],"Rare":[],"Epic":[],"Legendary":[]}
-    for i in items:
-        grouped[i["rarity"]].append(i["name"])
-    msg = "📦 <b>Your Inventory</b>\n\n"
-    for rarity, lst in grouped.items():
-        if lst:
-            msg += f"{RARITY_EMOJIS[rarity]} <b>{rarity}</b>\n" + "\n".join([f"- {x}" for x in lst]) + "\n\n"
-    update.message.reply_text(msg.strip(), parse_mode="HTML")
+    msg, reply_markup = render_view(user_id, context.player, "inventory")
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
 
 # ==========================
 # 🏆 Leaderboard
 # ==========================
 def leaderboard(update: Update, context: CallbackContext):
-    users = load_users()
-    sorted_users = sorted(users.items(), key=lambda x: x[1].get("coins",0), reverse=True)
-    top10 = sorted_users[:10]
+    user_id = str(update.effective_user.id)
+    top10 = boards["coins"].top(10)
     msg = "🏆 <b>Global Leaderboard</b>\n" + "\n".join(
-        [f"{i+1}. User {uid} - {data['coins']} coins" for i,(uid,data) in enumerate(top10)]
+        [f"{i+1}. User {uid} - {coins} coins" for i,(uid,coins) in enumerate(top10)]
     )
+    my_rank = boards["coins"].rank(user_id)
+    if my_rank:
+        msg += f"\n\n📍 Your rank: #{my_rank} of {len(boards['coins'])}"
     update.message.reply_text(msg, parse_mode="HTML")
 
 # ==========================
 # ⚔️ Guild Wars
 # ==========================
 def guildwars(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-    guild = users[user_id].get("guild","No Guild")
+    guild = guild_name(context.player)
     keyboard = [
         [InlineKeyboardButton("➕ Join War", callback_data="gw_join")],
         [InlineKeyboardButton("⚔️ Fight", callback_data="gw_fight")],
@@ -152,22 +464,32 @@ def guildwars(update: Update, context: CallbackContext):
     ]
     update.message.reply_text(f"⚔️ Guild Wars\nGuild: {guild}", reply_markup=InlineKeyboardMarkup(keyboard))
 
+@user_locked
 def guildwars_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
     users = load_users()
     if query.data == "gw_join":
+        if not users[user_id]["guild"]:
+            query.edit_message_text("⚠️ Join a guild first: /guild join <name> (see /guilds)")
+            return
         users[user_id]["guild_war"] = True
         save_users(users)
         query.edit_message_text("✅ Joined Guild War!")
     elif query.data == "gw_fight":
-        if users[user_id].get("guild_war"):
+        # A war round lasts until the daily reset; each player fights once
+        war_round = resets.game_day().isoformat()
+        if not (users[user_id].get("guild_war") and users[user_id]["guild"]):
+            query.edit_message_text("⚠️ Join war first.")
+        elif users[user_id].get("guild_war_fought") == war_round:
+            query.edit_message_text("⚠️ You already fought in this war. The next round starts at the daily reset.")
+        else:
             reward = 1200
-            users[user_id]["coins"] += reward
+            change_coins(user_id, users[user_id], reward, "guildwar")
+            users[user_id]["guild_war_fought"] = war_round
             save_users(users)
+            emit(ev.GuildWarWon(user_id, users[user_id]["guild"], reward))
             query.edit_message_text(f"⚔️ Victory! Earned {reward} coins.")
-        else:
-            query.edit_message_text("⚠️ Join war first.")
     elif query.data == "gw_rewards":
         query.edit_message_text("🎁 Rewards claimed!")
 # ==========================
@@ -177,39 +499,40 @@ def guildwars_buttons(update: Update, context: CallbackContext):
 def smash(update: Update, context: CallbackContext):
     char = random_character()
     keyboard = [
-        [InlineKeyboardButton("🔥 Smash", callback_data=f"smash_yes_{char['id']}")],
-        [InlineKeyboardButton("❌ Pass", callback_data=f"smash_no_{char['id']}")]
+        [InlineKeyboardButton("🔥 Smash", callback_data=f"smash_yes_{char.id}")],
+        [InlineKeyboardButton("❌ Pass", callback_data=f"smash_no_{char.id}")]
     ]
     update.message.reply_text(
-        f"Random pick: {char['name']} ({char['rarity']})\nWould you smash?",
+        f"Random pick: {char.name} ({char.rarity})\nWould you smash?",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
 def marry(update: Update, context: CallbackContext):
     char = random_character()
     keyboard = [
-        [InlineKeyboardButton("💍 Marry", callback_data=f"marry_yes_{char['id']}")],
-        [InlineKeyboardButton("❌ Reject", callback_data=f"marry_no_{char['id']}")]
+        [InlineKeyboardButton("💍 Marry", callback_data=f"marry_yes_{char.id}")],
+        [InlineKeyboardButton("❌ Reject", callback_data=f"marry_no_{char.id}")]
     ]
     update.message.reply_text(
-        f"Random pick: {char['name']} ({char['rarity']})\nWould you marry?",
+        f"Random pick: {char.name} ({char.rarity})\nWould you marry?",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
 def propose(update: Update, context: CallbackContext):
     char = random_character()
     keyboard = [
-        [InlineKeyboardButton("💌 Propose", callback_data=f"propose_yes_{char['id']}")],
-        [InlineKeyboardButton("❌ Cancel", callback_data=f"propose_no_{char['id']}")]
+        [InlineKeyboardButton("💌 Propose", callback_data=f"propose_yes_{char.id}")],
+        [InlineKeyboardButton("❌ Cancel", callback_data=f"propose_no_{char.id}")]
     ]
     update.message.reply_text(
-        f"You are proposing to {char['name']} ({char['rarity']}) 💖",
+        f"You are proposing to {char.name} ({char.rarity}) 💖",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
 # ==========================
 # ❤️ Fun Social Callback Handler
 # ==========================
+@user_locked
 def fun_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -218,15 +541,7 @@ def fun_buttons(update: Update, context: CallbackContext):
     action, choice, char_id = query.data.split("_")
     char_id = int(char_id)
 
-    # demo character pool
-    pool = [
-        {"id":1,"name":"Rimuru","rarity":"Legendary"},
-        {"id":2,"name":"Shuna","rarity":"Epic"},
-        {"id":3,"name":"Benimaru","rarity":"Epic"},
-        {"id":4,"name":"Gobta","rarity":"Rare"},
-        {"id":5,"name":"Ranga","rarity":"Rare"}
-    ]
-    char = next((c for c in pool if c["id"] == char_id), None)
+    char = CATALOG.get(char_id)
 
     if not char:
         query.edit_message_text("❌ Character not found.")
@@ -234,23 +549,23 @@ def fun_buttons(update: Update, context: CallbackContext):
 
     if action == "smash":
         if choice == "yes":
-            query.edit_message_text(f"🔥 You smashed {char['name']} ({char['rarity']})!")
+            query.edit_message_text(f"🔥 You smashed {char.name} ({char.rarity})!")
         else:
-            query.edit_message_text(f"❌ You passed on {char['name']}.")
+            query.edit_message_text(f"❌ You passed on {char.name}.")
     elif action == "marry":
         if choice == "yes":
-            users[user_id]["married"].append(char["name"])
+            users[user_id].setdefault("married", []).append(char.name)
             save_users(users)
-            query.edit_message_text(f"💍 You married {char['name']}! Congratulations 🎉")
+            query.edit_message_text(f"💍 You married {char.name}! Congratulations 🎉")
         else:
-            query.edit_message_text(f"❌ You rejected {char['name']}.")
+            query.edit_message_text(f"❌ You rejected {char.name}.")
     elif action == "propose":
         if choice == "yes":
             accepted = random.choice([True, False])
             if accepted:
-                query.edit_message_text(f"💌 {char['name']} accepted your proposal 💖")
+                query.edit_message_text(f"💌 {char.name} accepted your proposal 💖")
             else:
-                query.edit_message_text(f"💔 {char['name']} rejected your proposal...")
+                query.edit_message_text(f"💔 {char.name} rejected your proposal...")
         else:
             query.edit_message_text("❌ Proposal cancelled.")
 
@@ -258,18 +573,11 @@ def fun_buttons(update: Update, context: CallbackContext):
 # 👤 Profile System
 # ==========================
 def profile(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    data = users[user_id]
+    data = context.player
     coins = data.get("coins", 0)
-    items = len(data.get("items", []))
+    items = inv.total(data)
     chars = len(data.get("characters", []))
-    guild = data.get("guild", "No Guild")
+    guild = guild_name(data)
     rating = data.get("rating", 1000)
     married = data.get("married", [])
 
@@ -289,33 +597,25 @@ def profile(update: Update, context: CallbackContext):
 # ==========================
 # 🎯 Missions System
 # ==========================
-def missions(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    # Example missions
-    mission_list = [
-        {"id":1, "task":"Complete 1 Quest", "reward":200},
-        {"id":2, "task":"Win 1 Battle", "reward":300},
-        {"id":3, "task":"Buy an Item from Shop", "reward":150}
-    ]
+# Daily and weekly sets rotate out of missions.POOL; progress is counted by
+# the missions subscriber and claims are checked against it
+PERIOD_TITLES = {"daily": "📅 Daily", "weekly": "🗓 Weekly"}
 
-    # Save missions to user if not already
-    if "missions" not in users[user_id]:
-        users[user_id]["missions"] = {m["id"]:False for m in mission_list}
-        save_users(users)
-
-    msg = "🎯 <b>Daily Missions</b>\n\n"
-    keyboard = []
-    for m in mission_list:
-        status = "✅ Completed" if users[user_id]["missions"].get(m["id"]) else "❌ Not Done"
-        msg += f"{m['id']}. {m['task']} → {status}\nReward: {m['reward']} coins\n\n"
-        if not users[user_id]["missions"].get(m["id"]):
-            keyboard.append([InlineKeyboardButton(f"Claim {m['reward']} coins", callback_data=f"mission_claim_{m['id']}")])
+def missions(update: Update, context: CallbackContext):
+    data = context.player
+    today = resets.game_day()
+
+    msg = "🎯 <b>Missions</b>\n"
+    keyboard, current = [], None
+    for m in mission_board.active(today):
+        if m.period != current:
+            msg += f"\n<b>{PERIOD_TITLES[m.period]}</b>\n"
+            current = m.period
+        done, claimed = mission_board.status(data, m, today)
+        status = "✅ Claimed" if claimed else f"{'🎁' if done >= m.target else '❌'} {done}/{m.target}"
+        msg += f"{m.task} → {status}\nReward: {m.reward} coins\n"
+        if done >= m.target and not claimed:
+            keyboard.append([InlineKeyboardButton(f"Claim {m.reward} coins", callback_data=f"mission_claim_{m.key}")])
 
     reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
     update.message.reply_text(msg.strip(), parse_mode="HTML", reply_markup=reply_markup)
@@ -323,138 +623,286 @@ def missions(update: Update, context: CallbackContext):
 # ==========================
 # 🎯 Missions Callback Handler
 # ==========================
+@user_locked
 def missions_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
     users = load_users()
 
-    if user_id not in users:
-        query.edit_message_text("❌ Please use /start first.")
-        return
-
     if query.data.startswith("mission_claim_"):
-        mission_id = int(query.data.split("_")[2])
-        # Example mission rewards
-        rewards = {1:200, 2:300, 3:150}
-        if not users[user_id]["missions"].get(mission_id):
-            users[user_id]["coins"] += rewards[mission_id]
-            users[user_id]["missions"][mission_id] = True
-            save_users(users)
-            query.edit_message_text(f"🎁 Mission {mission_id} completed!\nYou received {rewards[mission_id]} coins.")
-        else:
-            query.edit_message_text("⚠️ Mission already completed.")
+        key = query.data[len("mission_claim_"):]
+        mission, error = mission_board.claim(users[user_id], key, resets.game_day())
+        if error:
+            query.answer(error, show_alert=True)
+            return
+        change_coins(user_id, users[user_id], mission.reward, "mission", mission.key)
+        save_users(users)
+        query.edit_message_text(f"🎁 Mission complete: {mission.task}!\nYou received {mission.reward} coins.")
 
 # ==========================
 # 🎰 Gacha System
 # ==========================
-def gacha(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
+GACHA_COST = 500
+GACHA_MAX_PULLS = 10
+
+# Per-player sets of owned character ids, so ownership checks don't scan lists
+owned = inv.OwnedIndex()
 
+def grant_drop(user_id, data, drop):
+    # Returns False for a character the player already owns
+    if drop.kind == "character":
+        return owned.add(user_id, data, {"id":drop.ref,"name":drop.name,"rarity":drop.rarity})
+    else:
+        inv.add_item(data, drop.name, drop.rarity)
+    return True
+
+def summon(user_id, pulls, banner_key):
+    # One load, `pulls` draws, one save. Returns (message, keyboard, card to
+    # show: the rarest newly obtained character or None)
+    users = load_users()
     if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
+        return "❌ Please use /start first.", None, None
+
+    banner = BANNERS[banner_key]
+    cost = GACHA_COST * pulls
+    if users[user_id]["coins"] < cost:
+        return f"⚠️ Not enough coins for {pulls}x gacha summon ({cost} needed).", None, None
+
+    change_coins(user_id, users[user_id], -cost, "gacha", f"{pulls}x {banner_key}")
+    results = [(drop, grant_drop(user_id, users[user_id], drop)) for drop in banner.draw_many(pulls)]
+    save_users(users)
+    emit(ev.GachaPulled(user_id, banner_key, pulls),
+         *[ev.ItemAcquired(user_id, drop.name, drop.rarity, "gacha") for drop, new in results if new])
+
+    lines = []
+    for drop, new in results:
+        lines.append(f"{RARITY_EMOJIS[drop.rarity]} <b>{drop.rarity}</b> {drop.name}" + ("" if new else " (already owned)"))
+    msg = f"🎰 <b>Gacha Summon — {banner.name}</b>\nYou spent {cost} coins...\n\n✨ Result" + ("s:\n" if pulls > 1 else ": ") + "\n".join(lines)
+
+    keyboard = [
+        [InlineKeyboardButton(f"🎰 Summon Again ({GACHA_COST})", callback_data=f"gacha_again_{banner_key}")],
+        [InlineKeyboardButton("📦 View Inventory", callback_data="gacha_inventory")]
+    ]
+    new_chars = [drop for drop, new in results if new and drop.kind == "character"]
+    best = max(new_chars, key=lambda d: catalog.RARITIES.index(d.rarity), default=None)
+    return msg, InlineKeyboardMarkup(keyboard), (CATALOG.get(best.ref) if best else None)
+
+@user_locked
+def gacha(update: Update, context: CallbackContext):
+    # /gacha [pulls] [faction]
+    user_id = str(update.effective_user.id)
+    args = list(context.args or [])
+    pulls = 1
+    if args and args[0].isdigit():
+        pulls = int(args.pop(0))
+    if pulls < 1 or pulls > GACHA_MAX_PULLS:
+        update.message.reply_text(f"⚠️ You can summon 1 to {GACHA_MAX_PULLS} times at once.")
         return
 
-    # Cost per summon
-    summon_cost = 500
-    if users[user_id]["coins"] < summon_cost:
-        update.message.reply_text("⚠️ Not enough coins for gacha summon (500 needed).")
+    banner_key = catalog.faction_key(" ".join(args)) if args else "standard"
+    if banner_key not in BANNERS:
+        update.message.reply_text("❌ Unknown banner. Use /gacha [1-10] [" + "|".join(BANNERS) + "]")
         return
 
-    # Deduct coins
-    users[user_id]["coins"] -= summon_cost
-
-    # Summon random item/character
-    roll = random.randint(1,100)
-    if roll <= 60:
-        rarity = "Common"
-        reward = random.choice(["Potion","Scroll","Gobta"])
-    elif roll <= 85:
-        rarity = "Rare"
-        reward = random.choice(["Sword","Armor","Ranga"])
-    elif roll <= 95:
-        rarity = "Epic"
-        reward = random.choice(["Magic Staff","Dragon Scale","Shuna","Benimaru"])
+    msg, reply_markup, card = summon(user_id, pulls, banner_key)
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+    if card:
+        send_card(context.bot, update.message.chat_id, card, "✨ New character!")
+
+# ==========================
+# 🏪 Faction Roster & Store
+# ==========================
+# /characters <faction> [rarity] [max price] and /store <faction> [rarity] [max price]
+# Rosters come straight from the catalog index; filtered rosters and their
+# rendered pages are cached since the catalog never changes at runtime.
+STORE_PAGE = 8
+
+def parse_catalog_args(args):
+    # -> (faction key, rarity or "any", max price or 0); faction may be multi-word
+    rarity, max_price, words = "any", 0, []
+    for arg in args:
+        if arg.capitalize() in catalog.RARITIES:
+            rarity = arg.capitalize()
+        elif arg.isdigit():
+            max_price = int(arg)
+        else:
+            words.append(arg)
+    return catalog.faction_key(" ".join(words)), rarity, max_price
+
+@functools.lru_cache(maxsize=512)
+def filtered_roster(faction, rarity, max_price):
+    if rarity == "any":
+        chars = CATALOG.by_faction.get(faction, ())
     else:
-        rarity = "Legendary"
-        reward = random.choice(["Excalibur","Phoenix Feather","Rimuru"])
+        chars = CATALOG.by_faction_rarity.get((faction, rarity), ())
+    if max_price:
+        chars = tuple(c for c in chars if c.price <= max_price)
+    return tuple(sorted(chars, key=lambda c: (catalog.RARITIES.index(c.rarity), c.price, c.id)))
+
+def filter_label(faction, rarity, max_price):
+    label = CATALOG.faction_names.get(faction, faction)
+    if rarity != "any":
+        label += f" · {rarity}"
+    if max_price:
+        label += f" · ≤ {max_price} coins"
+    return label
+
+@functools.lru_cache(maxsize=512)
+def roster_pages(faction, rarity, max_price):
+    chars = filtered_roster(faction, rarity, max_price)
+    lines = [f"{RARITY_EMOJIS[c.rarity]} #{c.id} {c.name} — 💰 {c.price}" for c in chars] or ["❌ No characters match."]
+    title = f"🎴 <b>{filter_label(faction, rarity, max_price)}</b> ({len(chars)})"
+    return views.paginate(title, lines)
+
+def factions_help(command):
+    names = ", ".join(CATALOG.faction_names[key] for key in sorted(CATALOG.faction_names))
+    return f"📖 Usage: /{command} <faction> [rarity] [max price]\nFactions: {names}"
+
+def roster_page(faction, rarity, max_price, page):
+    pages = roster_pages(faction, rarity, max_price)
+    page = max(0, min(page, len(pages)-1))
+    return pages[page], views.nav_keyboard(f"roster_{faction}_{rarity}_{max_price}", page, len(pages))
+
+def store_page(user_id, data, faction, rarity, max_price, page):
+    chars = filtered_roster(faction, rarity, max_price)
+    total = max(1, (len(chars) + STORE_PAGE - 1) // STORE_PAGE)
+    page = max(0, min(page, total-1))
+    shown = chars[page*STORE_PAGE:(page+1)*STORE_PAGE]
+
+    msg = f"🏪 <b>{filter_label(faction, rarity, max_price)} Store</b>\n💰 Your coins: {data.get('coins', 0)}\n\n"
+    keyboard = []
+    for c in shown:
+        if owned.owns(user_id, data, c.id):
+            msg += f"✅ {RARITY_EMOJIS[c.rarity]} {c.name} — owned\n"
+        else:
+            msg += f"{RARITY_EMOJIS[c.rarity]} {c.name} — 💰 {c.price}\n"
+            keyboard.append([InlineKeyboardButton(f"Buy {c.name} ({c.price})", callback_data=f"store_buy_{c.id}")])
+    if not chars:
+        msg += "❌ No characters match."
+    if total > 1:
+        msg += f"\n📄 Page {page+1}/{total}"
+        keyboard += views.nav_keyboard(f"store_{faction}_{rarity}_{max_price}", page, total).inline_keyboard
+    return msg.strip(), (InlineKeyboardMarkup(keyboard) if keyboard else None)
+
+def characters(update: Update, context: CallbackContext):
+    faction, rarity, max_price = parse_catalog_args(context.args or [])
+    if faction not in CATALOG.by_faction:
+        update.message.reply_text(factions_help("characters"))
+        return
+    msg, reply_markup = roster_page(faction, rarity, max_price, 0)
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+
+def store_cmd(update: Update, context: CallbackContext):
+    user_id = str(update.effective_user.id)
+
+    faction, rarity, max_price = parse_catalog_args(context.args or [])
+    if faction not in CATALOG.by_faction:
+        update.message.reply_text(factions_help("store"))
+        return
+    msg, reply_markup = store_page(user_id, context.player, faction, rarity, max_price, 0)
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+
+@user_locked
+def store_buttons(update: Update, context: CallbackContext):
+    # store_buy_<character id>: coins and ownership are checked and changed
+    # under the player's lock and saved together, so a purchase is all or nothing
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+    users = load_users()
 
-    # Save reward
-    users[user_id]["items"].append({"name":reward,"rarity":rarity})
+    char = CATALOG.get(int(query.data.split("_")[2]))
+    if char is None:
+        query.answer("❌ Unknown character.")
+        return
+
+    data = users[user_id]
+    if owned.owns(user_id, data, char.id):
+        query.answer(f"✅ You already own {char.name}.")
+        return
+    if data["coins"] < char.price:
+        query.answer(f"⚠️ Not enough coins ({char.price} needed).", show_alert=True)
+        return
+
+    change_coins(user_id, data, -char.price, "store", f"#{char.id} {char.name}")
+    owned.add(user_id, data, {"id":char.id,"name":char.name,"rarity":char.rarity})
     save_users(users)
+    emit(ev.ItemAcquired(user_id, char.name, char.rarity, "store"))
 
-    # UI message
-    msg = f"""
-🎰 <b>Gacha Summon</b>
-You spent 500 coins...
+    query.answer(f"🎉 {char.name} joined your roster!")
+    query.edit_message_text(
+        f"🏪 You bought {RARITY_EMOJIS[char.rarity]} <b>{char.name}</b> ({char.rarity}) for {char.price} coins!\n"
+        f"💰 Coins left: {data['coins']}",
+        parse_mode="HTML"
+    )
+    send_card(context.bot, query.message.chat_id, char)
 
-✨ Result: {RARITY_EMOJIS[rarity]} <b>{rarity}</b> {reward}
-    """
+# ==========================
+# 🖼 Character Cards
+# ==========================
+# Card images are sent by Telegram file_id once known (see media.py)
+cards = media.MediaCache(MEDIA_CACHE_FILE)
 
-    keyboard = [
-        [InlineKeyboardButton("🎰 Summon Again (500)", callback_data="gacha_again")],
-        [InlineKeyboardButton("📦 View Inventory", callback_data="gacha_inventory")]
-    ]
-    update.message.reply_text(msg.strip(), parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+def card_caption(char, headline=None):
+    caption = f"{RARITY_EMOJIS[char.rarity]} <b>{char.name}</b>\n🏳️ {char.faction} · {char.rarity} · 💰 {char.price}"
+    return (f"{headline}\n" + caption) if headline else caption
+
+def send_card(bot, chat_id, char, headline=None):
+    caption = card_caption(char, headline)
+    if char.image_url:
+        try:
+            return cards.send_photo(bot, chat_id, char.image_url, caption=caption, parse_mode="HTML")
+        except TelegramError as e:
+            print(f"⚠️ Card image failed for #{char.id}: {e}")
+    return bot.send_message(chat_id=chat_id, text=caption, parse_mode="HTML")
+
+def card(update: Update, context: CallbackContext):
+    char = CATALOG.find(" ".join(context.args)) if context.args else None
+    if char is None:
+        update.message.reply_text("🖼 Usage: /card <character id or name>")
+        return
+    send_card(context.bot, update.message.chat_id, char)
+
+def prewarm_cards(context: CallbackContext):
+    # Rarest characters first on a cold cache; afterwards the most requested
+    urls = [c.image_url for c in sorted(CATALOG.all, key=lambda c: -catalog.RARITIES.index(c.rarity)) if c.image_url]
+    warmed = cards.prewarm(context.bot, MEDIA_WARM_CHAT, urls)
+    if warmed:
+        print(f"🖼 Prewarmed {warmed} card images ({len(cards)} cached)")
 
 # ==========================
 # 🎰 Gacha Callback Handler
 # ==========================
+@user_locked
 def gacha_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
-    users = load_users()
 
-    if query.data == "gacha_again":
-        # Call gacha again
-        gacha(query, context)
+    if query.data.startswith("gacha_again"):
+        banner_key = query.data[len("gacha_again_"):] or "standard"
+        msg, reply_markup, card = summon(user_id, 1, banner_key if banner_key in BANNERS else "standard")
+        query.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+        if card:
+            send_card(context.bot, query.message.chat_id, card, "✨ New character!")
     elif query.data == "gacha_inventory":
         # Show inventory
-        items = users[user_id].get("items",[])
-        if not items:
+        if not inv.items_of(context.player):
             query.edit_message_text("📦 Inventory empty.")
             return
-        grouped = {"Common":[],"Rare":[],"Epic":[],"Legendary":[]}
-        for i in items:
-            grouped[i["rarity"]].append(i["name"])
-        msg = "📦 <b>Your Inventory</b>\n\n"
-        for rarity, lst in grouped.items():
-            if lst:
-                msg += f"{RARITY_EMOJIS[rarity]} <b>{rarity}</b>\n" + "\n".join([f"- {x}" for x in lst]) + "\n\n"
-        query.edit_message_text(msg.strip(), parse_mode="HTML")
+        msg, reply_markup = render_view(user_id, context.player, "inventory")
+        query.edit_message_text(msg, parse_mode="HTML", reply_markup=reply_markup)
 
 
 # ==========================
 # 🏅 Achievements System
 # ==========================
 def achievements(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    data = users[user_id]
-
-    # Track stats
-    quests = data.get("quests_done", 0)
-    battles = data.get("battles_won", 0)
-    gacha_pulls = len(data.get("items", []))
-    marriages = len(data.get("married", []))
-
-    # Achievement conditions
-    achievement_list = [
-        {"name":"Novice Adventurer","condition":quests>=1,"desc":"Complete your first quest"},
-        {"name":"Battle Rookie","condition":battles>=1,"desc":"Win your first battle"},
-        {"name":"Collector","condition":gacha_pulls>=5,"desc":"Summon 5 items via gacha"},
-        {"name":"Lover","condition":marriages>=1,"desc":"Marry a character"}
-    ]
+    # Unlocks are kept up to date on save; this is just a lookup
+    unlocked = set(context.player.get("achievements", []))
 
     msg = "🏅 <b>Your Achievements</b>\n\n"
-    for ach in achievement_list:
-        status = "✅ Unlocked" if ach["condition"] else "❌ Locked"
-        msg += f"{ach['name']} → {status}\n{ach['desc']}\n\n"
+    for rule in ach.rules_of("achievements"):
+        status = "✅ Unlocked" if rule.key in unlocked else "❌ Locked"
+        msg += f"{rule.name} → {status}\n{rule.desc}\n\n"
 
     update.message.reply_text(msg.strip(), parse_mode="HTML")
 
@@ -463,64 +911,64 @@ def achievements(update: Update, context: CallbackContext):
 # 🔧 Upgrade System
 # ==========================
 def upgrade(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    items = users[user_id].get("items", [])
-    if not items:
+    stacks = list(inv.stacks(context.player))
+    if not stacks:
         update.message.reply_text("📦 No items to upgrade.")
         return
 
-    # Show first item for demo
-    item = random.choice(items)
+    # Show a random item for demo
+    rarity, name, _ = random.choice(stacks)
     keyboard = [
-        [InlineKeyboardButton("🔧 Upgrade", callback_data=f"upgrade_{item['name']}")]
+        [InlineKeyboardButton("🔧 Upgrade", callback_data=f"upgrade_{rarity}_{name}")]
     ]
     update.message.reply_text(
-        f"Choose item to upgrade:\n{RARITY_EMOJIS[item['rarity']]} {item['rarity']} {item['name']}\nCost: 300 coins",
+        f"Choose item to upgrade:\n{RARITY_EMOJIS[rarity]} {rarity} {name}\nCost: 300 coins",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
+@user_locked
 def upgrade_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
     users = load_users()
 
-    if user_id not in users:
-        query.edit_message_text("❌ Please use /start first.")
-        return
-
-    item_name = query.data.split("_")[1]
-    items = users[user_id].get("items", [])
-    item = next((i for i in items if i["name"] == item_name), None)
+    parts = query.data.split("_", 2)
+    if len(parts) == 3:
+        item_rarity, item_name = parts[1], parts[2]
+    else:
+        # buttons sent before rarities were encoded: upgrade_<name>
+        item_name = parts[1]
+        item_rarity = inv.find(users[user_id], item_name)
 
-    if not item:
+    rarity_order = ["Common","Rare","Epic","Legendary"]
+    if item_rarity not in rarity_order or not inv.items_of(users[user_id]).get(item_rarity, {}).get(item_name):
         query.edit_message_text("❌ Item not found.")
         return
 
+    current_index = rarity_order.index(item_rarity)
+    if current_index >= len(rarity_order)-1:
+        query.edit_message_text("⚠️ Item is already Legendary, cannot upgrade further.")
+        return
+
     if users[user_id]["coins"] < 300:
         query.edit_message_text("⚠️ Not enough coins to upgrade.")
         return
 
-    # Deduct coins
-    users[user_id]["coins"] -= 300
+    # Deduct coins (kept even if the upgrade fails)
+    change_coins(user_id, users[user_id], -300, "upgrade", f"{item_rarity} {item_name}")
 
     # Success chance
     success = random.choice([True, False, True])  # 66% success
     if success:
-        # Upgrade rarity
-        rarity_order = ["Common","Rare","Epic","Legendary"]
-        current_index = rarity_order.index(item["rarity"])
-        if current_index < len(rarity_order)-1:
-            item["rarity"] = rarity_order[current_index+1]
-            save_users(users)
-            query.edit_message_text(f"✅ Upgrade successful!\nNew rarity: {RARITY_EMOJIS[item['rarity']]} {item['rarity']} {item['name']}")
-        else:
-            query.edit_message_text("⚠️ Item is already Legendary, cannot upgrade further.")
+        # Upgrade rarity: one copy moves up to the next stack
+        new_rarity = rarity_order[current_index+1]
+        inv.remove_item(users[user_id], item_name, item_rarity)
+        inv.add_item(users[user_id], item_name, new_rarity)
+    save_users(users)
+    emit(ev.ItemUpgraded(user_id, item_name, new_rarity if success else item_rarity, success))
+
+    if success:
+        query.edit_message_text(f"✅ Upgrade successful!\nNew rarity: {RARITY_EMOJIS[new_rarity]} {new_rarity} {item_name}")
     else:
         query.edit_message_text("❌ Upgrade failed... Better luck next time!")
 
@@ -530,34 +978,33 @@ def upgrade_buttons(update: Update, context: CallbackContext):
 # ==========================
 import datetime
 
+# Missions, streak expiry and guild-war rounds roll over in one batched
+# pass at RESET_TIME (see scheduler.py), saved like any handler's changes
+resets = scheduler.DailyReset(store, RESET_STATE_FILE, RESET_TZ, RESET_TIME, save=write_users)
+resets.on_reset.append(history_log.compact)
+resets.record_hooks.append(mission_board.reset_record)
+
+@user_locked
 def daily(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    today = datetime.date.today().isoformat()
+    today = resets.game_day().isoformat()
     last_claim = users[user_id].get("last_daily", None)
-    streak = users[user_id].get("daily_streak", 0)
 
     if last_claim == today:
         update.message.reply_text("⚠️ You already claimed your daily bonus today.")
         return
 
-    # Update streak
-    if last_claim == (datetime.date.today() - datetime.timedelta(days=1)).isoformat():
-        streak += 1
-    else:
-        streak = 1
+    # The daily reset job zeroes the streak of anyone who missed a day
+    streak = users[user_id].get("daily_streak", 0) + 1
 
     users[user_id]["daily_streak"] = streak
     users[user_id]["last_daily"] = today
 
     # Reward scaling with streak
     reward = 100 * streak
-    users[user_id]["coins"] += reward
+    change_coins(user_id, users[user_id], reward, "daily", f"streak {streak}")
     save_users(users)
 
     msg = f"""
@@ -570,33 +1017,27 @@ Reward: 💰 {reward} coins
 # ==========================
 # 📜 Quest Log System
 # ==========================
+@user_locked
 def quest(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     reward = random.choice([150,300,500])
     item = summon_item()
 
-    users[user_id]["coins"] += reward
-    users[user_id]["items"].append(item)
+    change_coins(user_id, users[user_id], reward, "quest")
+    inv.add_item(users[user_id], item["name"], item["rarity"])
 
     # Track quest history
-    if "quest_log" not in users[user_id]:
-        users[user_id]["quest_log"] = []
-    users[user_id]["quest_log"].append({
+    history.record(users[user_id], "quest_log", {
         "date": datetime.date.today().isoformat(),
         "reward_coins": reward,
         "item": item
-    })
-
-    # Count quests done
-    users[user_id]["quests_done"] = users[user_id].get("quests_done", 0) + 1
+    }, history_log, user_id)
 
     save_users(users)
+    emit(ev.QuestCompleted(user_id, reward, item["name"]),
+         ev.ItemAcquired(user_id, item["name"], item["rarity"], "quest"))
 
     update.message.reply_text(
         f"📜 Quest Complete!\nReward: {reward} coins + {RARITY_EMOJIS[item['rarity']]} {item['rarity']} {item['name']}"
@@ -606,7 +1047,7 @@ def questlog(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
 
-    if user_id not in users or "quest_log" not in users[user_id] or not users[user_id]["quest_log"]:
+    if not users[user_id]["quest_log"]:
         update.message.reply_text("📜 No quests completed yet.")
         return
 
@@ -618,61 +1059,156 @@ def questlog(update: Update, context: CallbackContext):
     update.message.reply_text(msg.strip(), parse_mode="HTML")
 
 # ==========================
-# 🏰 Guild Profile System
+# 🏰 Guild System
 # ==========================
+def guild_name(data):
+    doc = guild_index.get(data["guild"])
+    return doc["name"] if doc else "No Guild"
+
 def guildprofile(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
+    data = context.player
+    gid = data["guild"]
+    doc = guild_index.get(gid)
+
+    msg = "🏰 <b>Guild Profile</b>\n\n"
+    if doc:
+        owner = " (👑 leader)" if doc["owner"] == str(update.effective_user.id) else ""
+        msg += f"""Guild: {doc['name']}{owner}
+👥 Members: {len(guild_index.members.get(gid, ()))}/{guilds.MAX_MEMBERS}
+💪 Total Power: {guild_index.power.get(gid, 0)} (#{guild_index.rank("power", gid)} of {len(guild_index)})
+💰 Coins Contributed: {doc.get('coins', 0)}
+🏆 Guild Wars Won: {doc.get('wars_won', 0)}
+
+"""
+    else:
+        msg += "Guild: No Guild\nUse /guilds to find one or /guild create <name>.\n\n"
+    msg += f"""<b>Your record</b>
+⚔️ Wars Joined: {data.get("guild_wars", 0)}
+🏆 Wars Won: {data.get("guild_wins", 0)}
+🎁 Rewards Earned: {data.get("guild_rewards", 0)} coins"""
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
+    update.message.reply_text(msg.strip(), parse_mode="HTML")
+
+GUILD_USAGE = (f"🏰 /guild create <name> → Found a guild ({guilds.CREATE_COST} coins)\n"
+               "/guild join <name> → Join a guild\n"
+               "/guild leave → Leave your guild\n"
+               "/guild donate <coins> → Add coins to your guild's total")
 
+@user_locked
+def guild_cmd(update: Update, context: CallbackContext):
+    # /guild [create|join|leave|donate] ...
+    user_id = str(update.effective_user.id)
+    args = list(context.args or [])
+    if not args:
+        guildprofile(update, context)
+        return
+    action, rest = args[0].lower(), " ".join(args[1:])
+    users = load_users()
     data = users[user_id]
-    guild = data.get("guild", "No Guild")
-    guild_wars = data.get("guild_wars", 0)
-    guild_wins = data.get("guild_wins", 0)
-    guild_rewards = data.get("guild_rewards", 0)
 
-    msg = f"""
-🏰 <b>Guild Profile</b>
+    if action == "create" and rest:
+        if data["coins"] < guilds.CREATE_COST:
+            update.message.reply_text(f"⚠️ Founding a guild costs {guilds.CREATE_COST} coins.")
+            return
+        gid, error = guild_index.create(user_id, data, rest)
+        if error:
+            update.message.reply_text(error)
+            return
+        change_coins(user_id, data, -guilds.CREATE_COST, "guild", f"create {gid}")
+        save_users(users)
+        update.message.reply_text(f"🏰 You founded <b>{guild_name(data)}</b>!", parse_mode="HTML")
+    elif action == "join" and rest:
+        gid, error = guild_index.join(user_id, data, rest)
+        if error:
+            update.message.reply_text(error)
+            return
+        save_users(users)
+        update.message.reply_text(f"✅ You joined <b>{guild_name(data)}</b>!", parse_mode="HTML")
+    elif action == "leave":
+        name = guild_name(data)
+        gid, error = guild_index.leave(user_id, data)
+        if error:
+            update.message.reply_text(error)
+            return
+        data["guild_war"] = False
+        save_users(users)
+        update.message.reply_text(f"👋 You left {name}.")
+    elif action == "donate" and rest.isdigit() and int(rest) > 0:
+        coins = int(rest)
+        if not data["guild"]:
+            update.message.reply_text("⚠️ You're not in a guild.")
+            return
+        if data["coins"] < coins:
+            update.message.reply_text("⚠️ Not enough coins.")
+            return
+        change_coins(user_id, data, -coins, "guild", f"donate {data['guild']}")
+        save_users(users)
+        emit(ev.GuildDonated(user_id, data["guild"], coins))
+        update.message.reply_text(f"💰 Donated {coins} coins to {guild_name(data)}.")
+    else:
+        update.message.reply_text(GUILD_USAGE)
 
-Guild: {guild}
-⚔️ Wars Joined: {guild_wars}
-🏆 Wars Won: {guild_wins}
-🎁 Rewards Earned: {guild_rewards} coins
-    """
+def guild_list(update: Update, context: CallbackContext):
+    top = guild_index.top("members", 20)
+    if not top:
+        update.message.reply_text("🏰 No guilds yet. Found one with /guild create <name>!")
+        return
+    msg = f"🏰 <b>Guilds</b> ({len(guild_index)})\n\n" + "\n".join(
+        f"{i+1}. {doc['name']} — 👥 {members}/{guilds.MAX_MEMBERS}, 💪 {guild_index.power.get(gid, 0)}"
+        for i, (gid, members, doc) in enumerate(top) if doc
+    )
+    update.message.reply_text(msg + "\n\nJoin with /guild join <name>", parse_mode="HTML")
+
+def guildleaderboard(update: Update, context: CallbackContext):
+    # /guildleaderboard [power|coins|wars|members]
+    board = (context.args or ["power"])[0].lower()
+    if board not in guilds.BOARDS:
+        update.message.reply_text("🏆 Usage: /guildleaderboard [" + "|".join(guilds.BOARDS) + "]")
+        return
+    title, unit = guilds.BOARDS[board]
+    top = guild_index.top(board, 10)
+    msg = f"🏆 <b>Guild Leaderboard — {title}</b>\n" + "\n".join(
+        f"{i+1}. {doc['name']} - {score} {unit}" for i, (gid, score, doc) in enumerate(top) if doc
+    )
+    if not top:
+        msg += "\nNo guilds yet."
+    player = context.player
+    if player is not None and player["guild"]:
+        rank = guild_index.rank(board, player["guild"])
+        if rank:
+            msg += f"\n\n📍 {guild_name(player)}: #{rank} of {len(guild_index)}"
+    update.message.reply_text(msg, parse_mode="HTML")
 
-]
-update.message.reply_text("🏠 <b>Main Menu</b>", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
 # ==========================
 # 📊 Player Stats System
 # ==========================
 def stats(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    data = users[user_id]
+    data = context.player
 
     coins = data.get("coins", 0)
-    items = len(data.get("items", []))
+    items = inv.total(data)
     chars = len(data.get("characters", []))
-    guild = data.get("guild", "No Guild")
+    guild = guild_name(data)
     rating = data.get("rating", 1000)
 
     quests = data.get("quests_done", 0)
     battles = data.get("battles_won", 0)
-    gacha_pulls = len(data.get("items", []))
+    gacha_pulls = data.get("gacha_pulls", 0)
     upgrades = data.get("upgrades_done", 0)
     streak = data.get("daily_streak", 0)
     marriages = len(data.get("married", []))
     guild_wars = data.get("guild_wars", 0)
     guild_wins = data.get("guild_wins", 0)
 
+    # Weekly / monthly totals come from the compacted event log
+    today = datetime.date.today()
+    with metrics.registry.phase("storage"):
+        week = history_log.totals(user_id, today - datetime.timedelta(days=6))
+        month = history_log.totals(user_id, today - datetime.timedelta(days=29))
+    week_quests, week_coins = week.get("quest_log", (0, 0))
+    month_quests, month_coins = month.get("quest_log", (0, 0))
+
     msg = f"""
 📊 <b>Player Stats</b>
 
@@ -691,17 +1227,10 @@ def stats(update: Update, context: CallbackContext):
 💍 Marriages: {marriages}
 ⚔️ Guild Wars Joined: {guild_wars}
 🏆 Guild Wars Won: {guild_wins}
-    """
-- Always align emojis + text for clean look.
-- Separate sections with line breaks for readability.
 
-### 4. **Consistent Layout**
-- Every command output should follow a **header → stats → actions** pattern:
-- Header: bold + emoji  
-- Stats: list with emojis  
-- Actions: inline buttons  
-
-Example for `/gacha`:
+📈 Last 7 days: {week_quests} quests, 💰 {week_coins} coins
+📈 Last 30 days: {month_quests} quests, 💰 {month_coins} coins
+    """
     update.message.reply_text(msg.strip(), parse_mode="HTML")
 
 # ==========================
@@ -731,32 +1260,30 @@ def mainmenu(update: Update, context: CallbackContext):
 # ==========================
 # 🏠 Main Menu Callback Handler
 # ==========================
+def button_update(update):
+    # Lets a command handler run from a menu button: it replies in the
+    # button's chat, on behalf of whoever pressed the button
+    query = update.callback_query
+    return SimpleNamespace(effective_user=query.from_user, message=query.message,
+                           effective_message=query.message, callback_query=None)
+
 def mainmenu_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     choice = query.data
 
-    if choice == "menu_battle":
-        battle(query, context)
-    elif choice == "menu_quest":
-        quest(query, context)
-    elif choice == "menu_shop":
-        shop(query, context)
-    elif choice == "menu_gacha":
-        gacha(query, context)
-    elif choice == "menu_profile":
-        profile(query, context)
-    elif choice == "menu_stats":
-        stats(query, context)
-    elif choice == "menu_achievements":
-        achievements(query, context)
-    elif choice == "menu_daily":
-        daily(query, context)
-    elif choice == "menu_questlog":
-        questlog(query, context)
-    elif choice == "menu_guildprofile":
-        guildprofile(query, context)
+    # The same update and context: the handler reuses the player loaded by
+    # load_player and its changes go out with this update's single commit
+    handler = MAIN_MENU.get(choice)
+    if handler is not None:
+        if context.player is None and handler is not shop:
+            ask_to_start(update)
+            return
+        query.answer()
+        handler(button_update(update), context)
     elif choice == "menu_social":
         query.edit_message_text("❤️ Use /smash, /marry, /propose for fun social commands!")
+    else:
+        menu_buttons(update, context)  # /menu's categories share the menu_ prefix
 
 # ==========================
 # ❓ Help System
@@ -773,6 +1300,9 @@ def help_command(update: Update, context: CallbackContext):
 - /inventory → Show your items
 - /leaderboard → Global top 10 players
 - /guildwars → Join/fight/reward in guild wars
+- /guild → Create, join, leave or donate to a guild
+- /guilds → List guilds
+- /guildleaderboard → Top guilds by power, coins, wars or members
 - /characters <faction> → View faction characters
 - /store <faction> → Buy faction characters
 
@@ -783,7 +1313,7 @@ def help_command(update: Update, context: CallbackContext):
 
 👤 <b>Player Systems</b>
 - /profile → Show player profile
-- /missions → Daily missions with rewards
+- /missions → Daily and weekly missions with rewards
 - /gacha → Random summon system
 - /achievements → Unlock milestones
 - /upgrade → Enhance items/characters
@@ -803,23 +1333,7 @@ def help_command(update: Update, context: CallbackContext):
 # ⚙️ Settings System
 # ==========================
 def settings(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    # Default settings if not exist
-    if "settings" not in users[user_id]:
-        users[user_id]["settings"] = {
-            "sound": True,
-            "notifications": True,
-            "theme": "Light"
-        }
-        save_users(users)
-
-    s = users[user_id]["settings"]
+    s = context.player.get("settings", players.DEFAULT_SETTINGS)
     keyboard = [
         [InlineKeyboardButton(f"🔊 Sound: {'On' if s['sound'] else 'Off'}", callback_data="set_sound")],
         [InlineKeyboardButton(f"🔔 Notifications: {'On' if s['notifications'] else 'Off'}", callback_data="set_notifications")],
@@ -832,6 +1346,7 @@ def settings(update: Update, context: CallbackContext):
 # ==========================
 # ⚙️ Settings Callback Handler
 # ==========================
+@user_locked
 def settings_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -907,37 +1422,41 @@ def credits(update: Update, context: CallbackContext):
 # ==========================
 # 📰 News / Announcements System
 # ==========================
-def news(update: Update, context: CallbackContext):
-    # Example static news list (can be dynamic later)
-    news_list = [
-        {"date":"2026-01-25","title":"🎉 New Gacha Characters","desc":"Added 10 new Epic & Legendary characters to summon pool."},
-        {"date":"2026-01-26","title":"⚔️ Guild Wars Update","desc":"Guild wars now reward bonus coins for consecutive wins."},
-        {"date":"2026-01-27","title":"📅 Daily Bonus Buff","desc":"Daily streak rewards increased by 20% for all players."}
-    ]
+# Example static news list (can be dynamic later)
+NEWS_LIST = [
+    {"date":"2026-01-25","title":"🎉 New Gacha Characters","desc":"Added 10 new Epic & Legendary characters to summon pool."},
+    {"date":"2026-01-26","title":"⚔️ Guild Wars Update","desc":"Guild wars now reward bonus coins for consecutive wins."},
+    {"date":"2026-01-27","title":"📅 Daily Bonus Buff","desc":"Daily streak rewards increased by 20% for all players."}
+]
 
+def news_text():
     msg = "📰 <b>Game News & Updates</b>\n\n"
-    for n in news_list:
+    for n in NEWS_LIST:
         msg += f"🗓 {n['date']}\n{n['title']}\n{n['desc']}\n\n"
+    return msg.strip()
 
-    update.message.reply_text(msg.strip(), parse_mode="HTML")
+def news(update: Update, context: CallbackContext):
+    update.message.reply_text(news_text(), parse_mode="HTML")
 
 
 # ==========================
 # 🎉 Events System
 # ==========================
-def events(update: Update, context: CallbackContext):
-    # Example static events list (can be dynamic later)
-    events_list = [
-        {"name":"🔥 Dragon Hunt","date":"2026-02-01 to 2026-02-07","desc":"Defeat dragons in quests to earn rare scales.","reward":"Epic Dragon Scale"},
-        {"name":"💖 Valentine Special","date":"2026-02-14","desc":"Marry/propose characters during Valentine to earn bonus coins.","reward":"500 coins"},
-        {"name":"⚔️ Guild War Season","date":"2026-03-01 to 2026-03-15","desc":"Top guilds win legendary rewards.","reward":"Legendary Weapon"}
-    ]
+# Example static events list (can be dynamic later)
+EVENTS_LIST = [
+    {"name":"🔥 Dragon Hunt","date":"2026-02-01 to 2026-02-07","desc":"Defeat dragons in quests to earn rare scales.","reward":"Epic Dragon Scale"},
+    {"name":"💖 Valentine Special","date":"2026-02-14","desc":"Marry/propose characters during Valentine to earn bonus coins.","reward":"500 coins"},
+    {"name":"⚔️ Guild War Season","date":"2026-03-01 to 2026-03-15","desc":"Top guilds win legendary rewards.","reward":"Legendary Weapon"}
+]
 
+def events_text():
     msg = "🎉 <b>Limited-Time Events</b>\n\n"
-    for e in events_list:
+    for e in EVENTS_LIST:
         msg += f"{e['name']}\n🗓 {e['date']}\n{e['desc']}\n🎁 Reward: {e['reward']}\n\n"
+    return msg.strip()
 
-    update.message.reply_text(msg.strip(), parse_mode="HTML")
+def events(update: Update, context: CallbackContext):
+    update.message.reply_text(events_text(), parse_mode="HTML")
 
 
 # ==========================
@@ -977,6 +1496,58 @@ def patchnotes(update: Update, context: CallbackContext):
 # ==========================
 ADMIN_IDS = ["123456789"]  # Replace with your Telegram ID(s)
 
+# Outbound messages that aren't replies (alerts, broadcasts) are queued and
+# rate limited instead of being sent inside the handler. The bot is
+# attached in main().
+outbox = Outbox(None, workers=OUTBOX_WORKERS)
+
+def broadcast_recipients():
+    # Everyone who hasn't switched notifications off in /settings
+    for uid, data in store.scan():
+        if data.get("settings", players.DEFAULT_SETTINGS).get("notifications", True):
+            yield uid
+
+broadcaster = Broadcaster(outbox, BROADCAST_FILE, broadcast_recipients)
+
+def broadcast_status_text():
+    status = broadcaster.status()
+    if not status:
+        return "📣 No broadcasts yet."
+    msg = "📣 <b>Broadcasts</b>\n\n"
+    for bid, b in list(status.items())[-5:]:
+        state = "✅ Done" if b["done"] else "⏳ Running"
+        msg += f"{bid}: {state} — sent {b['sent']}, failed {b['failed']}\n"
+    return msg.strip()
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return f"{100 * hits / total:.0f}%" if total else "—"
+
+def bot_stats_text(limit=8):
+    snap = metrics.registry.snapshot()
+    gauges, counters = snap["gauges"], snap["counters"]
+    msg = "📈 <b>Bot Stats</b>\n\n⏱ <b>Slowest handlers</b> (avg / p95, storage / telegram)\n"
+    slowest = sorted(snap["latency"].items(), key=lambda kv: -kv[1]["avg_ms"])[:limit]
+    for name, h in slowest:
+        phases = h["phases_ms"]
+        msg += (f"{name}: {h['avg_ms']:.1f} / {h['p95_ms']:.0f} ms "
+                f"({phases.get('storage', 0):.1f} / {phases.get('telegram', 0):.1f}) ×{h['count']}\n")
+    if not slowest:
+        msg += "No handlers timed yet.\n"
+    msg += (f"\n💾 <b>Storage</b>\n"
+            f"Read: {counters.get('storage_bytes_read', 0) // 1024} KB, "
+            f"written: {counters.get('storage_bytes_written', 0) // 1024} KB, "
+            f"ledger: {counters.get('ledger_bytes_written', 0) // 1024} KB\n"
+            f"Dirty players: {gauges.get('dirty_players', 0)}\n"
+            f"\n🗂 <b>Caches</b>\n"
+            f"Pages: {hit_rate(counters.get('page_cache_hits', 0), counters.get('page_cache_misses', 0))}, "
+            f"card images: {hit_rate(counters.get('media_cache_hits', 0), counters.get('media_cache_misses', 0))}\n"
+            f"\n📬 <b>Queues</b>\n"
+            f"Updates: {gauges.get('update_queue_depth', 0)}, workers: {gauges.get('worker_queue_depth', 0)}, "
+            f"outbox: {gauges.get('outbox_depth', 0)}, events: {gauges.get('event_queue', 0)}\n"
+            f"Throttled updates: {counters.get('throttled_updates', 0)}")
+    return msg
+
 def admin(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     if user_id not in ADMIN_IDS:
@@ -986,7 +1557,11 @@ def admin(update: Update, context: CallbackContext):
     keyboard = [
         [InlineKeyboardButton("📰 Manage News", callback_data="admin_news")],
         [InlineKeyboardButton("🎉 Manage Events", callback_data="admin_events")],
-        [InlineKeyboardButton("📝 Manage Patch Notes", callback_data="admin_patchnotes")]
+        [InlineKeyboardButton("📝 Manage Patch Notes", callback_data="admin_patchnotes")],
+        [InlineKeyboardButton("📣 Broadcast News", callback_data="admin_bcast_news"),
+         InlineKeyboardButton("📣 Broadcast Events", callback_data="admin_bcast_events")],
+        [InlineKeyboardButton("📊 Broadcast Status", callback_data="admin_bcast_status")],
+        [InlineKeyboardButton("📈 Bot Stats", callback_data="admin_stats")]
     ]
 
     msg = "🛡 <b>Admin Panel</b>\nChoose what to manage:"
@@ -1009,6 +1584,29 @@ def admin_buttons(update: Update, context: CallbackContext):
         query.edit_message_text("🎉 Admin: Add/Edit/Delete Events here.")
     elif query.data == "admin_patchnotes":
         query.edit_message_text("📝 Admin: Add/Edit/Delete Patch Notes here.")
+    elif query.data == "admin_bcast_news":
+        bid = broadcaster.start_broadcast(news_text(), parse_mode="HTML")
+        query.edit_message_text(f"📣 News broadcast {bid} started.")
+    elif query.data == "admin_bcast_events":
+        bid = broadcaster.start_broadcast(events_text(), parse_mode="HTML")
+        query.edit_message_text(f"📣 Events broadcast {bid} started.")
+    elif query.data == "admin_bcast_status":
+        query.edit_message_text(broadcast_status_text(), parse_mode="HTML")
+    elif query.data == "admin_stats":
+        query.edit_message_text(bot_stats_text(), parse_mode="HTML")
+
+def broadcast(update: Update, context: CallbackContext):
+    user_id = str(update.effective_user.id)
+    if user_id not in ADMIN_IDS:
+        update.message.reply_text("❌ You are not authorized to use admin commands.")
+        return
+
+    if not context.args:
+        update.message.reply_text("📣 Usage: /broadcast <message>\n\n" + broadcast_status_text(), parse_mode="HTML")
+        return
+
+    bid = broadcaster.start_broadcast("📣 " + " ".join(context.args))
+    update.message.reply_text(f"📣 Broadcast {bid} started. Check progress with /broadcast.")
 
 # ==========================
 # 🛡 Moderation System
@@ -1052,19 +1650,39 @@ def moderation_buttons(update: Update, context: CallbackContext):
     elif query.data == "mod_reset_items":
         query.edit_message_text("📦 Moderation: Reset items for a player.")
     elif query.data == "mod_monitor":
-        query.edit_message_text("👀 Moderation: Monitor player activity logs.")
+        query.edit_message_text("👀 Moderation: Monitor player activity logs.\nUse /audit <user_id> to see a player's coin history.")
+
+def audit(update: Update, context: CallbackContext):
+    user_id = str(update.effective_user.id)
+    if user_id not in MODERATOR_IDS:
+        update.message.reply_text("❌ You are not authorized to use moderation commands.")
+        return
+
+    if not context.args:
+        update.message.reply_text("👀 Usage: /audit <user_id>")
+        return
+
+    target = context.args[0]
+    events = coin_ledger.history(target, limit=15)
+    if not events:
+        update.message.reply_text(f"📒 No recent coin history for {target}.")
+        return
+
+    msg = f"📒 <b>Coin Ledger — {target}</b>\n\n"
+    for seq, ts, uid, reason, delta, balance, note in events:
+        when = datetime.datetime.fromtimestamp(int(ts)).strftime("%Y-%m-%d %H:%M")
+        sign = "+" if int(delta) >= 0 else ""
+        msg += f"#{seq} {when} {reason}: {sign}{delta} → 💰 {balance}" + (f" ({note})" if note else "") + "\n"
+    update.message.reply_text(msg.strip(), parse_mode="HTML")
 
 # ==========================
 # 📢 Report System
 # ==========================
+@user_locked
 def report(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     if not context.args:
         update.message.reply_text("📢 Usage: /report <your message>")
         return
@@ -1072,36 +1690,31 @@ def report(update: Update, context: CallbackContext):
     report_text = " ".join(context.args)
 
     # Save report to user data
-    if "reports" not in users[user_id]:
-        users[user_id]["reports"] = []
-    users[user_id]["reports"].append({
+    history.record(users[user_id], "reports", {
         "date": datetime.date.today().isoformat(),
         "text": report_text
-    })
+    }, history_log, user_id)
     save_users(users)
 
     # Notify user
     update.message.reply_text("✅ Your report has been submitted. Thank you!")
 
-    # Notify admins/mods
+    # Notify admins/mods (queued, so the player doesn't wait on delivery)
     for admin_id in MODERATOR_IDS:
-        context.bot.send_message(
-            chat_id=admin_id,
-            text=f"📢 <b>New Report</b>\n👤 User: {update.effective_user.first_name}\n🗓 Date: {datetime.date.today().isoformat()}\n\n{report_text}",
+        outbox.send(
+            admin_id,
+            f"📢 <b>New Report</b>\n👤 User: {update.effective_user.first_name}\n🗓 Date: {datetime.date.today().isoformat()}\n\n{report_text}",
             parse_mode="HTML"
         )
 
 # ==========================
 # ⭐ Feedback System
 # ==========================
+@user_locked
 def feedback(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     users = load_users()
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     if not context.args:
         update.message.reply_text("⭐ Usage: /feedback <your rating 1-5> <your message>")
         return
@@ -1118,23 +1731,21 @@ def feedback(update: Update, context: CallbackContext):
     feedback_text = " ".join(context.args[1:]) if len(context.args) > 1 else "No message"
 
     # Save feedback to user data
-    if "feedback" not in users[user_id]:
-        users[user_id]["feedback"] = []
-    users[user_id]["feedback"].append({
+    history.record(users[user_id], "feedback", {
         "date": datetime.date.today().isoformat(),
         "rating": rating,
         "text": feedback_text
-    })
+    }, history_log, user_id)
     save_users(users)
 
     # Notify user
     update.message.reply_text("✅ Thank you for your feedback!")
 
-    # Notify admins/mods
+    # Notify admins/mods (queued, so the player doesn't wait on delivery)
     for admin_id in MODERATOR_IDS:
-        context.bot.send_message(
-            chat_id=admin_id,
-            text=f"⭐ <b>New Feedback</b>\n👤 User: {update.effective_user.first_name}\n🗓 Date: {datetime.date.today().isoformat()}\nRating: {rating}/5\n\n{feedback_text}",
+        outbox.send(
+            admin_id,
+            f"⭐ <b>New Feedback</b>\n👤 User: {update.effective_user.first_name}\n🗓 Date: {datetime.date.today().isoformat()}\nRating: {rating}/5\n\n{feedback_text}",
             parse_mode="HTML"
         )
 
@@ -1166,13 +1777,6 @@ If you'd like to support development, you can donate and unlock perks!
 # 🎁 Perks System
 # ==========================
 def perks(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     # Example supporter perks
     perks_list = [
         "🏅 Supporter Badge on profile",
@@ -1187,7 +1791,7 @@ def perks(update: Update, context: CallbackContext):
         msg += f"- {p}\n"
 
     # Check if user is donor
-    if users[user_id].get("donor", False):
+    if context.player.get("donor", False):
         msg += "\n✅ You are an active supporter! Your perks are enabled."
     else:
         msg += "\n❌ You are not a supporter yet. Use /donate to join."
@@ -1199,30 +1803,14 @@ def perks(update: Update, context: CallbackContext):
 # ==========================
 def profilebadge(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
-    users = load_users()
 
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    # Example badges
-    badges = {
-        "donor": "💖 Supporter",
-        "moderator": "🛡 Moderator",
-        "admin": "👑 Admin",
-        "veteran": "⚔️ Veteran Player"
-    }
-
-    # Assign badge if donor
+    # Staff badges come from the ID lists, the rest are unlocked on save
     user_badges = []
-    if users[user_id].get("donor", False):
-        user_badges.append(badges["donor"])
     if user_id in MODERATOR_IDS:
-        user_badges.append(badges["moderator"])
+        user_badges.append("🛡 Moderator")
     if user_id in ADMIN_IDS:
-        user_badges.append(badges["admin"])
-    if users[user_id].get("quests_done", 0) >= 100:
-        user_badges.append(badges["veteran"])
+        user_badges.append("👑 Admin")
+    user_badges += [rule.name for rule in ach.unlocked(context.player, "badges")]
 
     if not user_badges:
         msg = "🏅 <b>Profile Badges</b>\n❌ You have no badges yet."
@@ -1235,25 +1823,7 @@ def profilebadge(update: Update, context: CallbackContext):
 # 🎖 Titles System
 # ==========================
 def titles(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    # Example unlock conditions
-    unlocked_titles = []
-    if users[user_id].get("quests_done", 0) >= 50:
-        unlocked_titles.append("📜 Quest Master")
-    if users[user_id].get("battles_won", 0) >= 100:
-        unlocked_titles.append("⚔️ Arena Champion")
-    if users[user_id].get("donor", False):
-        unlocked_titles.append("💖 Patron of Adventure")
-    if users[user_id].get("daily_streak", 0) >= 30:
-        unlocked_titles.append("📅 Streak Legend")
-    if users[user_id].get("achievements", []):
-        unlocked_titles.append("🏅 Achievement Hunter")
+    unlocked_titles = [rule.name for rule in ach.unlocked(context.player, "titles")]
 
     msg = "🎖 <b>Player Titles</b>\n\n"
     if unlocked_titles:
@@ -1266,16 +1836,9 @@ def titles(update: Update, context: CallbackContext):
 # ==========================
 # 📚 Collections System
 # ==========================
-def collections(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    chars = users[user_id].get("characters", [])
-    items = users[user_id].get("items", [])
+def collections_lines(data):
+    chars = data.get("characters", [])
+    stacks = list(inv.stacks(data))
 
     # Group characters by rarity
     rarity_groups = {"Common": [], "Rare": [], "Epic": [], "Legendary": []}
@@ -1283,41 +1846,46 @@ def collections(update: Update, context: CallbackContext):
         rarity = c.get("rarity", "Common")
         rarity_groups.setdefault(rarity, []).append(c["name"])
 
-    msg = "📚 <b>Your Collections</b>\n\n"
-
-    msg += "🎴 <b>Characters</b>\n"
+    lines = ["🎴 <b>Characters</b>"]
     for rarity, names in rarity_groups.items():
-        if names:
-            msg += f"{rarity}: " + ", ".join(names) + "\n"
+        for name in names:
+            lines.append(f"{RARITY_EMOJIS.get(rarity, '')} {rarity}: {name}")
     if not chars:
-        msg += "❌ No characters collected yet.\n"
+        lines.append("❌ No characters collected yet.")
 
-    msg += "\n📦 <b>Items</b>\n"
-    if items:
-        msg += ", ".join([i["name"] for i in items])
+    lines += ["", "📦 <b>Items</b>"]
+    if stacks:
+        lines += [f"- {name}" + (f" x{count}" if count > 1 else "") for _, name, count in stacks]
     else:
-        msg += "❌ No items collected yet."
+        lines.append("❌ No items collected yet.")
+    return lines
 
-    update.message.reply_text(msg.strip(), parse_mode="HTML")
+def collections(update: Update, context: CallbackContext):
+    user_id = str(update.effective_user.id)
+
+    msg, reply_markup = render_view(user_id, context.player, "collections")
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
 
 # ==========================
 # 🎲 Rarity System
 # ==========================
 def rarity(update: Update, context: CallbackContext):
-    msg = """
+    # Rates come straight from the drop tables, so they can't drift
+    def rates(table):
+        return "\n".join(f"- {r}: {p:g}%" for r, p in table.rarity_rates().items())
+    character_rates = "\n".join(f"- {r}: {p}%" for r, p in drops.CHARACTER_RATES.items())
+
+    msg = f"""
 🎲 <b>Rarity Rates</b>
 
-🎴 <b>Characters</b>
-- Common: 60%
-- Rare: 25%
-- Epic: 12%
-- Legendary: 3%
+🎴 <b>Characters</b> (faction banners)
+{character_rates}
 
-📦 <b>Items</b>
-- Common: 70%
-- Rare: 20%
-- Epic: 8%
-- Legendary: 2%
+🎰 <b>Standard Gacha</b>
+{rates(BANNERS["standard"])}
+
+📦 <b>Quest Drops</b>
+{rates(QUEST_DROPS)}
 
 💡 Tip:
 Higher rarity = stronger stats + unique abilities.
@@ -1330,13 +1898,6 @@ Keep summoning to complete your collections!
 # 🏹 Factions System
 # ==========================
 def factions(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     # Example factions
     factions_list = [
         {"name":"⚔️ Knights of Valor","lore":"Brave warriors sworn to protect the realm.","bonus":"+10% defense when grouped"},
@@ -1373,13 +1934,6 @@ def lore(update: Update, context: CallbackContext):
 # 📖 Story System
 # ==========================
 def story(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     # Example story episode
     msg = """
 📖 <b>Episode I: The Awakening</b>
@@ -1416,19 +1970,7 @@ def story_buttons(update: Update, context: CallbackContext):
 # 📚 Chapter System
 # ==========================
 def chapter(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
-    # Default chapter state
-    if "chapter" not in users[user_id]:
-        users[user_id]["chapter"] = 1
-        save_users(users)
-
-    current_chapter = users[user_id]["chapter"]
+    current_chapter = context.player["chapter"]
 
     # Example chapters
     chapters = {
@@ -1448,14 +1990,12 @@ def chapter(update: Update, context: CallbackContext):
 # ==========================
 # 📚 Chapter Callback Handler
 # ==========================
+@user_locked
 def chapter_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = str(query.from_user.id)
     users = load_users()
 
-    if "chapter" not in users[user_id]:
-        users[user_id]["chapter"] = 1
-
     if query.data == "chapter_next":
         users[user_id]["chapter"] += 1
         query.edit_message_text(f"➡️ Progressed to Chapter {users[user_id]['chapter']}")
@@ -1469,15 +2009,8 @@ def chapter_buttons(update: Update, context: CallbackContext):
 # 📓 Journal System
 # ==========================
 def journal(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-
     # Example journal entries
-    journal_entries = users[user_id].get("journal", [])
+    journal_entries = context.player.get("journal", [])
 
     msg = "📓 <b>Your Adventure Journal</b>\n\n"
     if journal_entries:
@@ -1488,19 +2021,6 @@ def journal(update: Update, context: CallbackContext):
 
     update.message.reply_text(msg.strip(), parse_mode="HTML")
 
-# ==========================
-# 📓 Add Journal Entry Helper
-# ==========================
-def add_journal_entry(user_id, event):
-    users = load_users()
-    if "journal" not in users[user_id]:
-        users[user_id]["journal"] = []
-    users[user_id]["journal"].append({
-        "date": datetime.date.today().isoformat(),
-        "event": event
-    })
-    save_users(users)
-
 # ==========================
 # 📚 Codex System
 # ==========================
@@ -1526,28 +2046,21 @@ def codex(update: Update, context: CallbackContext):
 # 📚 Library System
 # ==========================
 def library(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-    
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-    
     msg = "📚 <b>Library Archive</b>\n\n"
     
     # Lore
-    lore_entries = users[user_id].get("lore_unlocked", [])
+    lore_entries = context.player.get("lore_unlocked", [])
     if lore_entries:
         msg += "📖 <b>Lore</b>\n" + "\n".join([f"- {l}" for l in lore_entries]) + "\n\n"
     else:
         msg += "📖 Lore: ❌ None unlocked yet.\n\n"
     
     # Story Chapters
-    chapter_progress = users[user_id].get("chapter", 1)
+    chapter_progress = context.player.get("chapter", 1)
     msg += f"📓 <b>Story Progress</b>\nCurrent Chapter: {chapter_progress}\n\n"
     
     # Journal
-    journal_entries = users[user_id].get("journal", [])
+    journal_entries = context.player.get("journal", [])
     if journal_entries:
         msg += "🗒 <b>Journal Entries</b>\n"
         for entry in journal_entries[-3:]:
@@ -1557,7 +2070,7 @@ def library(update: Update, context: CallbackContext):
         msg += "🗒 Journal: ❌ Empty\n\n"
     
     # Codex
-    codex_entries = users[user_id].get("codex_unlocked", [])
+    codex_entries = context.player.get("codex_unlocked", [])
     if codex_entries:
         msg += "📚 <b>Codex</b>\n" + "\n".join([f"- {c}" for c in codex_entries]) + "\n\n"
     else:
@@ -1569,15 +2082,8 @@ def library(update: Update, context: CallbackContext):
 # 🏛 Museum System
 # ==========================
 def museum(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-    
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-    
     # Example museum entries
-    museum_entries = users[user_id].get("museum", [
+    museum_entries = context.player.get("museum", [
         {"name":"⚔️ Sword of Eternity","desc":"A blade said to cut through time itself.","rarity":"Legendary"},
         {"name":"🐉 Dragon Scale","desc":"A relic from the ancient Dragon Clan.","rarity":"Epic"},
         {"name":"🌍 Crystal of Elements","desc":"Contains fragments of the four elemental gods.","rarity":"Legendary"},
@@ -1593,39 +2099,72 @@ def museum(update: Update, context: CallbackContext):
 # ==========================
 # 🖼 Gallery System
 # ==========================
-def gallery(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    users = load_users()
-    
-    if user_id not in users:
-        update.message.reply_text("❌ Please use /start first.")
-        return
-    
-    chars = users[user_id].get("characters", [])
-    items = users[user_id].get("items", [])
-    
-    msg = "🖼 <b>Your Gallery</b>\n\n"
-    
+def gallery_lines(data):
+    chars = data.get("characters", [])
+    stacks = list(inv.stacks(data))
+    lines = []
+
     # Characters showcase
     if chars:
-        msg += "🎴 <b>Characters</b>\n"
-        for c in chars[:10]:  # Show first 10 for preview
+        lines.append("🎴 <b>Characters</b>")
+        for c in chars:
             emoji = "⭐" if c.get("rarity") == "Legendary" else "✨" if c.get("rarity") == "Epic" else "🔹"
-            msg += f"{emoji} {c['name']} ({c.get('rarity','Common')})\n"
-        msg += "\n"
+            lines.append(f"{emoji} {c['name']} ({c.get('rarity','Common')})")
+        lines.append("")
     else:
-        msg += "🎴 Characters: ❌ None collected yet.\n\n"
-    
+        lines += ["🎴 Characters: ❌ None collected yet.", ""]
+
     # Items showcase
-    if items:
-        msg += "📦 <b>Items</b>\n"
-        for i in items[:10]:
-            emoji = "💎" if i.get("rarity") == "Legendary" else "🔮" if i.get("rarity") == "Epic" else "🔹"
-            msg += f"{emoji} {i['name']} ({i.get('rarity','Common')})\n"
+    if stacks:
+        lines.append("📦 <b>Items</b>")
+        for rarity, name, count in stacks:
+            emoji = "💎" if rarity == "Legendary" else "🔮" if rarity == "Epic" else "🔹"
+            lines.append(f"{emoji} {name} ({rarity})" + (f" x{count}" if count > 1 else ""))
     else:
-        msg += "📦 Items: ❌ None collected yet."
+        lines.append("📦 Items: ❌ None collected yet.")
+    return lines
+
+def gallery(update: Update, context: CallbackContext):
+    user_id = str(update.effective_user.id)
     
-    update.message.reply_text(msg.strip(), parse_mode="HTML")
+    msg, reply_markup = render_view(user_id, context.player, "gallery")
+    update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+
+# ==========================
+# 📄 Paginated Views
+# ==========================
+# view -> (title, line builder); rendered pages are cached per player until
+# their inventory version changes
+VIEWS = {
+    "inventory": ("📦 <b>Your Inventory</b>", inventory_lines),
+    "collections": ("📚 <b>Your Collections</b>", collections_lines),
+    "gallery": ("🖼 <b>Your Gallery</b>", gallery_lines),
+}
+page_cache = views.PageCache()
+
+def render_view(user_id, data, view, page=0):
+    title, build_lines = VIEWS[view]
+    pages = page_cache.pages(user_id, view, inv.version(data), lambda: views.paginate(title, build_lines(data)))
+    page = max(0, min(page, len(pages)-1))
+    return pages[page], views.nav_keyboard(view, page, len(pages))
+
+def page_buttons(update: Update, context: CallbackContext):
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+
+    view, page = query.data[len("page_"):].rsplit("_", 1)
+    if view in VIEWS:
+        msg, reply_markup = render_view(user_id, context.player, view, int(page))
+    elif view.startswith(("roster_", "store_")):
+        # roster_/store_<faction>_<rarity>_<max price>
+        kind, faction, rarity, max_price = view.split("_")
+        if kind == "roster":
+            msg, reply_markup = roster_page(faction, rarity, int(max_price), int(page))
+        else:
+            msg, reply_markup = store_page(user_id, context.player, faction, rarity, int(max_price), int(page))
+    else:
+        return
+    query.edit_message_text(msg, parse_mode="HTML", reply_markup=reply_markup)
 
 # ==========================
 # 🏆 Hall of Fame System
@@ -1633,15 +2172,13 @@ def gallery(update: Update, context: CallbackContext):
 def halloffame(update: Update, context: CallbackContext):
     users = load_users()
 
-    # Example leaderboard logic
-    top_players = sorted(users.items(), key=lambda x: x[1].get("achievements_count", 0), reverse=True)[:5]
+    top_players = [(uid, n) for uid, n in boards["achievements_count"].top(5) if n > 0]
 
     msg = "🏆 <b>Hall of Fame</b>\n\n"
     rank = 1
-    for uid, data in top_players:
-        name = data.get("name", f"Player {uid}")
-        achievements = data.get("achievements_count", 0)
-        rare_items = len([i for i in data.get("items", []) if i.get("rarity") == "Legendary"])
+    for uid, achievements in top_players:
+        name = users[uid].get("name", f"Player {uid}")
+        rare_items = boards["legendary_items"].score(uid)
         msg += f"{rank}. 👤 {name}\n   🏅 Achievements: {achievements}\n   💎 Legendary Items: {rare_items}\n\n"
         rank += 1
 
@@ -1655,29 +2192,34 @@ def ranking(update: Update, context: CallbackContext):
     args = context.args
     category = args[0].lower() if args else "coins"
 
+    # category -> (title, leaderboard index)
     categories = {
-        "coins": "💰 Coins",
-        "quests": "📜 Quests Completed",
-        "battles": "⚔️ Battles Won",
-        "achievements": "🏅 Achievements"
+        "coins": ("💰 Coins", "coins"),
+        "quests": ("📜 Quests Completed", "quests_done"),
+        "battles": ("⚔️ Battles Won", "battles_won"),
+        "achievements": ("🏅 Achievements", "achievements_count")
     }
 
     if category not in categories:
         update.message.reply_text("❌ Invalid category. Use /ranking [coins|quests|battles|achievements]")
         return
 
-    top_players = sorted(users.items(), key=lambda x: x[1].get(category, 0), reverse=True)[:5]
+    title, index = categories[category]
+    top_players = boards[index].top(5)
 
-    msg = f"📊 <b>Ranking — {categories[category]}</b>\n\n"
+    msg = f"📊 <b>Ranking — {title}</b>\n\n"
     rank = 1
-    for uid, data in top_players:
-        name = data.get("name", f"Player {uid}")
-        score = data.get(category, 0)
+    for uid, score in top_players:
+        name = users[uid].get("name", f"Player {uid}")
         msg += f"{rank}. 👤 {name} — {score}\n"
         rank += 1
 
     if not top_players:
         msg += "❌ No players ranked yet."
+    else:
+        my_rank = boards[index].rank(str(update.effective_user.id))
+        if my_rank:
+            msg += f"\n📍 Your rank: #{my_rank}"
 
     update.message.reply_text(msg.strip(), parse_mode="HTML")
 # ==========================
@@ -1697,13 +2239,17 @@ def menu(update: Update, context: CallbackContext):
     msg = "🗂 <b>Main Menu</b>\n\nChoose a category to explore:"
     update.message.reply_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
 
+MAIN_MENU = {
+    "menu_battle": battle, "menu_quest": quest, "menu_shop": shop, "menu_gacha": gacha,
+    "menu_profile": profile, "menu_stats": stats, "menu_achievements": achievements,
+    "menu_daily": daily, "menu_questlog": questlog, "menu_guildprofile": guildprofile,
+}
+
 def menu_buttons(update: Update, context: CallbackContext):
     query = update.callback_query
     choice = query.data
 
-    if choice == "menu_profile":
-        query.edit_message_text("👤 Profile Commands:\n/start, /profile, /journal")
-    elif choice == "menu_progression":
+    if choice == "menu_progression":
         query.edit_message_text("🏅 Progression Commands:\n/story, /chapter")
     elif choice == "menu_lore":
         query.edit_message_text("📚 Lore & Story Commands:\n/lore, /factions")
@@ -1718,17 +2264,91 @@ def menu_buttons(update: Update, context: CallbackContext):
 # ==========================
 # 🚀 Main
 # ==========================
-    
+PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL; unset = long polling
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_RECORD_FILE = os.getenv("WEBHOOK_RECORD_FILE")  # append raw updates here for replay
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # e.g. a local fake Bot API for load tests
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "8"))
+METRICS_PORT = os.getenv("METRICS_PORT")  # polling mode: serve /metrics on this port
+
+def build_updater():
+    # Updates from one user run in order; different users run in parallel
+    pool = workers.OrderedWorkerPool(DISPATCH_WORKERS, name="dispatch")
+    bot = ExtBot(BOT_TOKEN, base_url=TELEGRAM_API_URL, request=workers.TimedRequest(con_pool_size=DISPATCH_WORKERS + 4))
+    job_queue = JobQueue()
+    dp = workers.OrderedDispatcher(bot, queue.Queue(), job_queue=job_queue, pool=pool, unit_of_work=update_unit)
+    job_queue.set_dispatcher(dp)
+
+    metrics.registry.gauge("update_queue_depth", lambda: dp.update_queue.qsize())
+    metrics.registry.gauge("worker_queue_depth", pool.queue_depth)
+    metrics.registry.gauge("dirty_players", store.dirty_count)
+    metrics.registry.gauge("outbox_depth", outbox.depth)
+    metrics.registry.gauge("throttle_buckets", lambda: len(limiter))
+    metrics.registry.counter("throttled_updates", lambda: limiter.rejected)
+    metrics.registry.counter("media_cache_hits", lambda: cards.hits)
+    metrics.registry.counter("media_cache_misses", lambda: cards.misses)
+    metrics.registry.counter("page_cache_hits", lambda: page_cache.hits)
+    metrics.registry.counter("page_cache_misses", lambda: page_cache.misses)
+    metrics.registry.counter("storage_bytes_read", lambda: store.backend.bytes_read)
+    metrics.registry.counter("storage_bytes_written", lambda: store.backend.bytes_written)
+    metrics.registry.counter("ledger_bytes_written", lambda: coin_ledger.bytes_written)
+    metrics.registry.gauge("players", store.count)
+    metrics.registry.gauge("guilds", guild_store.count)
+    metrics.registry.gauge("event_queue", bus.depth)
+    metrics.registry.counter("events_published", lambda: bus.published)
+    metrics.registry.counter("event_subscriber_failures", lambda: bus.failed)
+    return Updater(dispatcher=dp, workers=None)
+
+def run_webhook(updater):
+    dp = updater.dispatcher
+    # Bounded queue between the HTTP server and the dispatcher
+    dp.update_queue = updater.update_queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    threading.Thread(target=dp.start, name="dispatcher", daemon=True).start()
+    updater.job_queue.start()
+
+    server = webserver.WebhookServer(
+        webserver.create_app(updater.bot, dp.update_queue, WEBHOOK_SECRET,
+                             ready=lambda: dp.running, record_file=WEBHOOK_RECORD_FILE,
+                             stats=metrics.registry.snapshot, prometheus=metrics.registry.prometheus),
+        port=PORT
+    )
+    server.start()
+    updater.bot.set_webhook(WEBHOOK_URL.rstrip("/") + webserver.WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    print(f"🌐 Webhook mode: listening on port {PORT}")
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *args: stop.set())
+    while not stop.wait(1):
+        pass
+
+    server.stop()
+    updater.job_queue.stop()
+    dp.stop()
+
 def main():
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN not set in environment variables.")
         return
 
-    updater = Updater(BOT_TOKEN)
+    updater = build_updater()
     dp = updater.dispatcher
 
+    dp.add_handler(TypeHandler(Update, throttle_updates), group=-2)
+    dp.add_handler(TypeHandler(Update, load_player), group=-1)
     dp.add_handler(CommandHandler("start", start))
+    dp.add_handler(CommandHandler("characters", characters))
+    dp.add_handler(CommandHandler("store", store_cmd))
+    dp.add_handler(CallbackQueryHandler(store_buttons, pattern="^store_buy_"))
+    dp.add_handler(CommandHandler("card", card))
+    dp.add_handler(CommandHandler("quest", quest))
+    dp.add_handler(CommandHandler("battle", battle))
+    dp.add_handler(CommandHandler("shop", shop))
+    dp.add_handler(CallbackQueryHandler(shop_buttons, pattern="^shop_"))
     dp.add_handler(CommandHandler("inventory", inventory))
+    dp.add_handler(CallbackQueryHandler(page_buttons, pattern="^page_"))
     dp.add_handler(CommandHandler("leaderboard", leaderboard))
     dp.add_handler(CommandHandler("guildwars", guildwars))
     dp.add_handler(CallbackQueryHandler(guildwars_buttons, pattern="^gw_"))
@@ -1736,10 +2356,21 @@ def main():
     dp.add_handler(CommandHandler("marry", marry))
     dp.add_handler(CommandHandler("propose", propose))
     dp.add_handler(CallbackQueryHandler(fun_buttons, pattern="^(smash|marry|propose)_"))
+    dp.add_handler(CommandHandler("profile", profile))
     dp.add_handler(CommandHandler("missions", missions))
     dp.add_handler(CallbackQueryHandler(missions_buttons, pattern="^mission_"))
+    dp.add_handler(CommandHandler("gacha", gacha))
+    dp.add_handler(CallbackQueryHandler(gacha_buttons, pattern="^gacha_"))
+    dp.add_handler(CommandHandler("achievements", achievements))
     dp.add_handler(CommandHandler("upgrade", upgrade))
     dp.add_handler(CallbackQueryHandler(upgrade_buttons, pattern="^upgrade_"))
+    dp.add_handler(CommandHandler("daily", daily))
+    dp.add_handler(CommandHandler("questlog", questlog))
+    dp.add_handler(CommandHandler("guildprofile", guildprofile))
+    dp.add_handler(CommandHandler("guild", guild_cmd))
+    dp.add_handler(CommandHandler("guilds", guild_list))
+    dp.add_handler(CommandHandler("guildleaderboard", guildleaderboard))
+    dp.add_handler(CommandHandler("stats", stats))
     dp.add_handler(CommandHandler("mainmenu", mainmenu))
     dp.add_handler(CallbackQueryHandler(mainmenu_buttons, pattern="^menu_"))
     dp.add_handler(CommandHandler("help", help_command))
@@ -1751,24 +2382,67 @@ def main():
     dp.add_handler(CommandHandler("events", events))
     dp.add_handler(CommandHandler("patchnotes", patchnotes))
     dp.add_handler(CommandHandler("admin", admin))
+    dp.add_handler(CommandHandler("broadcast", broadcast))
     dp.add_handler(CallbackQueryHandler(admin_buttons, pattern="^admin_"))
     dp.add_handler(CommandHandler("moderation", moderation))
     dp.add_handler(CallbackQueryHandler(moderation_buttons, pattern="^mod_"))
+    dp.add_handler(CommandHandler("audit", audit))
     dp.add_handler(CommandHandler("report", report))
+    dp.add_handler(CommandHandler("feedback", feedback))
     dp.add_handler(CommandHandler("donate", donate))
     dp.add_handler(CommandHandler("perks", perks))
     dp.add_handler(CommandHandler("profilebadge", profilebadge))
     dp.add_handler(CommandHandler("titles", titles))
+    dp.add_handler(CommandHandler("collections", collections))
     dp.add_handler(CommandHandler("rarity", rarity))
+    dp.add_handler(CommandHandler("factions", factions))
+    dp.add_handler(CommandHandler("lore", lore))
+    dp.add_handler(CommandHandler("story", story))
     dp.add_handler(CallbackQueryHandler(story_buttons, pattern="^story_"))
+    dp.add_handler(CommandHandler("chapter", chapter))
     dp.add_handler(CallbackQueryHandler(chapter_buttons, pattern="^chapter_"))
+    dp.add_handler(CommandHandler("journal", journal))
+    dp.add_handler(CommandHandler("codex", codex))
     dp.add_handler(CommandHandler("library", library))
+    dp.add_handler(CommandHandler("museum", museum))
+    dp.add_handler(CommandHandler("gallery", gallery))
+    dp.add_handler(CommandHandler("halloffame", halloffame))
+    dp.add_handler(CommandHandler("ranking", ranking))
     dp.add_handler(CommandHandler("menu", menu))
-    dp.add_handler(CallbackQueryHandler(menu_buttons, pattern="^menu_"))
 
     
-    updater.start_polling()
-    updater.idle()
+    coin_ledger.start()
+    store.start()
+    guild_store.start()
+    history_log.start()
+    bus.start()
+    resets.catch_up()
+    resets.schedule(updater.job_queue)
+    if MEDIA_WARM_CHAT:
+        updater.job_queue.run_repeating(prewarm_cards, MEDIA_PREWARM_INTERVAL, first=30, name="prewarm-cards")
+    outbox.bot = updater.bot
+    outbox.start()
+    broadcaster.resume()
+    if WEBHOOK_URL:
+        run_webhook(updater)
+    else:
+        metrics_server = None
+        if METRICS_PORT:
+            metrics_server = webserver.WebhookServer(
+                webserver.create_metrics_app(metrics.registry.snapshot, metrics.registry.prometheus),
+                port=int(METRICS_PORT))
+            metrics_server.start()
+        updater.start_polling()
+        updater.idle()
+        if metrics_server:
+            metrics_server.stop()
+    broadcaster.stop()  # unfinished broadcasts resume from their checkpoint
+    bus.close()  # subscribers may still queue achievement notices
+    outbox.stop()
+    history_log.close()
+    store.close()  # final flush of dirty players, ledger first
+    guild_store.close()
+    coin_ledger.close()  # stops the ledger writer and closes the segment
 
 if __name__ == "__main__":
     main()
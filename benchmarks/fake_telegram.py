@@ -0,0 +1,212 @@
+import os, sys, json, time, random, signal, logging, tempfile, threading, subprocess, urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+# ==========================
+# 🧪 Fake Telegram
+# ==========================
+# A local stand-in for the Telegram Bot API plus an update replayer, so the
+# webhook mode can be load-tested without a network or a real bot token.
+#
+#   python benchmarks/fake_telegram.py api [port]
+#       serve the fake Bot API (point TELEGRAM_API_URL at http://127.0.0.1:<port>/bot)
+#   python benchmarks/fake_telegram.py replay <updates.jsonl> <webhook url> [workers]
+#       POST recorded updates (see WEBHOOK_RECORD_FILE) to a running bot
+#   python benchmarks/fake_telegram.py loadtest [updates] [players] [workers]
+#       start the fake API and app.py in webhook mode, replay synthetic
+#       updates and report accept latency and end-to-end throughput
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_USER = {"id": 999999, "is_bot": True, "first_name": "FakeBot", "username": "fake_rpg_bot"}
+HOT_COMMANDS = ["/quest", "/battle", "/profile", "/inventory", "/leaderboard", "/gacha", "/stats", "/daily"]
+
+class FakeBotAPI:
+    # Answers every Bot API method with a plausible result and counts calls.
+    # sendPhoto with a URL sleeps url_fetch_delay (Telegram downloading the
+    # image) and issues a file_id; unknown file_ids are rejected like Telegram does.
+    def __init__(self, port=0, url_fetch_delay=0.0):
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.url_fetch_delay = url_fetch_delay
+        self.file_ids = set()
+        self.photo_sources = {"url": 0, "file_id": 0}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.app = Flask(__name__)
+        self.app.add_url_rule("/bot<token>/<method>", "method", self._method, methods=["GET", "POST"])
+        self._server = make_server("127.0.0.1", port, self.app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/bot"
+
+    def sent(self):
+        with self._lock:
+            return sum(n for m, n in self.calls.items() if m not in ("getMe", "setWebhook", "deleteWebhook"))
+
+    def _method(self, token, method):
+        params = request.get_json(force=True, silent=True) or request.form.to_dict() or {}
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._message_id += 1
+            message_id = self._message_id
+        if method == "sendPhoto":
+            photo = str(params.get("photo", ""))
+            if photo.startswith(("http://", "https://")):
+                time.sleep(self.url_fetch_delay)
+                source = "url"
+            elif photo in self.file_ids:
+                source = "file_id"
+            else:
+                return jsonify(ok=False, error_code=400, description="Bad Request: wrong file identifier"), 400
+            with self._lock:
+                self.photo_sources[source] += 1
+                self.file_ids.add(f"fake-file-{message_id}")
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "editMessageText", "sendPhoto"):
+            chat_id = int(params.get("chat_id") or 0)
+            result = {"message_id": message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, "text": params.get("text", "")}
+            if method == "sendPhoto":
+                result["photo"] = [{"file_id": f"fake-file-{message_id}", "file_unique_id": f"u{message_id}",
+                                    "width": 512, "height": 512}]
+        else:
+            result = True
+        return jsonify(ok=True, result=result)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+def command_update(update_id, user_id, text):
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        }
+    }
+
+def synthetic_updates(count, players, seed=1):
+    # Every player registers first, then sends random hot commands
+    rng = random.Random(seed)
+    updates = [command_update(n + 1, 100000 + n, "/start") for n in range(players)]
+    for n in range(players, count):
+        updates.append(command_update(n + 1, 100000 + rng.randrange(players), rng.choice(HOT_COMMANDS)))
+    return updates
+
+def post_json(url, payload, headers=None, timeout=10):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                 headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def replay(updates, webhook_url, workers=16, secret=None):
+    # Returns (accept latencies in seconds, status code counts)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else None
+
+    def send(update):
+        while True:
+            t0 = time.perf_counter()
+            status = post_json(webhook_url, update, headers)
+            if status != 503:  # queue full: back off and redeliver, like Telegram
+                return time.perf_counter() - t0, status
+            time.sleep(0.05)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(send, updates))
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return [lat for lat, _ in results], statuses
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+    return False
+
+def loadtest(count=5000, players=200, workers=16):
+    api = FakeBotAPI().start()
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    port = 18080 + random.randrange(1000)
+    env = dict(os.environ, BOT_TOKEN="123:fake", TELEGRAM_API_URL=api.url, WEBHOOK_URL=f"http://127.0.0.1:{port}",
+               PORT=str(port), DB_FILE=os.path.join(workdir, "users.db"), THROTTLE="0")
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")], cwd=workdir, env=env)
+    try:
+        if not wait_ready(f"http://127.0.0.1:{port}/readyz"):
+            print("❌ Bot never became ready")
+            return 1
+        updates = synthetic_updates(count, players)
+        t0 = time.perf_counter()
+        latencies, statuses = replay(updates, f"http://127.0.0.1:{port}/webhook", workers)
+        accepted = time.perf_counter() - t0
+        while api.sent() < count and time.perf_counter() - t0 < 120:
+            time.sleep(0.05)
+        total = time.perf_counter() - t0
+        print(f"{count} updates from {players} players, {workers} senders")
+        print(f"  accept: {count / accepted:.0f} updates/s, p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} ms, statuses {statuses}")
+        print(f"  end-to-end: {api.sent()} replies in {total:.2f}s ({api.sent() / total:.0f}/s)")
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json", timeout=5) as resp:
+            stats = json.load(resp)
+        for name, lat in sorted(stats.get("latency", {}).items()):
+            phases = lat.get("phases_ms", {})
+            print(f"  {name:<12} {lat['count']:>6} calls, avg {lat['avg_ms']:.1f} ms, p95 {lat['p95_ms']:.0f} ms, "
+                  f"max {lat['max_ms']:.1f} ms (storage {phases.get('storage', 0):.1f} ms, "
+                  f"telegram {phases.get('telegram', 0):.1f} ms)")
+        return 0
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        bot.wait(timeout=30)
+        api.stop()
+
+def main(argv):
+    if not argv or argv[0] not in ("api", "replay", "loadtest"):
+        print("Usage: python benchmarks/fake_telegram.py api [port] | replay <file> <url> [workers] | loadtest [updates] [players] [workers]")
+        return 1
+    if argv[0] == "api":
+        api = FakeBotAPI(int(argv[1]) if len(argv) > 1 else 8081).start()
+        print(f"🧪 Fake Bot API at {api.url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            api.stop()
+        return 0
+    if argv[0] == "replay":
+        with open(argv[1], "r", encoding="utf-8") as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+        latencies, statuses = replay(updates, argv[2], int(argv[3]) if len(argv) > 3 else 16)
+        print(f"{len(updates)} updates replayed, p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} ms, statuses {statuses}")
+        return 0
+    return loadtest(*[int(a) for a in argv[1:4]])
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,81 @@
+import threading
+from types import SimpleNamespace
+
+# ==========================
+# 🧪 Fake Telegram Objects
+# ==========================
+# Just enough of Update / CallbackQuery / CallbackContext for the handlers in
+# app.py to run without Telegram. Everything the bot "sends" is recorded in
+# a shared Outbox instead. dispatch() runs a handler the way the
+# dispatcher would.
+
+class Outbox:
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def record(self, kind, chat_id, text, **kwargs):
+        with self._lock:
+            self.messages.append({"kind": kind, "chat_id": chat_id, "text": text, **kwargs})
+
+    def texts(self):
+        return [m["text"] for m in self.messages]
+
+class FakeMessage:
+    def __init__(self, outbox, chat_id, text=""):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.text = text
+
+    def reply_text(self, text, **kwargs):
+        self.outbox.record("reply", self.chat_id, text, **kwargs)
+
+class FakeBot:
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.outbox.record("send", chat_id, text, **kwargs)
+
+    def send_photo(self, chat_id, photo, caption="", **kwargs):
+        self.outbox.record("photo", chat_id, caption, photo=photo, **kwargs)
+        return SimpleNamespace(message_id=0, photo=[SimpleNamespace(file_id=f"fake-{photo}")])
+
+def fake_user(user_id, first_name="Tester"):
+    return SimpleNamespace(id=user_id, first_name=first_name)
+
+def command_update(outbox, user_id, text="/start"):
+    user, message = fake_user(user_id), FakeMessage(outbox, user_id, text)
+    return SimpleNamespace(effective_user=user, message=message, effective_message=message, callback_query=None)
+
+class FakeCallbackQuery:
+    def __init__(self, outbox, user_id, data):
+        self.outbox = outbox
+        self.from_user = fake_user(user_id)
+        self.data = data
+        self.message = FakeMessage(outbox, user_id)
+
+    def answer(self, *args, **kwargs):
+        pass
+
+    def edit_message_text(self, text, **kwargs):
+        self.outbox.record("edit", self.from_user.id, text, **kwargs)
+
+def callback_update(outbox, user_id, data):
+    query = FakeCallbackQuery(outbox, user_id, data)
+    return SimpleNamespace(effective_user=query.from_user, message=None, effective_message=query.message,
+                           callback_query=query)
+
+def fake_context(outbox, args=None):
+    return SimpleNamespace(bot=FakeBot(outbox), args=list(args or []))
+
+def dispatch(app, handler, update, context):
+    # What the dispatcher does around a handler: open the update's unit of
+    # work, load the player (which may turn the update away), run, commit
+    from telegram.ext import DispatcherHandlerStop
+    with app.update_unit():
+        try:
+            app.load_player(update, context)
+        except DispatcherHandlerStop:
+            return
+        handler(update, context)
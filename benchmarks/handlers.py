@@ -0,0 +1,146 @@
+import os, sys, json, time, random, tempfile, subprocess
+
+# ==========================
+# ⏱ Handler Benchmark
+# ==========================
+# Seeds a synthetic player base straight into a storage backend, starts the
+# bot module on top of it and calls the hot command handlers with fake
+# updates (see fakes.py), one update at a time, each in its own unit of
+# work like the dispatcher does. For each backend it reports startup time,
+# then throughput and p50/p99 latency per command, and the time of the
+# final flush.
+#
+# Each backend runs in its own process, because app.py sets up its store
+# when it is imported.
+#
+#   python benchmarks/handlers.py [--players N] [--calls N] [--backend sqlite|json|all] [--seed N]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+HOT_COMMANDS = ("quest", "battle", "gacha", "leaderboard", "inventory", "profile")
+
+def parse_args(argv):
+    opts = {"backend": "all", "players": 10_000, "calls": 2000, "seed": 7}
+    for i in range(0, len(argv) - 1, 2):
+        key = argv[i].lstrip("-")
+        opts[key] = argv[i + 1] if key == "backend" else int(argv[i + 1])
+    return opts
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+def synthetic_players(players, seed):
+    # Heavy-tailed like a real player base: most players are small, a few
+    # have played a lot. Yields (user_id, record).
+    import drops, catalog, inventory as inv
+    rng = random.Random(seed)
+    quest_drops = drops.DropTable.from_tiers("Quest", drops.QUEST_TIERS)
+    roster = [{"id": c.id, "name": c.name, "rarity": c.rarity} for c in catalog.load_catalog().all]
+    for n in range(players):
+        activity = min(int(rng.paretovariate(1.2) * 5), 5000)
+        record = {"coins": rng.randint(0, 50 * activity) + 5000,
+                  "characters": rng.sample(roster, min(len(roster), activity // 20)),
+                  "items": {}, "guild": None,
+                  "rating": 1000 + rng.randint(-200, 20 * activity),
+                  "quests_done": activity, "battles_won": activity // 2}
+        for drop in quest_drops.draw_many(min(activity, 200), rng):
+            inv.add_item(record, drop.name, drop.rarity)
+        yield str(100_000 + n), record
+
+def seed_backend(backend, path, players, seed):
+    import storage
+    store = storage.open_store(backend, path)
+    batch = {}
+    for uid, record in synthetic_players(players, seed):
+        batch[uid] = record
+        if len(batch) >= 10_000:
+            store.put_many(batch)
+            batch = {}
+    store.put_many(batch)
+    store.close()
+
+def run_backend(opts):
+    # Child process: everything happens in a scratch directory
+    backend = opts["backend"]
+    workdir = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+    os.chdir(workdir)
+    os.environ["STORAGE_BACKEND"] = backend
+    os.environ["DB_FILE"] = os.path.join(workdir, "users.db")
+    os.environ["LEDGER_DIR"] = os.path.join(workdir, "ledger")
+    os.environ["HISTORY_DB"] = os.path.join(workdir, "history.db")
+
+    t0 = time.perf_counter()
+    seed_backend(backend, os.environ["DB_FILE"] if backend == "sqlite" else "users.json", opts["players"], opts["seed"])
+    seeded = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    import app
+    startup = time.perf_counter() - t0
+    from fakes import Outbox, command_update, fake_context, dispatch
+
+    rng = random.Random(opts["seed"])
+    user_ids = [str(100_000 + n) for n in range(opts["players"])]
+    results = {}
+    for command in HOT_COMMANDS:
+        handler = getattr(app, command)
+        latencies = []
+        outbox = Outbox()
+        for _ in range(opts["calls"]):
+            uid = int(rng.choice(user_ids))
+            update, context = command_update(outbox, uid, "/" + command), fake_context(outbox)
+            t0 = time.perf_counter()
+            dispatch(app, handler, update, context)
+            latencies.append(time.perf_counter() - t0)
+        results[command] = latencies
+
+    t0 = time.perf_counter()
+    app.bus.close()
+    catch_up = time.perf_counter() - t0
+    dirty = app.store.dirty_count()
+    t0 = time.perf_counter()
+    app.store.close()
+    flush = time.perf_counter() - t0
+    app.coin_ledger.close()
+    app.history_log.close()
+
+    return {
+        "backend": backend, "seed_s": seeded, "startup_s": startup, "events_s": catch_up, "flush_s": flush, "dirty": dirty,
+        "commands": {name: {"calls": len(l), "per_s": len(l) / sum(l),
+                            "p50_ms": 1000 * percentile(l, 50), "p99_ms": 1000 * percentile(l, 99)}
+                     for name, l in results.items()},
+    }
+
+def report(result, players):
+    print(f"\n💾 {result['backend']}: {players:,} players, seeded in {result['seed_s']:.1f}s, "
+          f"startup {result['startup_s']:.2f}s")
+    for name, r in result["commands"].items():
+        print(f"  {name:<12} {r['calls']:>6} calls  {r['per_s']:>8.0f}/s  "
+              f"p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms")
+    print(f"  event subscribers caught up in {result['events_s']:.2f}s")
+    print(f"  final flush of {result['dirty']:,} dirty players: {result['flush_s']:.2f}s")
+
+def main(argv):
+    opts = parse_args(argv)
+    if opts["backend"] != "all":
+        if os.environ.get("BENCH_CHILD"):
+            print(json.dumps(run_backend(opts)))
+        else:
+            report(run_backend(opts), opts["players"])
+        return 0
+
+    for backend in ("sqlite", "json"):
+        args = [sys.executable, os.path.abspath(__file__), "--backend", backend,
+                "--players", str(opts["players"]), "--calls", str(opts["calls"]), "--seed", str(opts["seed"])]
+        out = subprocess.run(args, env=dict(os.environ, BENCH_CHILD="1"), capture_output=True, text=True)
+        if out.returncode:
+            print(f"❌ {backend} failed:\n{out.stderr}")
+            return 1
+        report(json.loads(out.stdout.strip().splitlines()[-1]), opts["players"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
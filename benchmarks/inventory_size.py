@@ -0,0 +1,66 @@
+import os, sys, gc, json, time, random, tracemalloc
+
+# ==========================
+# 📦 Inventory Layout Benchmark
+# ==========================
+# Builds a synthetic player base twice, once with the old one-dict-per-drop
+# item lists and once with stacked counts. For each layout it reports the
+# Python heap used, the serialized JSON size, and the time to dump and load.
+#
+#   python benchmarks/inventory_size.py [players] [seed]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import drops, inventory as inv
+
+QUEST_DROPS = drops.DropTable.from_tiers("Quest", drops.QUEST_TIERS)
+
+def drop_counts(players, seed):
+    # Heavy-tailed: most players hold a few dozen drops, a few hold thousands
+    rng = random.Random(seed)
+    return [min(int(rng.paretovariate(1.2) * 5), 50_000) for _ in range(players)]
+
+def build(counts, seed, stacked):
+    rng = random.Random(seed)
+    users = {}
+    for uid, n in enumerate(counts):
+        record = {"coins": 1000, "characters": [], "guild": None, "rating": 1000}
+        if stacked:
+            record["items"] = {}
+            for drop in QUEST_DROPS.draw_many(n, rng):
+                inv.add_item(record, drop.name, drop.rarity)
+        else:
+            record["items"] = [{"name": d.name, "rarity": d.rarity} for d in QUEST_DROPS.draw_many(n, rng)]
+        users[str(uid)] = record
+    return users
+
+def measure(label, counts, seed, stacked):
+    gc.collect()
+    tracemalloc.start()
+    users = build(counts, seed, stacked)
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    text = json.dumps(users, separators=(",", ":"))
+    dump_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    json.loads(text)
+    load_s = time.perf_counter() - t0
+
+    print(f"{label:<8} heap {heap / 2**20:9.1f} MiB   json {len(text) / 2**20:9.1f} MiB   "
+          f"dump {dump_s:6.2f}s   load {load_s:6.2f}s")
+    return heap, len(text)
+
+def main(argv):
+    players = int(argv[0]) if argv else 100_000
+    seed = int(argv[1]) if len(argv) > 1 else 7
+    counts = drop_counts(players, seed)
+    print(f"{players:,} players, {sum(counts):,} item drops (max {max(counts):,} for one player)")
+    old_heap, old_json = measure("lists", counts, seed, stacked=False)
+    new_heap, new_json = measure("stacked", counts, seed, stacked=True)
+    print(f"stacked uses {new_heap / old_heap:.1%} of the heap and {new_json / old_json:.1%} of the JSON size")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+import os, sys, time, random, shutil, tempfile
+
+# ==========================
+# 📒 Ledger Replay Benchmark
+# ==========================
+# Appends a synthetic coin ledger (quests, battles, gacha spends ...) for a
+# player base, then times what startup and recovery have to do:
+#   - appending the events (the per-change cost inside a handler)
+#   - recovering from the newest snapshot (normal startup)
+#   - a full replay of every segment, ignoring snapshots
+#   - a point-in-time replay to the middle of the ledger
+#
+#   python benchmarks/ledger_replay.py [events] [players] [snapshot every]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ledger
+
+REASONS = [("quest", 300), ("battle", 250), ("daily", 100), ("gacha", -500), ("upgrade", -300), ("shop", -200)]
+
+def build(directory, events, players, snapshot_every, seed=1):
+    rng = random.Random(seed)
+    log = ledger.Ledger(directory, snapshot_every=snapshot_every)
+    balances = {}
+    started = time.perf_counter()
+    for n in range(events):
+        uid = str(100000 + rng.randrange(players))
+        reason, delta = REASONS[rng.randrange(len(REASONS))]
+        balance = balances.get(uid, 1000) + delta
+        balances[uid] = balance
+        log.record(uid, reason, delta, balance)
+        if n % 10000 == 9999:
+            log.flush()  # what the writer thread does every flush_interval
+    log.close()
+    return time.perf_counter() - started, balances
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+def main(argv):
+    events = int(argv[0]) if len(argv) > 0 else 1_000_000
+    players = int(argv[1]) if len(argv) > 1 else 100_000
+    snapshot_every = int(argv[2]) if len(argv) > 2 else ledger.SNAPSHOT_EVERY
+    directory = tempfile.mkdtemp(prefix="ledger-")
+    try:
+        append_s, expected = build(directory, events, players, snapshot_every)
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        print(f"{events} events for {players} players, snapshot every {snapshot_every}")
+        print(f"  append:        {append_s:.2f}s ({events / append_s:,.0f} events/s), {size / 1e6:.1f} MB on disk")
+
+        snap_s, (balances, seq, replayed) = timed(ledger.replay, directory)
+        assert balances == expected and seq == events
+        print(f"  startup:       {snap_s:.2f}s (newest snapshot + {replayed} events)")
+
+        # Full replay: hide the snapshots
+        full_dir = tempfile.mkdtemp(prefix="ledger-full-")
+        for name in os.listdir(directory):
+            if name.endswith(".log"):
+                os.link(os.path.join(directory, name), os.path.join(full_dir, name))
+        full_s, (balances, seq, replayed) = timed(ledger.replay, full_dir)
+        shutil.rmtree(full_dir)
+        assert balances == expected and seq == events
+        print(f"  full replay:   {full_s:.2f}s ({replayed / full_s:,.0f} events/s)")
+
+        pitr_s, (balances, seq, replayed) = timed(ledger.replay, directory, until_seq=events // 2 + 1)
+        assert seq == events // 2 + 1
+        print(f"  point in time: {pitr_s:.2f}s (state as of event #{seq}, {replayed} events after its snapshot)")
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
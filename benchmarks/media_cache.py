@@ -0,0 +1,64 @@
+import os, sys, time, random, tempfile
+
+# ==========================
+# 🖼 Media Cache Benchmark
+# ==========================
+# Sends character cards through MediaCache against the local fake Bot API,
+# which pretends each URL upload costs a remote download. Reports how many
+# sends went out by URL vs by cached file_id, the average send latency,
+# that the id map survives a restart, and that a stale id falls back to
+# the URL. No network access needed.
+#
+#   python benchmarks/media_cache.py [sends] [fetch delay ms]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram.ext import ExtBot
+import catalog, media
+from fake_telegram import FakeBotAPI
+
+def run(cards, bot, chars, sends, rng):
+    # Zipf-ish popularity: a few characters get most of the views
+    weights = [1 / (rank + 1) for rank in range(len(chars))]
+    started = time.perf_counter()
+    for char in rng.choices(chars, weights, k=sends):
+        cards.send_photo(bot, 1, char.image_url, caption=char.name)
+    return (time.perf_counter() - started) / sends
+
+def main(argv):
+    sends = int(argv[0]) if argv else 300
+    delay = (int(argv[1]) if len(argv) > 1 else 50) / 1000
+    api = FakeBotAPI(url_fetch_delay=delay).start()
+    bot = ExtBot("123:fake", base_url=api.url)
+    chars = [c for c in catalog.load_catalog().all if c.image_url]
+    path = os.path.join(tempfile.mkdtemp(prefix="media-"), "media_cache.json")
+    rng = random.Random(1)
+    try:
+        cards = media.MediaCache(path)
+        avg = run(cards, bot, chars, sends, rng)
+        print(f"{sends} card sends over {len(chars)} characters, {delay * 1000:.0f} ms per URL fetch")
+        print(f"  cold:     {avg * 1000:.1f} ms/send, {api.photo_sources['url']} by URL, "
+              f"{api.photo_sources['file_id']} by file_id ({len(cards)} ids cached)")
+
+        before = dict(api.photo_sources)
+        cards = media.MediaCache(path)  # restart: ids come back from disk
+        for char in chars:
+            if not cards.file_id(char.image_url):
+                cards.send_photo(bot, 1, char.image_url)  # what prewarm() does
+        after_warm = dict(api.photo_sources)
+        avg = run(cards, bot, chars, sends, rng)
+        print(f"  restart + prewarm: {after_warm['url'] - before['url']} uploads, then "
+              f"{avg * 1000:.1f} ms/send, {api.photo_sources['url'] - after_warm['url']} by URL")
+
+        url = chars[0].image_url
+        cards._ids[url] = "stale-id"
+        cards.send_photo(bot, 1, url)
+        assert cards.file_id(url) != "stale-id"
+        print("  stale file_id: fell back to the URL and re-learned the id ✅")
+    finally:
+        api.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,85 @@
+import os, sys, gc, json, time, tracemalloc
+
+# ==========================
+# 👤 Player Record Benchmark
+# ==========================
+# Loads the same synthetic player base twice, once as the old plain dicts
+# and once as players.Player records. For each it reports the Python heap
+# per cached player, measured after the read-only passes app.py runs over
+# every player at startup (history, achievements, leaderboards, broadcast
+# recipients), and the time to load every record from JSON and to
+# serialize every record back.
+#
+#   python benchmarks/player_memory.py [players] [seed]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import players, history, leaderboards, achievements as ach
+from handlers import synthetic_players
+
+def as_dict(raw):
+    # What the store used to hold: the record as parsed, with the fields
+    # start() and the handlers add over time
+    record = {"coins": 0, "characters": [], "items": {}, "guild": None, "rating": 1000,
+              "married": [], "missions": {}, "achievements": [], "achievements_count": 0}
+    record.update(raw)
+    return record
+
+def startup_passes(records):
+    # What app.py does to every cached player before the first update; the
+    # indexes themselves are dropped again, only what the records keep counts
+    pairs = [(str(n), record) for n, record in enumerate(records)]
+    history.migrate_records(pairs, None)  # synthetic players have no history to move
+    ach.AchievementEngine().rebuild(pairs)
+    leaderboards.Leaderboards().rebuild(pairs)
+    sum(1 for _, record in pairs if record.get("settings", players.DEFAULT_SETTINGS).get("notifications", True))
+
+HEAP_SAMPLE = 100_000  # tracemalloc needs several times the traced heap
+ROUNDS = 3              # load and dump times are the best of this many rounds
+
+def measure(label, documents, load, dump):
+    # Load and dump times cover every player; the heap per player is traced
+    # on the first HEAP_SAMPLE players, after the startup passes, and scaled up
+    load_s = dump_s = float("inf")
+    for _ in range(ROUNDS):
+        records = None
+        gc.collect()
+        t0 = time.perf_counter()
+        records = [load(json.loads(doc)) for doc in documents]
+        load_s = min(load_s, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        size = sum(len(json.dumps(dump(r), separators=(",", ":"))) for r in records)
+        dump_s = min(dump_s, time.perf_counter() - t0)
+    del records
+
+    gc.collect()
+    sample = documents[:HEAP_SAMPLE]
+    tracemalloc.start()
+    records = [load(json.loads(doc)) for doc in sample]
+    startup_passes(records)
+    gc.collect()
+    per_player = tracemalloc.get_traced_memory()[0] / len(sample)
+    tracemalloc.stop()
+    del records
+
+    print(f"{label:<8} heap {per_player:7.0f} B/player (~{per_player * len(documents) / 2**20:8.1f} MiB)   "
+          f"json {size / 2**20:7.1f} MiB   load {load_s:6.2f}s   dump {dump_s:6.2f}s")
+    return per_player
+
+def main(argv):
+    count = int(argv[0]) if argv else 1_000_000
+    seed = int(argv[1]) if len(argv) > 1 else 7
+    # Stored JSON is the input for both; the heap counts only what we keep
+    documents = [json.dumps(raw, separators=(",", ":")) for _, raw in synthetic_players(count, seed)]
+    print(f"{count:,} players, {sum(map(len, documents)) / 2**20:.1f} MiB of JSON")
+    old = measure("dict", documents, as_dict, lambda r: r)
+    # Player records load from documents as they are stored after the upgrade
+    for i, doc in enumerate(documents):
+        documents[i] = json.dumps(players.Player.load(json.loads(doc)).to_dict(), separators=(",", ":"))
+    new = measure("Player", documents, players.Player.load, players.Player.to_dict)
+    print(f"Player uses {new / old:.1%} of the dict heap")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+import os, re, sys, time, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================
+# 🔥 Concurrency Stress Test
+# ==========================
+# Fires thousands of concurrent /quest and /battle handler calls at a small
+# set of players and checks that every coin the bot reported as paid out is
+# actually in the player's balance, both in memory and after a final flush,
+# and that the event subscribers counted every quest and won battle.
+#
+#   python benchmarks/stress_concurrency.py [--backend sqlite|json] [--calls N]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args(argv):
+    opts = {"backend": "sqlite", "calls": 5000, "players": 20, "workers": 32}
+    for i in range(0, len(argv) - 1, 2):
+        key = argv[i].lstrip("-")
+        opts[key] = argv[i + 1] if key == "backend" else int(argv[i + 1])
+    return opts
+
+def main(argv):
+    opts = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="stress-")
+    os.chdir(workdir)
+    os.environ["STORAGE_BACKEND"] = opts["backend"]
+    os.environ["DB_FILE"] = os.path.join(workdir, "users.db")
+    os.environ["USERS_FLUSH_INTERVAL"] = "0.05"
+    os.environ["USERS_FLUSH_THRESHOLD"] = "10"
+
+    import app, storage
+    from fakes import Outbox, command_update, fake_context, dispatch
+
+    outbox = Outbox()
+    players = list(range(1, opts["players"] + 1))
+    for uid in players:
+        dispatch(app, app.start, command_update(outbox, uid), fake_context(outbox))
+    start_coins = {str(uid): app.store.get(str(uid))["coins"] for uid in players}
+    app.store.start()
+    app.bus.start()
+
+    def fire(n):
+        uid = players[n % len(players)]
+        handler = app.quest if n % 2 else app.battle
+        box = Outbox()
+        dispatch(app, handler, command_update(box, uid), fake_context(box))
+        text = box.texts()[0]
+        found = re.search(r"(?:Reward: |earned )(\d+) coins", text)
+        return str(uid), int(found.group(1)) if found else 0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+        paid = list(pool.map(fire, range(opts["calls"])))
+    elapsed = time.perf_counter() - t0
+
+    expected = dict(start_coins)
+    for uid, coins in paid:
+        expected[uid] += coins
+
+    # Counters are kept by the event subscribers: every paid quest or battle counts once
+    wins = {}
+    for uid, coins in paid:
+        if coins:
+            wins[uid] = wins.get(uid, 0) + 1
+    app.bus.close()
+    app.store.close()
+    on_disk = dict(storage.open_store(opts["backend"], os.environ["DB_FILE"] if opts["backend"] == "sqlite" else app.DATA_FILE).scan())
+
+    lost = {uid: expected[uid] - on_disk[uid]["coins"] for uid in expected if on_disk[uid]["coins"] != expected[uid]}
+    print(f"{opts['calls']} handler calls on {opts['workers']} threads ({opts['backend']}): "
+          f"{elapsed:.2f}s, {opts['calls'] / elapsed:.0f} calls/s")
+    if lost:
+        print(f"❌ Coins lost for {len(lost)} players: {lost}")
+        return 1
+    miscounted = [uid for uid in expected
+                  if on_disk[uid].get("quests_done", 0) + on_disk[uid].get("battles_won", 0) != wins.get(uid, 0)]
+    if miscounted:
+        print(f"❌ Quest/battle counters off for {len(miscounted)} players")
+        return 1
+    print(f"✅ No coins lost across {len(players)} players, counters match")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,91 @@
+import os, json, random
+from collections import namedtuple
+from types import MappingProxyType
+
+# ==========================
+# 🎴 Faction Character Catalog
+# ==========================
+# The faction files are parsed once at startup into immutable tuples and
+# read-only maps. Lookups by id / faction / rarity are dict hits and random
+# picks are a random.choice over a precomputed tuple, so nothing here ever
+# scans the full roster per request.
+
+CATALOG_DIR = os.path.dirname(os.path.abspath(__file__))
+FACTION_FILES = ["tempest", "demonlords", "humans", "holy_church", "eastern_empire", "dragons"]
+RARITIES = ("Common", "Rare", "Epic", "Legendary")
+
+Character = namedtuple("Character", ["id", "name", "rarity", "price", "faction", "image_url"])
+
+def faction_key(text):
+    # "Demon Lords", "demon_lords" and "demonlords" all map to "demonlords"
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+class Catalog:
+    def __init__(self, characters):
+        by_id, by_name, by_faction, by_rarity, by_faction_rarity = {}, {}, {}, {}, {}
+        names = {}
+        for char in characters:
+            if char.id in by_id:
+                continue  # duplicate entry in a faction file; first one wins
+            by_id[char.id] = char
+            by_name.setdefault(char.name.lower(), char)
+            key = faction_key(char.faction)
+            names.setdefault(key, char.faction)
+            by_faction.setdefault(key, []).append(char)
+            by_rarity.setdefault(char.rarity, []).append(char)
+            by_faction_rarity.setdefault((key, char.rarity), []).append(char)
+
+        self.by_id = MappingProxyType(by_id)
+        self.by_name = MappingProxyType(by_name)  # lowercased name -> first match
+        self.by_faction = MappingProxyType({k: tuple(v) for k, v in by_faction.items()})
+        self.by_rarity = MappingProxyType({k: tuple(v) for k, v in by_rarity.items()})
+        self.by_faction_rarity = MappingProxyType({k: tuple(v) for k, v in by_faction_rarity.items()})
+        self.faction_names = MappingProxyType(names)  # key -> display name
+        self.all = tuple(by_id.values())
+
+    def __len__(self):
+        return len(self.all)
+
+    def get(self, char_id):
+        return self.by_id.get(char_id)
+
+    def find(self, text):
+        # "#12", "12" or a character name
+        text = text.strip().lstrip("#")
+        if text.isdigit():
+            return self.by_id.get(int(text))
+        return self.by_name.get(text.lower())
+
+    def faction(self, text):
+        # Roster for a user-typed faction name, or () if unknown
+        return self.by_faction.get(faction_key(text), ())
+
+    def random(self, rarity=None, faction=None):
+        if faction is not None and rarity is not None:
+            pool = self.by_faction_rarity.get((faction_key(faction), rarity), ())
+        elif faction is not None:
+            pool = self.faction(faction)
+        elif rarity is not None:
+            pool = self.by_rarity.get(rarity, ())
+        else:
+            pool = self.all
+        return random.choice(pool) if pool else None
+
+def load_catalog(directory=CATALOG_DIR, files=FACTION_FILES):
+    characters = []
+    for stem in files:
+        path = os.path.join(directory, f"{stem}.json")
+        if not os.path.exists(path):
+            print(f"⚠️ Faction file missing: {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for entry in json.load(f):
+                characters.append(Character(
+                    id=int(entry["id"]),
+                    name=entry["name"],
+                    rarity=entry.get("rarity", "Common"),
+                    price=int(entry.get("price", 0)),
+                    faction=entry.get("faction", stem),
+                    image_url=entry.get("image_url")
+                ))
+    return Catalog(characters)
@@ -0,0 +1,155 @@
+import sys, random
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # only needed for large simulations
+    np = None
+
+# ==========================
+# 🎲 Alias-method Sampling
+# ==========================
+# Vose's alias method: O(n) setup, then every weighted draw is one uniform
+# column pick plus one biased coin flip, no matter how many entries the
+# table has.
+class AliasTable:
+    def __init__(self, weights):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("AliasTable needs at least one weight")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("AliasTable weights must sum to a positive number")
+        scaled = [w * n / total for w in weights]
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:  # leftovers are 1.0 up to rounding error
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random):
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def sample_many(self, count, seed=None):
+        # Vectorized draws for simulations; falls back to a Python loop
+        if np is None:
+            rng = random.Random(seed)
+            return [self.sample(rng) for _ in range(count)]
+        gen = np.random.default_rng(seed)
+        columns = gen.integers(0, self.n, size=count)
+        keep = gen.random(count) < np.asarray(self.prob)[columns]
+        return np.where(keep, columns, np.asarray(self.alias)[columns])
+
+# ==========================
+# 🎰 Drop Tables
+# ==========================
+# kind is "item" or "character"; ref is the catalog id for characters
+Drop = namedtuple("Drop", ["kind", "name", "rarity", "ref"])
+
+RARITY_ORDER = ["Common", "Rare", "Epic", "Legendary"]
+
+class DropTable:
+    def __init__(self, name, drops, weights):
+        self.name = name
+        self.drops = tuple(drops)
+        self.weights = tuple(weights)
+        self._alias = AliasTable(self.weights)
+
+    @classmethod
+    def from_tiers(cls, name, tiers):
+        # tiers: {rarity: (tier_weight, [Drop, ...])}. Each drop in a tier is
+        # equally likely; empty tiers are dropped and the rest renormalized.
+        drops, weights = [], []
+        for rarity, (tier_weight, tier_drops) in tiers.items():
+            for drop in tier_drops:
+                drops.append(drop)
+                weights.append(tier_weight / len(tier_drops))
+        return cls(name, drops, weights)
+
+    def draw(self, rng=random):
+        return self.drops[self._alias.sample(rng)]
+
+    def draw_many(self, count, rng=random):
+        return [self.drops[self._alias.sample(rng)] for _ in range(count)]
+
+    def rarity_rates(self):
+        # Published per-rarity rates in percent, straight from the weights
+        total = sum(self.weights)
+        rates = {}
+        for drop, weight in zip(self.drops, self.weights):
+            rates[drop.rarity] = rates.get(drop.rarity, 0.0) + 100.0 * weight / total
+        return {r: rates[r] for r in RARITY_ORDER if r in rates}
+
+    def simulate(self, count, seed=None):
+        # Observed per-rarity rates (percent) over `count` simulated pulls
+        picks = self._alias.sample_many(count, seed)
+        if np is not None:
+            hits = np.bincount(picks, minlength=len(self.drops))
+        else:
+            hits = [0] * len(self.drops)
+            for i in picks:
+                hits[i] += 1
+        observed = {}
+        for drop, n in zip(self.drops, hits):
+            observed[drop.rarity] = observed.get(drop.rarity, 0.0) + 100.0 * int(n) / count
+        return {r: observed[r] for r in RARITY_ORDER if r in observed}
+
+def _items(rarity, names):
+    return [Drop("item", name, rarity, None) for name in names]
+
+# Quest reward drops (what summon_item() used to hard-code)
+QUEST_TIERS = {
+    "Common": (60, _items("Common", ["Potion", "Scroll"])),
+    "Rare": (25, _items("Rare", ["Sword", "Armor", "Gem"])),
+    "Epic": (10, _items("Epic", ["Magic Staff", "Dragon Scale"])),
+    "Legendary": (5, _items("Legendary", ["Excalibur", "Phoenix Feather"])),
+}
+
+# Standard /gacha banner: the old item pool plus a few Tempest regulars
+STANDARD_TIERS = {
+    "Common": (60, _items("Common", ["Potion", "Scroll", "Gobta"])),
+    "Rare": (25, _items("Rare", ["Sword", "Armor", "Ranga"])),
+    "Epic": (10, _items("Epic", ["Magic Staff", "Dragon Scale", "Shuna", "Benimaru"])),
+    "Legendary": (5, _items("Legendary", ["Excalibur", "Phoenix Feather", "Rimuru"])),
+}
+
+# Faction banners pull characters at the published character rates
+CHARACTER_RATES = {"Common": 60, "Rare": 25, "Epic": 12, "Legendary": 3}
+
+def faction_banner(catalog, key):
+    tiers = {}
+    for rarity, weight in CHARACTER_RATES.items():
+        chars = catalog.by_faction_rarity.get((key, rarity), ())
+        if chars:
+            tiers[rarity] = (weight, [Drop("character", c.name, c.rarity, c.id) for c in chars])
+    return DropTable.from_tiers(catalog.faction_names[key], tiers)
+
+def build_banners(catalog):
+    banners = {"standard": DropTable.from_tiers("Standard", STANDARD_TIERS)}
+    for key in catalog.by_faction:
+        banners[key] = faction_banner(catalog, key)
+    return banners
+
+if __name__ == "__main__":
+    # python drops.py [pulls] [banner]  -> observed vs published rates
+    import catalog
+    pulls = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    banners = build_banners(catalog.load_catalog())
+    banners["quest"] = DropTable.from_tiers("Quest", QUEST_TIERS)
+    names = [catalog.faction_key(sys.argv[2])] if len(sys.argv) > 2 else list(banners)
+    for key in names:
+        table = banners[key]
+        published, observed = table.rarity_rates(), table.simulate(pulls, seed=42)
+        print(f"🎰 {table.name} ({pulls:,} pulls{'' if np is not None else ', no numpy'})")
+        for rarity, rate in published.items():
+            print(f"  {rarity:<10} published {rate:6.2f}%  observed {observed.get(rarity, 0.0):6.2f}%")
@@ -0,0 +1,125 @@
+import time, queue, threading
+from collections import namedtuple
+
+import metrics
+
+# ==========================
+# 📣 Domain Event Bus
+# ==========================
+# Handlers describe what happened (a quest was completed, coins changed)
+# instead of updating every piece of derived state themselves. Events are
+# queued in memory and a single bus thread hands them to the subscribers in
+# batches: everything published within flush_interval, up to batch_size
+# events. Counters, achievements, mission progress, journal entries and
+# leaderboard indexes are all subscribers, so none of that work happens
+# while the player waits for the reply.
+#
+# A subscriber gets a list of events of the types it asked for, in publish
+# order. Events published while a batch is processed go into a later batch.
+# Inside an update, events are held by the unit of work and published after
+# its commit, so subscribers never see changes that weren't saved.
+#
+# A batch can be processed well after the actions in it happened (across a
+# daily reset, say), so player action events carry `at`, the unix time they
+# happened. stamped() fills it in; the app stamps every event it emits.
+
+def _action(name, fields):
+    return namedtuple(name, fields + " at", defaults=(None,))
+
+QuestCompleted = _action("QuestCompleted", "user_id reward item")
+BattleWon = _action("BattleWon", "user_id reward")
+CoinsChanged = _action("CoinsChanged", "user_id delta balance reason")
+ItemAcquired = _action("ItemAcquired", "user_id name rarity source")
+ItemUpgraded = _action("ItemUpgraded", "user_id name rarity success")
+GachaPulled = _action("GachaPulled", "user_id banner pulls")
+GuildWarWon = _action("GuildWarWon", "user_id guild reward")
+GuildDonated = _action("GuildDonated", "user_id guild coins")
+# A player record was written; for subscribers that derive state from the
+# whole record rather than from one kind of action
+PlayerSaved = namedtuple("PlayerSaved", "user_id")
+
+def stamped(events, now=None):
+    # Action events with `at` set to now (default: the current time)
+    now = time.time() if now is None else now
+    return [e._replace(at=now) if getattr(e, "at", 0) is None else e for e in events]
+
+class EventBus:
+    def __init__(self, flush_interval=0.05, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._subscribers = []  # (name, event types, callback)
+        self._queue = queue.Queue()
+        self._process_lock = threading.Lock()  # one batch at a time, in order
+        self._thread = None
+        self.published = 0
+        self.processed = 0
+        self.failed = 0
+
+    def subscribe(self, name, callback, *types):
+        self._subscribers.append((name, types, callback))
+
+    def publish(self, *events):
+        for event in events:
+            self._queue.put(event)
+        self.published += len(events)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _process(self, batch):
+        with self._process_lock:
+            for name, types, callback in self._subscribers:
+                wanted = [e for e in batch if isinstance(e, types)]
+                if not wanted:
+                    continue
+                try:
+                    with metrics.registry.handler(f"events.{name}"):
+                        callback(wanted)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"⚠️ Event subscriber {name} failed on {len(wanted)} event(s): {e}")
+            self.processed += len(batch)
+
+    def drain(self):
+        # Process everything queued, including what the subscribers publish
+        # meanwhile; used at shutdown and by scripts without the bus thread
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is not None:
+                    batch.append(event)
+            if not batch:
+                return
+            self._process(batch)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            batch = [e for e in batch if e is not None]
+            if batch:
+                self._process(batch)
+            if stop:
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.drain()
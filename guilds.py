@@ -0,0 +1,185 @@
+import re, time, threading
+
+from leaderboards import ScoreIndex
+
+# ==========================
+# 🏰 Guilds
+# ==========================
+# A guild is its own document in the guild store, keyed by guild id (the
+# name folded to lower case):
+#
+#   {"name", "owner", "created", "coins", "wars_won"}
+#
+# Membership lives on the player (record["guild"] = guild id) and is indexed
+# in memory both ways, guild -> member set and member -> guild, so nothing
+# scans players to find a guild's members. The aggregates are kept
+# incrementally: total power moves by one member's delta when that member
+# is saved, joins and leaves, coins and wars won grow with the member events
+# the guild subscriber sees. Every aggregate has its own ScoreIndex, which
+# is what /guilds and /guildleaderboard read.
+
+CREATE_COST = 1000
+MAX_MEMBERS = 30
+NAME_RE = re.compile(r"^[\w][\w '-]{2,23}$")
+
+# board name -> (title, unit)
+BOARDS = {
+    "power": ("💪 Total Power", "power"),
+    "coins": ("💰 Coins Contributed", "coins"),
+    "wars": ("⚔️ Wars Won", "wins"),
+    "members": ("👥 Members", "members"),
+}
+
+def guild_key(name):
+    return " ".join(str(name).split()).casefold()
+
+def power(record):
+    # Same strength a battle uses
+    return len(record.get("characters", [])) + record.get("rating", 1000) // 100
+
+class Guilds:
+    def __init__(self, store):
+        self.store = store          # CachedStore of guild documents
+        self.members = {}           # guild id -> set of user ids
+        self.member_of = {}         # user id -> guild id
+        self._power = {}            # user id -> power counted in their guild
+        self.power = {}             # guild id -> total power
+        self.boards = {name: ScoreIndex() for name in BOARDS}
+        self._lock = threading.RLock()
+
+    def get(self, gid):
+        return self.store.get(gid) if gid else None
+
+    def __len__(self):
+        return self.store.count()
+
+    def _score(self, gid):
+        doc = self.store.get(gid)
+        self.boards["power"].update(gid, self.power.get(gid, 0))
+        self.boards["members"].update(gid, len(self.members.get(gid, ())))
+        self.boards["coins"].update(gid, doc.get("coins", 0))
+        self.boards["wars"].update(gid, doc.get("wars_won", 0))
+
+    def _add_member(self, gid, user_id, record):
+        self.members.setdefault(gid, set()).add(user_id)
+        self.member_of[user_id] = gid
+        self._power[user_id] = p = power(record)
+        self.power[gid] = self.power.get(gid, 0) + p
+
+    def _remove_member(self, gid, user_id):
+        self.members.get(gid, set()).discard(user_id)
+        self.member_of.pop(user_id, None)
+        self.power[gid] = self.power.get(gid, 0) - self._power.pop(user_id, 0)
+
+    def rebuild(self, players):
+        # Index membership from the player records. Free-text guild names
+        # from before guilds existed become guilds of their own, owned by
+        # their first member. Returns the player records that changed.
+        changed, created = {}, {}
+        with self._lock:
+            for user_id, record in players:
+                name = record.get("guild")
+                if not name:
+                    continue
+                gid = name if self.store.exists(name) or name in created else guild_key(name)
+                if not self.store.exists(gid) and gid not in created:
+                    created[gid] = {"name": " ".join(str(name).split()), "owner": user_id,
+                                    "created": int(time.time()), "coins": 0, "wars_won": 0}
+                if gid != name:
+                    record["guild"] = gid
+                    changed[user_id] = record
+                self._add_member(gid, user_id, record)
+            self.store.put_many(created)
+            for gid, _ in self.store.scan():
+                self._score(gid)
+        return changed
+
+    def create(self, user_id, record, name):
+        # Returns (guild id, error)
+        name = " ".join(name.split())
+        if not NAME_RE.match(name):
+            return None, "⚠️ Guild names are 3-24 letters, digits, spaces, ' or -."
+        gid = guild_key(name)
+        with self._lock:
+            if record.get("guild"):
+                return None, "⚠️ Leave your guild first."
+            if self.store.exists(gid):
+                return None, "⚠️ That guild already exists."
+            self.store.put_many({gid: {"name": name, "owner": user_id, "created": int(time.time()),
+                                       "coins": 0, "wars_won": 0}})
+            record["guild"] = gid
+            self._add_member(gid, user_id, record)
+            self._score(gid)
+        return gid, None
+
+    def join(self, user_id, record, name):
+        gid = guild_key(name)
+        with self._lock:
+            if record.get("guild"):
+                return None, "⚠️ Leave your guild first."
+            if not self.store.exists(gid):
+                return None, "❌ No such guild. See /guilds."
+            if len(self.members.get(gid, ())) >= MAX_MEMBERS:
+                return None, f"⚠️ That guild is full ({MAX_MEMBERS} members)."
+            record["guild"] = gid
+            self._add_member(gid, user_id, record)
+            self._score(gid)
+        return gid, None
+
+    def leave(self, user_id, record):
+        # Ownership passes to the remaining member with the lowest user id
+        # (join order isn't recorded); the last one out closes the guild
+        with self._lock:
+            gid = record.get("guild")
+            if not gid:
+                return None, "⚠️ You're not in a guild."
+            record["guild"] = None
+            self._remove_member(gid, user_id)
+            doc = self.store.get(gid)
+            left = self.members.get(gid)
+            if not left:
+                self.members.pop(gid, None)
+                self.power.pop(gid, None)
+                for board in self.boards.values():
+                    board.remove(gid)
+                self.store.delete(gid)
+                return gid, None
+            if doc is not None and doc["owner"] == user_id:
+                doc["owner"] = min(left, key=int)
+                self.store.put_many({gid: doc})
+            self._score(gid)
+        return gid, None
+
+    def observe(self, user_id, record):
+        # A member was saved: move the guild's power by their delta
+        with self._lock:
+            gid = self.member_of.get(user_id)
+            if gid is None:
+                return
+            p = power(record)
+            old = self._power.get(user_id, 0)
+            if p != old:
+                self._power[user_id] = p
+                self.power[gid] = self.power.get(gid, 0) + p - old
+                self.boards["power"].update(gid, self.power[gid])
+
+    def add(self, totals):
+        # {guild id: {"coins": n, "wars_won": n}} from one batch of member events
+        with self._lock:
+            docs = {}
+            for gid, amounts in totals.items():
+                doc = self.store.get(gid)
+                if doc is None:
+                    continue  # closed meanwhile
+                for field, n in amounts.items():
+                    doc[field] = doc.get(field, 0) + n
+                docs[gid] = doc
+            self.store.put_many(docs)
+            for gid in docs:
+                self._score(gid)
+
+    def top(self, board, n=10):
+        return [(gid, score, self.store.get(gid)) for gid, score in self.boards[board].top(n)]
+
+    def rank(self, board, gid):
+        return self.boards[board].rank(gid)
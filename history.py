@@ -0,0 +1,145 @@
+import json, time, queue, sqlite3, datetime, threading
+
+# ==========================
+# 🗂 Player History
+# ==========================
+# Quest logs, journal entries, reports and feedback used to grow inside the
+# player record forever. Now the record only keeps a ring buffer of the
+# most recent RECENT entries per kind (that is all the commands show), and
+# every entry is also appended to an event log in its own SQLite file.
+# A background writer batches the inserts so handlers never wait on disk.
+#
+# Raw events are kept for RAW_DAYS; compact() folds older days into one
+# row per (day, player, kind) with a count and the coins earned, which is
+# what /stats reads for its weekly and monthly totals.
+
+RECENT = 5
+RAW_DAYS = 7
+KINDS = ("quest_log", "journal", "reports", "feedback")
+
+def record(data, kind, entry, log=None, user_id=None, keep=RECENT):
+    # Append to the player's ring buffer and to the event log
+    recent = data.setdefault(kind, [])
+    recent.append(entry)
+    del recent[:-keep]
+    if log is not None:
+        log.append(user_id, kind, entry)
+
+class EventLog:
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._thread = None
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                day TEXT NOT NULL, user_id TEXT NOT NULL, kind TEXT NOT NULL,
+                ts REAL NOT NULL, data TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS events_user ON events (user_id, day);
+            CREATE TABLE IF NOT EXISTS daily (
+                day TEXT NOT NULL, user_id TEXT NOT NULL, kind TEXT NOT NULL,
+                count INTEGER NOT NULL, coins INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day, kind));
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, user_id, kind, entry):
+        day = entry.get("date") or datetime.date.today().isoformat()
+        self._queue.put((day, str(user_id), kind, time.time(), json.dumps(entry, ensure_ascii=False)))
+
+    def _write(self, rows):
+        conn = self._conn()
+        conn.executemany("INSERT INTO events (day, user_id, kind, ts, data) VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(rows) < self.batch_size and rows[-1] is not None:
+                try:
+                    rows.append(self._queue.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            stop = rows[-1] is None
+            rows = [r for r in rows if r is not None]
+            if rows:
+                self._write(rows)
+            if stop:
+                return
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        else:
+            rows = []
+            while not self._queue.empty():
+                rows.append(self._queue.get())
+            if rows:
+                self._write(rows)
+
+    def compact(self, today=None, raw_days=RAW_DAYS):
+        # Fold raw events older than raw_days into daily aggregates
+        today = today or datetime.date.today()
+        cutoff = (today - datetime.timedelta(days=raw_days)).isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                INSERT INTO daily (day, user_id, kind, count, coins)
+                SELECT day, user_id, kind, COUNT(*),
+                       COALESCE(SUM(json_extract(data, '$.reward_coins')), 0)
+                FROM events WHERE day < ? GROUP BY day, user_id, kind
+                ON CONFLICT (user_id, day, kind) DO UPDATE SET
+                    count = count + excluded.count, coins = coins + excluded.coins
+            """, (cutoff,))
+            folded = conn.execute("DELETE FROM events WHERE day < ?", (cutoff,)).rowcount
+        return folded
+
+    def totals(self, user_id, since):
+        # {kind: (count, coins)} for one player from day `since` on,
+        # combining compacted days and raw events
+        conn = self._conn()
+        totals = {}
+        rows = conn.execute("""
+            SELECT kind, SUM(count), SUM(coins) FROM daily
+            WHERE user_id = ? AND day >= ? GROUP BY kind
+        """, (str(user_id), since.isoformat())).fetchall()
+        rows += conn.execute("""
+            SELECT kind, COUNT(*), COALESCE(SUM(json_extract(data, '$.reward_coins')), 0) FROM events
+            WHERE user_id = ? AND day >= ? GROUP BY kind
+        """, (str(user_id), since.isoformat())).fetchall()
+        for kind, count, coins in rows:
+            c, s = totals.get(kind, (0, 0))
+            totals[kind] = (c + count, s + coins)
+        return totals
+
+def migrate_records(records, log, keep=RECENT):
+    # Move everything but the last `keep` entries of each kind to the log
+    changed = {}
+    for uid, data in records:
+        for kind in KINDS:
+            entries = data.get(kind, ())
+            if entries and len(entries) > keep:
+                for entry in entries[:-keep]:
+                    log.append(uid, kind, entry)
+                data[kind] = entries[-keep:]
+                changed[uid] = data
+    return changed
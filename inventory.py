@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+
+# ==========================
+# 📦 Stacked Inventory
+# ==========================
+# A player's items used to be a list with one {"name", "rarity"} dict per
+# drop, growing forever. They are now stored as counted stacks:
+#
+#   "items": {"Common": {"Potion": 12, "Scroll": 3}, "Legendary": {"Excalibur": 1}}
+#
+# so size grows with the number of distinct items, not the number of drops.
+# Handlers go through these helpers instead of touching the structure.
+# Every change bumps record["inv_version"], which cached views key on.
+
+RARITY_ORDER = ["Common", "Rare", "Epic", "Legendary"]
+
+def stack(items):
+    # Old list layout -> stacks (already-stacked input is returned as-is)
+    if isinstance(items, dict):
+        return items
+    stacks = {}
+    for item in items or []:
+        bucket = stacks.setdefault(item.get("rarity", "Common"), {})
+        bucket[item["name"]] = bucket.get(item["name"], 0) + 1
+    return stacks
+
+def items_of(record):
+    # The player's stacks, upgrading a legacy list in place on first touch.
+    # A player without items gets a fresh dict that isn't stored; use
+    # stacks_to_change() before changing it.
+    items = record.get("items", {})
+    if not isinstance(items, dict):
+        items = record["items"] = stack(items)
+    return items
+
+def stacks_to_change(record):
+    items = items_of(record)
+    return record.setdefault("items", items)
+
+def touch(record):
+    # Call after any change to items or characters
+    record["inv_version"] = record.get("inv_version", 0) + 1
+
+def version(record):
+    return record.get("inv_version", 0)
+
+def add_item(record, name, rarity, count=1):
+    bucket = stacks_to_change(record).setdefault(rarity, {})
+    bucket[name] = bucket.get(name, 0) + count
+    touch(record)
+
+def remove_item(record, name, rarity, count=1):
+    items = stacks_to_change(record)
+    bucket = items.get(rarity, {})
+    have = bucket.get(name, 0)
+    if have < count:
+        return False
+    if have == count:
+        del bucket[name]
+        if not bucket:
+            del items[rarity]
+    else:
+        bucket[name] = have - count
+    touch(record)
+    return True
+
+def total(record):
+    return sum(sum(bucket.values()) for bucket in items_of(record).values())
+
+def count_rarity(record, rarity):
+    return sum(items_of(record).get(rarity, {}).values())
+
+def find(record, name):
+    # Rarity of the lowest-rarity stack holding `name`, or None
+    items = items_of(record)
+    for rarity in RARITY_ORDER:
+        if items.get(rarity, {}).get(name):
+            return rarity
+    return None
+
+def stacks(record):
+    # (rarity, name, count) in rarity order, then name order
+    items = items_of(record)
+    for rarity in RARITY_ORDER + sorted(set(items) - set(RARITY_ORDER)):
+        for name, count in sorted(items.get(rarity, {}).items()):
+            yield rarity, name, count
+
+# ==========================
+# 🎴 Character Ownership
+# ==========================
+# "Does this player own character X?" used to scan the characters list.
+# OwnedIndex keeps a set of character ids per player, rebuilt when the
+# player's inventory version or number of characters has moved on since it
+# was built (the count catches a change that forgot touch()). Sets are held
+# in an LRU of max_entries players, like views.PageCache, so players who
+# opened /store once don't stay in memory.
+class OwnedIndex:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._sets = OrderedDict()  # user_id -> ((inventory version, count), set of character ids)
+        self._lock = threading.Lock()
+
+    def ids(self, user_id, record):
+        characters = record.get("characters", [])
+        stamp = (version(record), len(characters))
+        with self._lock:
+            entry = self._sets.get(user_id)
+            if entry is not None and entry[0] == stamp:
+                self._sets.move_to_end(user_id)
+                return entry[1]
+        owned = {c.get("id") for c in characters}
+        self._remember(user_id, stamp, owned)
+        return owned
+
+    def _remember(self, user_id, stamp, owned):
+        with self._lock:
+            self._sets[user_id] = (stamp, owned)
+            self._sets.move_to_end(user_id)
+            while len(self._sets) > self.max_entries:
+                self._sets.popitem(last=False)
+
+    def owns(self, user_id, record, char_id):
+        return char_id in self.ids(user_id, record)
+
+    def add(self, user_id, record, character):
+        # Appends unless already owned; returns False for a duplicate
+        owned = self.ids(user_id, record)
+        if character["id"] in owned:
+            return False
+        characters = record.setdefault("characters", [])
+        characters.append(character)
+        touch(record)
+        owned.add(character["id"])
+        self._remember(user_id, (version(record), len(characters)), owned)
+        return True
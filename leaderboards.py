@@ -0,0 +1,152 @@
+import bisect, threading
+import inventory as inv
+
+# ==========================
+# 🏆 Sorted Score Indexes
+# ==========================
+# Each index keeps (-score, user_id) keys in order plus a user_id -> score
+# map. One flat sorted list would make every update an O(n) memmove, so the
+# keys are split into sorted blocks of at most 2 * BLOCK_SIZE (a blocked
+# sorted list): an update is a bisect over the block maxima and one small
+# insort or del. A Fenwick tree over the block lengths gives rank() the
+# number of keys in earlier blocks in O(log n); top(N) reads the first
+# blocks. Nothing ever re-sorts or shifts the whole player base.
+BLOCK_SIZE = 1000
+
+class ScoreIndex:
+    def __init__(self):
+        self._blocks = []   # sorted lists of keys, in order
+        self._maxes = []    # last key of each block
+        self._tree = []     # Fenwick tree of block lengths
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def _block_of(self, key):
+        return min(bisect.bisect_left(self._maxes, key), len(self._maxes) - 1)
+
+    def _rebuild_tree(self):
+        # After blocks were split or dropped
+        tree = [len(block) for block in self._blocks]
+        for i in range(len(tree)):
+            j = i | (i + 1)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _grow(self, i, delta):
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i |= i + 1
+
+    def _count_before(self, i):
+        # Keys in blocks [0, i)
+        total = 0
+        while i > 0:
+            total += self._tree[i - 1]
+            i &= i - 1
+        return total
+
+    def _insert(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            return
+        i = self._block_of(key)
+        block = self._blocks[i]
+        bisect.insort(block, key)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+            self._rebuild_tree()
+        else:
+            self._grow(i, 1)
+
+    def _delete(self, key):
+        i = self._block_of(key)
+        block = self._blocks[i]
+        del block[bisect.bisect_left(block, key)]
+        if block:
+            self._maxes[i] = block[-1]
+            self._grow(i, -1)
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def update(self, user_id, score):
+        with self._lock:
+            old = self._scores.get(user_id)
+            if old == score:
+                return
+            if old is not None:
+                self._delete((-old, user_id))
+            self._insert((-score, user_id))
+            self._scores[user_id] = score
+
+    def remove(self, user_id):
+        with self._lock:
+            old = self._scores.pop(user_id, None)
+            if old is not None:
+                self._delete((-old, user_id))
+
+    def score(self, user_id, default=0):
+        return self._scores.get(user_id, default)
+
+    def top(self, n):
+        with self._lock:
+            found = []
+            for block in self._blocks:
+                if len(found) >= n:
+                    break
+                found.extend(block[:n - len(found)])
+            return [(uid, -neg) for neg, uid in found]
+
+    def rank(self, user_id):
+        # 1-based position, ties broken by user id; None if not indexed
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            key = (-score, user_id)
+            i = self._block_of(key)
+            return self._count_before(i) + bisect.bisect_left(self._blocks[i], key) + 1
+
+    def __len__(self):
+        return len(self._scores)
+
+# ==========================
+# 📊 Leaderboard Registry
+# ==========================
+def legendary_items(record):
+    return inv.count_rarity(record, "Legendary")
+
+# index name -> how to read the score from a player record
+TRACKED = {
+    "coins": lambda r: r.get("coins", 0),
+    "quests_done": lambda r: r.get("quests_done", 0),
+    "battles_won": lambda r: r.get("battles_won", 0),
+    "achievements_count": lambda r: r.get("achievements_count", 0),
+    "legendary_items": legendary_items,
+}
+
+class Leaderboards:
+    def __init__(self):
+        self.indexes = {name: ScoreIndex() for name in TRACKED}
+
+    def __getitem__(self, name):
+        return self.indexes[name]
+
+    def observe(self, user_id, record):
+        # Called whenever a player record is saved; unchanged scores are a no-op
+        for name, read in TRACKED.items():
+            self.indexes[name].update(user_id, read(record))
+
+    def rebuild(self, records):
+        for user_id, record in records:
+            self.observe(user_id, record)
+
+    def remove(self, user_id):
+        for index in self.indexes.values():
+            index.remove(user_id)
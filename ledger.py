@@ -0,0 +1,239 @@
+import os, sys, time, json, glob, threading
+
+import storage
+
+# ==========================
+# 📒 Coin Ledger
+# ==========================
+# Every coin change is appended to the ledger as one tab-separated line:
+#
+#   seq  unix_time  user_id  reason  delta  balance  note
+#
+# Appends only touch an in-memory buffer; a writer thread group-commits the
+# buffer (write + fsync) every flush_interval seconds, and the user store
+# flushes the ledger first, so the ledger on disk is always at least as new
+# as the player records. Because each line carries the resulting balance,
+# replay is just "last balance wins" per player.
+#
+# Every snapshot_every events the writer saves a snapshot of all balances
+# and starts a new segment, so recovery reads the newest snapshot plus one
+# segment; older snapshots and segments stay for audits and point-in-time
+# recovery.
+#
+#   ledger/snapshot-<seq>.json  balances as of event <seq>
+#   ledger/<first seq>.log      events after the previous snapshot
+#
+#   python ledger.py replay [ledger dir] [until unix time]
+
+SNAPSHOT_EVERY = 100000
+HISTORY_SEGMENTS = 3  # how far back /audit looks, newest segment first
+
+def segment_seq(path):
+    return int(os.path.basename(path).split(".")[0].replace("snapshot-", ""))
+
+def clean(text):
+    return str(text).replace("\t", " ").replace("\n", " ")
+
+def snapshots(directory):
+    return sorted(glob.glob(os.path.join(directory, "snapshot-*.json")), key=segment_seq)
+
+def segments(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.log")), key=segment_seq)
+
+def read_events(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # torn last line from a crash
+            yield line[:-1].split("\t", 6)
+
+def open_segment(path):
+    # Open a segment for appending. If a crash left a torn last line, cut it
+    # off first so the next record doesn't get glued onto it.
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+    return open(path, "a", encoding="utf-8")
+
+def user_events(path, user_id):
+    # Complete lines of one player in a segment, oldest first; the cheap
+    # substring test skips splitting everybody else's lines
+    needle = f"\t{user_id}\t"
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if needle in line:
+                fields = line[:-1].split("\t", 6)
+                if fields[2] == user_id:
+                    yield fields
+
+def replay(directory, until_seq=None, until_time=None):
+    # Rebuild {user_id: balance} as of until_seq / until_time (default: end)
+    # Returns (balances, last seq, events replayed)
+    seq, balances = 0, {}
+    for path in reversed(snapshots(directory)):
+        snap_seq = segment_seq(path)
+        if until_seq is not None and snap_seq > until_seq:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            snap = json.load(f)
+        if until_time is not None and snap["time"] > until_time:
+            continue
+        seq, balances = snap_seq, snap["balances"]
+        break
+
+    replayed = 0
+    for path in segments(directory):
+        if segment_seq(path) <= seq:
+            continue
+        for fields in read_events(path):
+            event_seq = int(fields[0])
+            if (until_seq is not None and event_seq > until_seq) or \
+               (until_time is not None and int(fields[1]) > until_time):
+                return balances, seq, replayed
+            balances[fields[2]] = int(fields[5])
+            seq = event_seq
+            replayed += 1
+    return balances, seq, replayed
+
+class Ledger:
+    def __init__(self, directory, flush_interval=0.2, snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        self.balances, self.seq, replayed = replay(directory)
+        self.replay_seconds = time.perf_counter() - started
+        self.replayed = replayed
+        self._since_snapshot = replayed
+        self._buffer = []
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Events after the last good one go to segment seq+1. That is a new
+        # file unless the previous run crashed before anything in it was
+        # complete, in which case it still holds the torn line.
+        self._file = open_segment(os.path.join(directory, f"{self.seq + 1}.log"))
+
+    def is_empty(self):
+        return self.seq == 0 and not snapshots(self.directory)
+
+    def record(self, user_id, reason, delta, balance, note=""):
+        user_id = str(user_id)
+        with self._lock:
+            self.seq += 1
+            self.balances[user_id] = balance
+            self._since_snapshot += 1
+            self._buffer.append(f"{self.seq}\t{int(time.time())}\t{user_id}\t{reason}\t{delta}\t{balance}\t{clean(note)}\n")
+
+    def snapshot(self):
+        # Save all balances and roll over to a new segment
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+                seq, balances = self.seq, dict(self.balances)
+                self._since_snapshot = 0
+            self._write(lines)
+            text = json.dumps({"seq": seq, "time": int(time.time()), "balances": balances}, separators=(",", ":"))
+            storage.atomic_write(os.path.join(self.directory, f"snapshot-{seq}.json"), text)
+            self._file.close()
+            self._file = open_segment(os.path.join(self.directory, f"{seq + 1}.log"))
+
+    def _write(self, lines):
+        if lines:
+            text = "".join(lines)
+            self.bytes_written += len(text)
+            self._file.write(text)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def flush(self):
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+            return
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            self._write(lines)
+
+    def history(self, user_id, limit=10, max_segments=HISTORY_SEGMENTS):
+        # Latest events for one player, newest first: the unflushed buffer,
+        # then at most max_segments segments, newest first, stopping once
+        # limit events are found. Runs on handler threads, so it never
+        # writes, flushes or snapshots.
+        user_id = str(user_id)
+        with self._lock:
+            pending = list(self._buffer)
+        found = [f for f in (line[:-1].split("\t", 6) for line in reversed(pending)) if f[2] == user_id]
+        # the writer may flush the buffer meanwhile; those events are already in found
+        first_pending = int(pending[0].split("\t", 1)[0]) if pending else None
+        for path in list(reversed(segments(self.directory)))[:max_segments]:
+            if len(found) >= limit:
+                break
+            events = [f for f in user_events(path, user_id) if first_pending is None or int(f[0]) < first_pending]
+            found.extend(reversed(events))
+        return found[:limit]
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Ledger flush failed, will retry: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._file.close()
+
+def reconcile(ledger, store, new_record=dict):
+    # After a crash the ledger may be ahead of the player records; its
+    # balances win, and players whose record never got flushed are
+    # recreated with new_record(). Returns the number of players corrected.
+    if ledger.is_empty():
+        # First start with a ledger: snapshot the current balances as seq 0
+        ledger.balances = {uid: data.get("coins", 0) for uid, data in store.scan()}
+        ledger.snapshot()
+        return 0
+    fixed = {}
+    for uid, balance in ledger.balances.items():
+        data = store.get(uid)
+        if data is None:
+            data = new_record()
+        if data.get("coins") != balance:
+            with storage.user_lock(uid):
+                data["coins"] = balance
+                fixed[uid] = data
+    store.put_many(fixed)
+    return len(fixed)
+
+def main(argv):
+    directory = argv[1] if len(argv) > 1 else "ledger"
+    if not argv or argv[0] != "replay":
+        print("Usage: python ledger.py replay [ledger dir] [until unix time]")
+        return 1
+    until = int(argv[2]) if len(argv) > 2 else None
+    started = time.perf_counter()
+    balances, seq, replayed = replay(directory, until_time=until)
+    elapsed = time.perf_counter() - started
+    print(f"📒 Replayed {replayed} events up to #{seq} in {elapsed:.2f}s")
+    print(f"   {len(balances)} players, {sum(balances.values())} coins in circulation")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
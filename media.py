@@ -0,0 +1,86 @@
+import os, json, threading
+from collections import Counter
+from telegram.error import BadRequest, TelegramError
+
+import storage
+
+# ==========================
+# 🖼 Character Card Media Cache
+# ==========================
+# Sending a photo by URL makes Telegram download the remote image on every
+# send. The first send returns a file_id for the uploaded copy; sending that
+# file_id afterwards is instant. MediaCache keeps url -> file_id, persists
+# it to a JSON file, and falls back to the URL (and re-learns the id) if
+# Telegram ever rejects a stored id.
+#
+# prewarm() sends the most requested (and, on a cold start, the rarest)
+# uncached images to a warm-up chat so the first player to see a card
+# doesn't pay for the download either.
+
+class MediaCache:
+    def __init__(self, path):
+        self.path = path
+        self._ids = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._ids = json.load(f)
+        self._lock = threading.Lock()
+        self.requests = Counter()  # url -> times a card was requested
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def file_id(self, url):
+        return self._ids.get(url)
+
+    def _remember(self, url, message):
+        if not message or not message.photo:
+            return
+        with self._lock:
+            self._ids[url] = message.photo[-1].file_id
+            text = json.dumps(self._ids, indent=2)
+        storage.atomic_write(self.path, text)
+
+    def _forget(self, url):
+        with self._lock:
+            self._ids.pop(url, None)
+
+    def send_photo(self, bot, chat_id, url, **kwargs):
+        self.requests[url] += 1
+        file_id = self._ids.get(url)
+        if file_id is not None:
+            try:
+                message = bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+                self.hits += 1
+                return message
+            except BadRequest:
+                self._forget(url)  # stale or foreign id: fall back to the URL
+        self.misses += 1
+        message = bot.send_photo(chat_id=chat_id, photo=url, **kwargs)
+        self._remember(url, message)
+        return message
+
+    def prewarm(self, bot, chat_id, urls, limit=20):
+        # Upload up to `limit` uncached images, most requested first;
+        # `urls` is the cold-start preference order. Returns how many.
+        ranked = sorted(urls, key=lambda u: -self.requests[u])
+        warmed = 0
+        for url in ranked:
+            if warmed >= limit:
+                break
+            if url in self._ids:
+                continue
+            try:
+                message = bot.send_photo(chat_id=chat_id, photo=url, disable_notification=True)
+            except TelegramError as e:
+                print(f"⚠️ Prewarm failed for {url}: {e}")
+                continue
+            self._remember(url, message)
+            warmed += 1
+            try:
+                bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+            except TelegramError:
+                pass
+        return warmed
@@ -0,0 +1,130 @@
+import time, threading
+from contextlib import contextmanager
+
+# ==========================
+# 📈 Runtime Metrics
+# ==========================
+# A small in-process registry:
+#   - gauges and counters are read lazily from callables at export time
+#   - latencies go into fixed-bucket histograms per name
+#   - phase("storage") / phase("telegram") blocks add their time to the
+#     handler currently running on this thread, so each handler's latency
+#     can be split into storage, Telegram API and everything else
+# snapshot() feeds the JSON endpoint and the /admin view, prometheus()
+# the text endpoint.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+class Metrics:
+    def __init__(self):
+        self._gauges = {}
+        self._counters = {}
+        self._latency = {}  # name -> Histogram
+        self._phases = {}   # (handler, phase) -> seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def gauge(self, name, read):
+        self._gauges[name] = read
+
+    def counter(self, name, read):
+        self._counters[name] = read
+
+    def observe(self, name, seconds, phases=None):
+        with self._lock:
+            hist = self._latency.get(name)
+            if hist is None:
+                hist = self._latency[name] = Histogram()
+            hist.observe(seconds)
+            for phase, spent in (phases or {}).items():
+                self._phases[(name, phase)] = self._phases.get((name, phase), 0.0) + spent
+
+    @contextmanager
+    def handler(self, name):
+        # Times a handler and collects the phases that run inside it
+        outer = getattr(self._local, "phases", None)
+        self._local.phases = phases = {}
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.phases = outer
+            self.observe(name, time.perf_counter() - started, phases)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = getattr(self._local, "phases", None)
+            if phases is not None:
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+    def snapshot(self):
+        with self._lock:
+            latency = {
+                name: {"count": h.count, "avg_ms": 1000 * h.total / h.count, "p95_ms": 1000 * h.quantile(0.95),
+                       "max_ms": 1000 * h.max,
+                       "phases_ms": {p: 1000 * s / h.count for (n, p), s in self._phases.items() if n == name}}
+                for name, h in self._latency.items()
+            }
+        return {
+            "gauges": {name: read() for name, read in self._gauges.items()},
+            "counters": {name: read() for name, read in self._counters.items()},
+            "latency": latency,
+        }
+
+    def prometheus(self, prefix="rpg"):
+        lines = []
+        for name, read in sorted(self._gauges.items()):
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name} {read()}"]
+        for name, read in sorted(self._counters.items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {read()}"]
+
+        with self._lock:
+            hists = {name: (list(h.counts), h.count, h.total) for name, h in self._latency.items()}
+            phases = dict(self._phases)
+        metric = f"{prefix}_handler_latency_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, (counts, count, total) in sorted(hists.items()):
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{handler="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{handler="{name}"}} {total}')
+            lines.append(f'{metric}_count{{handler="{name}"}} {count}')
+        metric = f"{prefix}_handler_phase_seconds_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (name, phase), spent in sorted(phases.items()):
+            lines.append(f'{metric}{{handler="{name}",phase="{phase}"}} {spent}')
+        return "\n".join(lines) + "\n"
+
+registry = Metrics()
@@ -0,0 +1,167 @@
+import random, threading
+from collections import namedtuple
+
+import events as ev
+
+# ==========================
+# 🎯 Missions Engine
+# ==========================
+# Missions are data: a pool of Mission rows, each counting one action
+# (quests completed, battles won, ...) up to a target. Every game day a
+# few daily missions are drawn from the pool, and every ISO week a few
+# weekly ones; the draw is seeded by the period, so every worker and every
+# restart agrees on today's set without storing it.
+#
+# Per player there are two small dicts keyed by slot, "<mission>@<period>":
+#   record["mission_progress"]  slot -> actions counted so far
+#   record["missions"]          slot -> True once the reward was claimed
+# The missions subscriber adds each batch of events to the slots watching
+# that action, and a claim just compares one counter with the target, so
+# neither ever looks at history. Each event counts toward the missions of
+# the game day it happened on (its `at` time), not the day the batch is
+# processed, so an action just before the reset lands in the old day's slot
+# even when the bus gets to it after the reset. Because the period is part
+# of the slot, progress from yesterday can never complete today's mission;
+# the daily reset pass only drops slots that are no longer active.
+
+Mission = namedtuple("Mission", "key period task action target reward")
+
+POOL = (
+    Mission("quest1", "daily", "Complete 1 Quest", "quest", 1, 200),
+    Mission("quest5", "daily", "Complete 5 Quests", "quest", 5, 600),
+    Mission("battle1", "daily", "Win 1 Battle", "battle", 1, 300),
+    Mission("battle3", "daily", "Win 3 Battles", "battle", 3, 700),
+    Mission("shop1", "daily", "Buy an Item from Shop", "shop", 1, 150),
+    Mission("gacha3", "daily", "Summon 3 times", "gacha", 3, 400),
+    Mission("upgrade1", "daily", "Upgrade an item", "upgrade", 1, 250),
+
+    Mission("quest25", "weekly", "Complete 25 Quests", "quest", 25, 3000),
+    Mission("battle15", "weekly", "Win 15 Battles", "battle", 15, 3500),
+    Mission("gacha20", "weekly", "Summon 20 times", "gacha", 20, 2500),
+    Mission("upgrade5", "weekly", "Upgrade 5 items", "upgrade", 5, 2000),
+    Mission("earn10k", "weekly", "Earn 10000 coins", "earn", 10000, 2000),
+)
+
+# period -> how many missions of it are active at once
+ACTIVE = {"daily": 3, "weekly": 2}
+
+# event type -> [(action, amount the event adds)]
+ACTIONS = {
+    ev.QuestCompleted: [("quest", lambda e: 1)],
+    ev.BattleWon: [("battle", lambda e: 1)],
+    ev.ItemAcquired: [("shop", lambda e: int(e.source == "shop"))],
+    ev.GachaPulled: [("gacha", lambda e: e.pulls)],
+    ev.ItemUpgraded: [("upgrade", lambda e: int(e.success))],
+    # mission rewards don't count, or earn10k would feed itself
+    ev.CoinsChanged: [("earn", lambda e: e.delta if e.delta > 0 and e.reason != "mission" else 0)],
+}
+EVENT_TYPES = tuple(ACTIONS)
+
+def period_id(period, day):
+    if period == "daily":
+        return day.isoformat()
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def slot(mission, day):
+    return f"{mission.key}@{period_id(mission.period, day)}"
+
+class MissionBoard:
+    def __init__(self, pool=POOL, active=ACTIVE, seed="missions"):
+        self.pool = pool
+        self.by_key = {m.key: m for m in pool}
+        self.counts = active
+        self.seed = seed
+        self._day = None
+        self._active = ()
+        self._watching = {}  # action -> [(mission, slot)] for self._day
+        self._lock = threading.Lock()
+
+    def _draw(self, day):
+        # The active set for `day` and action -> [(mission, slot)]; the same
+        # day always draws the same set
+        active, watching = [], {}
+        for period, count in self.counts.items():
+            candidates = [m for m in self.pool if m.period == period]
+            rng = random.Random(f"{self.seed}:{period_id(period, day)}")
+            for mission in rng.sample(candidates, min(count, len(candidates))):
+                active.append(mission)
+                watching.setdefault(mission.action, []).append((mission, slot(mission, day)))
+        return tuple(active), watching
+
+    def rotate(self, day):
+        active, watching = self._draw(day)
+        with self._lock:
+            self._day, self._active, self._watching = day, active, watching
+
+    def _watching_on(self, day):
+        # Missions watching actions of `day`. Only moving forward rotates;
+        # a late event from an earlier day gets that day's draw uncached.
+        with self._lock:
+            if self._day == day:
+                return self._watching
+            earlier = self._day is not None and day < self._day
+        if earlier:
+            return self._draw(day)[1]
+        return self._current(day)[1]
+
+    def _current(self, day):
+        if self._day != day:
+            self.rotate(day)
+        with self._lock:
+            return self._active, self._watching
+
+    def active(self, day):
+        return self._current(day)[0]
+
+    def progress(self, batch, day_of):
+        # Fold a batch of events into {user_id: {slot: amount}}; day_of(at)
+        # is the game day of an event time (None: now)
+        deltas, days = {}, {}
+        for event in batch:
+            rules = ACTIONS.get(type(event))
+            if not rules:
+                continue
+            day = day_of(event.at)
+            watching = days.get(day)
+            if watching is None:
+                watching = days[day] = self._watching_on(day)
+            for action, amount in rules:
+                targets = watching.get(action)
+                if not targets:
+                    continue
+                n = amount(event)
+                if n:
+                    counts = deltas.setdefault(event.user_id, {})
+                    for _, key in targets:
+                        counts[key] = counts.get(key, 0) + n
+        return deltas
+
+    def status(self, data, mission, day):
+        # (done so far, capped at the target; claimed?)
+        key = slot(mission, day)
+        return min(data.get("mission_progress", {}).get(key, 0), mission.target), bool(data.get("missions", {}).get(key))
+
+    def claim(self, data, key, day):
+        # Returns (mission or None, error message or None); marks the claim
+        mission = self.by_key.get(key)
+        if mission is None or mission not in self.active(day):
+            return None, "⚠️ This mission is no longer active."
+        done, claimed = self.status(data, mission, day)
+        if claimed:
+            return mission, "⚠️ Mission already completed."
+        if done < mission.target:
+            return mission, f"⚠️ Not done yet: {done}/{mission.target}."
+        data.setdefault("missions", {})[slot(mission, day)] = True
+        return mission, None
+
+    def reset_record(self, data, day):
+        # Daily reset hook: drop slots of missions that are no longer active
+        live = {slot(m, day) for m in self.active(day)}
+        changed = False
+        for field in ("mission_progress", "missions"):
+            entries = data.get(field, {})
+            if entries and any(key not in live for key in entries):
+                data[field] = {key: v for key, v in entries.items() if key in live}
+                changed = True
+        return changed
@@ -0,0 +1,270 @@
+import os, json, time, heapq, itertools, threading
+from telegram.error import TelegramError, RetryAfter, TimedOut, NetworkError, Unauthorized, BadRequest, ChatMigrated
+
+import storage
+
+# ==========================
+# 📤 Outbound Message Queue
+# ==========================
+# Messages that don't answer the current update (moderator alerts, news
+# broadcasts) go through this queue instead of blocking the handler.
+# Sender threads pull from a heap ordered by "not before" time, and every
+# send must take a token from both the global bucket (Telegram allows about
+# 30 messages/s per bot) and the chat's own bucket (about 1 message/s per
+# chat). Flood-wait errors push the message back by retry_after; network
+# errors back off exponentially; blocked or deleted chats are dropped.
+
+GLOBAL_RATE = 30     # messages per second across all chats
+CHAT_RATE = 1        # messages per second per chat
+MAX_ATTEMPTS = 5
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        # Take a token and return 0, or return how long until one is free
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class Outbox:
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, max_attempts=MAX_ATTEMPTS):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(global_rate)
+        self._chats = {}  # chat_id -> TokenBucket, dropped once full again
+        self._heap = []   # (not_before, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._threads = []
+        self._stopping = False
+        self.sent = 0
+        self.failed = 0
+
+    def send(self, chat_id, text, done=None, **kwargs):
+        # done(ok) is called once the message is delivered or given up on
+        job = {"chat_id": chat_id, "text": text, "kwargs": kwargs, "attempt": 0, "done": done}
+        self._push(job, time.monotonic())
+
+    def depth(self):
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def _push(self, job, not_before):
+        with self._cond:
+            heapq.heappush(self._heap, (not_before, next(self._seq), job))
+            self._cond.notify()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._stopping and not self._heap:
+                    return None
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    job = self._heap[0][2]
+                    bucket = self._chats.get(job["chat_id"])
+                    if bucket is None:
+                        bucket = self._chats[job["chat_id"]] = TokenBucket(self.chat_rate)
+                    wait = bucket.reserve(now)
+                    if wait == 0:
+                        wait = self._global.reserve(now)
+                        if wait > 0:
+                            bucket.tokens += 1  # give the chat token back
+                    if wait == 0:
+                        heapq.heappop(self._heap)
+                        self._in_flight += 1
+                        self._forget_idle_chats(now)
+                        return job
+                    heapq.heapreplace(self._heap, (now + wait, next(self._seq), job))
+                    continue
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+
+    def _forget_idle_chats(self, now):
+        if len(self._chats) > 10000:
+            self._chats = {cid: b for cid, b in self._chats.items()
+                           if b.tokens + (now - b.updated) * b.rate < b.capacity}
+
+    def _deliver(self, job):
+        try:
+            self.bot.send_message(chat_id=job["chat_id"], text=job["text"], **job["kwargs"])
+            return True, None
+        except RetryAfter as e:
+            return False, float(e.retry_after)
+        except ChatMigrated as e:
+            job["chat_id"] = e.new_chat_id
+            return False, 0.0
+        except (Unauthorized, BadRequest):
+            return False, None  # blocked, deleted or bad message: retrying won't help
+        except (TimedOut, NetworkError):
+            return False, min(60.0, 2.0 ** job["attempt"])
+        except TelegramError as e:
+            print(f"⚠️ Outbox: chat {job['chat_id']} refused: {e}")
+            return False, None  # e.g. Conflict: nothing a retry would fix
+        except Exception as e:
+            # Last resort, so a bug or an odd error never kills a sender thread
+            print(f"⚠️ Outbox: sending to chat {job['chat_id']} failed: {e}")
+            return False, None
+
+    def _finish(self, job, ok):
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+            print(f"⚠️ Outbox: giving up on chat {job['chat_id']} after {job['attempt']} attempt(s)")
+        if job["done"]:
+            try:
+                job["done"](ok)
+            except Exception as e:
+                print(f"⚠️ Outbox: done callback for chat {job['chat_id']} failed: {e}")
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            ok, finished = False, True
+            try:
+                ok, retry_in = self._deliver(job)
+                job["attempt"] += 1
+                if not ok and retry_in is not None and job["attempt"] < self.max_attempts:
+                    # Requeued before the job stops counting as in flight,
+                    # so stop() never sees an empty outbox in between
+                    self._push(job, time.monotonic() + retry_in)
+                    finished = False
+            finally:
+                # Whatever happened, the job is no longer in flight and its
+                # owner (e.g. a broadcast batch) hears how it ended
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+                if finished:
+                    self._finish(job, ok)
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=30):
+        # Deliver what's queued (bounded by timeout), then stop the senders
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._heap or self._in_flight) and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._stopping = True
+            self._heap.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+# ==========================
+# 📣 Checkpointed Broadcasts
+# ==========================
+# A broadcast walks the recipients in ascending chat id order, queueing one
+# batch at a time and waiting for it to finish before moving on, so a huge
+# fan-out never floods the outbox. After each batch the last chat id is
+# written to the checkpoint file; on restart unfinished broadcasts resume
+# after that id (at worst the last batch is sent twice).
+
+BATCH_SIZE = 100
+
+class Broadcaster:
+    def __init__(self, outbox, checkpoint_file, recipients, batch_size=BATCH_SIZE):
+        self.outbox = outbox
+        self.checkpoint_file = checkpoint_file
+        self.recipients = recipients  # () -> iterable of chat ids
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def _load(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self):
+        with self._lock:
+            text = json.dumps(self._state, indent=2, ensure_ascii=False)
+        storage.atomic_write(self.checkpoint_file, text)
+
+    def status(self):
+        with self._lock:
+            return {bid: dict(b) for bid, b in self._state.items()}
+
+    def start_broadcast(self, text, **kwargs):
+        with self._lock:
+            bid = time.strftime("%Y%m%d-%H%M%S") + f"-{len(self._state) + 1}"
+            self._state[bid] = {"text": text, "kwargs": kwargs, "cursor": None,
+                                "sent": 0, "failed": 0, "done": False}
+        self._save()
+        self._spawn(bid)
+        return bid
+
+    def resume(self):
+        for bid, b in self.status().items():
+            if not b["done"]:
+                print(f"📣 Resuming broadcast {bid} after chat {b['cursor']}")
+                self._spawn(bid)
+
+    def _spawn(self, bid):
+        thread = threading.Thread(target=self._run, args=(bid,), name=f"broadcast-{bid}", daemon=True)
+        self._threads[bid] = thread
+        thread.start()
+
+    def _run(self, bid):
+        b = self.status()[bid]
+        cursor = b["cursor"]
+        chat_ids = sorted(int(c) for c in self.recipients())
+        if cursor is not None:
+            chat_ids = [c for c in chat_ids if c > cursor]
+
+        for start in range(0, len(chat_ids), self.batch_size):
+            if self._stop.is_set():
+                return
+            batch = chat_ids[start:start + self.batch_size]
+            results = []
+            finished = threading.Semaphore(0)
+
+            def done(ok):
+                results.append(ok)
+                finished.release()
+
+            for chat_id in batch:
+                self.outbox.send(chat_id, b["text"], done=done, **b["kwargs"])
+            for _ in batch:
+                finished.acquire()
+
+            with self._lock:
+                state = self._state[bid]
+                state["cursor"] = batch[-1]
+                state["sent"] += sum(results)
+                state["failed"] += len(results) - sum(results)
+            self._save()
+
+        with self._lock:
+            self._state[bid]["done"] = True
+        self._save()
+
+    def stop(self, timeout=30):
+        # Unfinished broadcasts stay in the checkpoint and resume on restart
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads.values():
+            thread.join(max(0, deadline - time.monotonic()))
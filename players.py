@@ -0,0 +1,268 @@
+from collections.abc import MutableMapping
+
+import inventory as inv
+
+# ==========================
+# 👤 Player Records
+# ==========================
+# Every player is a Player: a __slots__ object with one slot per known
+# field, so a cached player costs a fixed set of pointers instead of a
+# per-record dict with its own hash table. It still behaves like the old
+# dict (data["coins"], data.get(...), setdefault, "x" in data), so handlers
+# and helpers didn't have to change, and every known field always exists
+# with its default. Slots of fields still at their default stay empty.
+# get(key, default) on an unset field returns the caller's default, as a
+# dict would, and stores nothing, so passes that only look (leaderboards,
+# achievements, broadcasts) allocate nothing per player. data[key] on an
+# unset list or dict stores the empty container it returns, so changing it
+# in place always sticks. Keys we don't know yet go to a small overflow
+# dict.
+#
+# On disk a record is the same JSON document as before plus "v", the schema
+# version. Records are validated and upgraded as they are loaded, one by
+# one; there is no migration pass, an old record is rewritten in the new
+# shape the next time the player is saved. Fields still at their default
+# are left out of the JSON.
+
+SCHEMA_VERSION = 2
+
+DEFAULT_SETTINGS = {"sound": True, "notifications": True, "theme": "Light"}
+
+# field -> default; mutable defaults are copied per player
+FIELDS = {
+    "coins": 0,
+    "rating": 1000,
+    "guild": None,
+    "characters": [],
+    "items": {},
+    "inv_version": 0,
+    "married": [],
+    "missions": {},          # mission slot -> claimed (see missions.py)
+    "mission_progress": {},  # mission slot -> actions counted
+    "quests_done": 0,
+    "battles_won": 0,
+    "upgrades_done": 0,
+    "gacha_pulls": 0,
+    "daily_streak": 0,
+    "last_daily": None,
+    "achievements": [],
+    "achievements_count": 0,
+    "titles": [],
+    "badges": [],
+    "donor": False,
+    "settings": DEFAULT_SETTINGS,
+    "chapter": 1,
+    "quest_log": [],
+    "journal": [],
+    "reports": [],
+    "feedback": [],
+    "guild_war": False,
+    "guild_war_fought": None,  # game day of the last fight; one win per war round
+    "guild_wars": 0,
+    "guild_wins": 0,
+    "guild_rewards": 0,
+    "lore_unlocked": [],
+    "codex_unlocked": [],
+}
+FIELD_NAMES = tuple(FIELDS)
+# field -> slot; "items" would hide Mapping.items(), so its slot is items_
+SLOTS = {name: name + "_" if hasattr(MutableMapping, name) else name for name in FIELDS}
+# expected type per field (None: anything goes); used to validate on load
+_TYPES = {name: None if default is None else type(default) for name, default in FIELDS.items()}
+_MUTABLE = {name for name, kind in _TYPES.items() if kind in (list, dict)}
+_KEYS = frozenset(FIELDS) | {"v"}
+
+class _Unset:
+    # Marks a slot still at the field default; copies and pickles stay the same object
+    def __reduce__(self):
+        return "_UNSET"
+
+    def __repr__(self):
+        return "<default>"
+
+_UNSET = _Unset()
+_NO_DEFAULT = object()  # get() called without a default
+
+def _default(name):
+    default = FIELDS[name]
+    return type(default)(default) if name in _MUTABLE else default
+
+def _checked(name, value):
+    # value if it has the field's type (ints are coerced), else _UNSET
+    kind = _TYPES[name]
+    if kind is None or type(value) is kind:
+        return value
+    if kind is int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return _UNSET
+    if kind is bool:
+        return bool(value)
+    return _UNSET
+
+def _loaded(name, value):
+    # Slow path of _fill: a stored default stays unset, a wrong type is checked
+    return _UNSET if value == FIELDS[name] else _checked(name, value)
+
+# ==========================
+# ⚙️ Generated Field Code
+# ==========================
+# Loading and dumping touch every field of every player, and a Python loop
+# over the fields cost more than building the old dict. Like dataclasses,
+# the per-field code is generated once at import instead: one straight line
+# per field, no loop, no per-field lookups.
+#
+#   _fill(player, raw)  sets every slot from a stored document
+#   _dump(player)       the document: "v" plus the fields not at default
+def _compile():
+    env = {"_UNSET": _UNSET, "_loaded": _loaded, "SCHEMA_VERSION": SCHEMA_VERSION}
+    fill = ["def _fill(self, raw):", "    get = raw.get"]
+    dump = ["def _dump(self):", "    out = {'v': SCHEMA_VERSION}"]
+    for name, default in FIELDS.items():
+        slot, kind = SLOTS[name], _TYPES[name]
+        env[f"_d_{name}"], env[f"_t_{name}"] = default, kind
+        fill.append(f"    v = get({name!r}, _UNSET)")
+        if kind is None:
+            fill.append(f"    self.{slot} = _UNSET if v is None else v")
+        else:
+            fill.append(f"    self.{slot} = v if v is _UNSET or (type(v) is _t_{name} and v != _d_{name}) "
+                        f"else _loaded({name!r}, v)")
+        dump.append(f"    v = self.{slot}")
+        dump.append(f"    if v is not _UNSET and v != _d_{name}: out[{name!r}] = v")
+    dump.append("    return out")
+    exec("\n".join(fill + [""] + dump), env)
+    return env["_fill"], env["_dump"]
+
+_fill, _dump = _compile()
+_NOTHING = {}
+
+class Player(MutableMapping):
+    __slots__ = tuple(SLOTS.values()) + ("_extra",)
+
+    def __init__(self, **values):
+        _fill(self, _NOTHING)
+        self._extra = None
+        for key, value in values.items():
+            self[key] = value
+
+    def _field(self, name):
+        # data[name]: an unset list or dict is stored as it is handed out,
+        # so data["married"].append(...) is never lost
+        value = getattr(self, SLOTS[name])
+        if value is _UNSET:
+            value = _default(name)
+            if name in _MUTABLE:
+                setattr(self, SLOTS[name], value)
+        return value
+
+    # --- dict interface ---
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return self._field(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in FIELDS:
+            setattr(self, SLOTS[key], value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in FIELDS:
+            setattr(self, SLOTS[key], _UNSET)  # known fields always exist: back to the default
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in FIELDS or (self._extra is not None and key in self._extra)
+
+    def __iter__(self):
+        yield from FIELD_NAMES
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return len(FIELD_NAMES) + len(self._extra or ())
+
+    def get(self, key, default=_NO_DEFAULT):
+        # Like dict.get: an unset field gives the caller's default and
+        # stores nothing. Without a default it is data[key].
+        if key in FIELDS:
+            value = getattr(self, SLOTS[key])
+            if value is not _UNSET:
+                return value
+            return self._field(key) if default is _NO_DEFAULT else default
+        if default is _NO_DEFAULT:
+            default = None
+        return self._extra.get(key, default) if self._extra else default
+
+    def setdefault(self, key, default=None):
+        # Known fields always "exist", so store the unset default here
+        if key in FIELDS:
+            value = getattr(self, SLOTS[key])
+            if value is _UNSET:
+                value = _default(key) if default is None else default
+                setattr(self, SLOTS[key], value)
+            return value
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __repr__(self):
+        return f"Player({self.to_dict()!r})"
+
+    # --- (de)serialization ---
+    def to_dict(self):
+        # Plain dict for JSON: schema version, non-default fields, extras
+        out = _dump(self)
+        if self._extra:
+            out.update(self._extra)
+        return out
+
+    @classmethod
+    def load(cls, raw):
+        # JSON document (any schema version) -> validated, upgraded Player.
+        # Values of the wrong type fall back to the field default rather
+        # than crashing a handler later.
+        if isinstance(raw, Player):
+            return raw
+        version = raw.get("v", 1)
+        if version < SCHEMA_VERSION:
+            raw = dict(raw)
+            while version < SCHEMA_VERSION:
+                raw = UPGRADES[version](raw)
+                version += 1
+        player = cls.__new__(cls)
+        _fill(player, raw)  # stored defaults (e.g. "items": {}) stay unset
+        player._extra = None
+        if not raw.keys() <= _KEYS:
+            for key in raw.keys() - _KEYS:
+                player[key] = raw[key]
+        return player
+
+# ==========================
+# ⬆️ Schema Upgrades
+# ==========================
+# UPGRADES[n] turns a version n document into version n + 1
+def _v1_to_v2(raw):
+    # v1: free-form dicts from before the record model
+    raw["items"] = inv.stack(raw.get("items"))
+    missions = raw.get("missions")
+    if isinstance(missions, dict):
+        # int mission ids turned into strings after a JSON round trip anyway
+        raw["missions"] = {str(k): v for k, v in missions.items()}
+    if isinstance(raw.get("settings"), dict):
+        raw["settings"] = {**DEFAULT_SETTINGS, **raw["settings"]}
+    return raw
+
+UPGRADES = {1: _v1_to_v2}
+
+def new_player():
+    return Player()
@@ -0,0 +1,110 @@
+import time, threading
+from collections import namedtuple
+
+# ==========================
+# 🚦 Per-user Rate Limits
+# ==========================
+# Token buckets keyed by (user, action). A Limit(burst, every) bucket holds
+# up to `burst` tokens and regains one every `every` seconds, so burst=1 is
+# a plain cooldown. Every update also spends from the user's "*" bucket.
+#
+# A bucket is just [tokens, stamp, warned] in one dict. Buckets that have
+# refilled completely carry no information, so sweep() drops them; memory
+# stays proportional to the players who were active in the last minute
+# or so.
+
+Limit = namedtuple("Limit", "burst every")
+
+LIMITS = {
+    "*": Limit(20, 0.5),        # any update
+    "quest": Limit(5, 12),
+    "battle": Limit(5, 12),
+    "gacha": Limit(3, 5),       # /gacha and the "summon again" buttons
+    "daily": Limit(2, 10),
+    "gw_fight": Limit(1, 60),   # pays 1200 coins a click
+    "gw_join": Limit(2, 30),
+    "mission_claim": Limit(3, 5),
+    "upgrade": Limit(5, 5),
+    "shop_buy": Limit(5, 5),
+    "store_buy": Limit(5, 5),
+}
+
+# callback data prefix -> action
+CALLBACK_ACTIONS = (
+    ("gacha_again_", "gacha"),
+    ("gw_fight", "gw_fight"),
+    ("gw_join", "gw_join"),
+    ("mission_claim_", "mission_claim"),
+    ("upgrade_", "upgrade"),
+    ("shop_buy_", "shop_buy"),
+    ("store_buy_", "store_buy"),
+    # main menu buttons that run the command itself share its bucket
+    ("menu_quest", "quest"),
+    ("menu_battle", "battle"),
+    ("menu_gacha", "gacha"),
+    ("menu_daily", "daily"),
+)
+
+def action_of(update):
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        for prefix, action in CALLBACK_ACTIONS:
+            if data.startswith(prefix):
+                return action
+        return None
+    message = update.effective_message
+    text = (message.text or "") if message is not None else ""
+    if text.startswith("/"):
+        return text.split()[0][1:].split("@")[0].lower()
+    return None
+
+class Throttle:
+    def __init__(self, limits=LIMITS, sweep_interval=60):
+        self.limits = limits
+        self.sweep_interval = sweep_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.rejected = 0
+
+    def _take(self, key, limit, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit.burst), now, False]
+        else:
+            bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) / limit.every)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return 0.0, bucket
+        return (1 - bucket[0]) * limit.every, bucket
+
+    def check(self, user_id, action, now=None):
+        # Returns (retry_after, warn): retry_after 0 means allowed; warn is
+        # True only for the first rejection, so spam gets one reply, not many
+        now = now or time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            checks = [("*", self.limits["*"])]
+            if action in self.limits:
+                checks.append((action, self.limits[action]))
+            for name, limit in checks:
+                wait, bucket = self._take((user_id, name), limit, now)
+                if wait:
+                    self.rejected += 1
+                    warn = not bucket[2]
+                    bucket[2] = True
+                    return wait, warn
+            return 0.0, False
+
+    def _sweep(self, now):
+        full = [key for key, (tokens, stamp, _) in self._buckets.items()
+                if tokens + (now - stamp) / self.limits[key[1]].every >= self.limits[key[1]].burst]
+        for key in full:
+            del self._buckets[key]
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self._buckets)
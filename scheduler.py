@@ -0,0 +1,101 @@
+import os, json, datetime
+import pytz
+
+import storage
+
+# ==========================
+# ⏰ Daily Reset Jobs
+# ==========================
+# Once a day, at RESET_TIME in RESET_TZ, one batched pass over every player:
+#   - hooks in record_hooks run on each player (e.g. missions drop the
+#     slots of missions that rotated out, see missions.py)
+#   - login streaks of players who missed yesterday's /daily are expired
+#   - the current guild-war round is closed (joined players are counted)
+# Changed players are saved in batches through `save` ({uid: record}), the
+# same write path handlers use, so event subscribers see them too.
+# Handlers then only look at the player's own record. The day of the last
+# reset is kept in a small state file, so a reset missed while the bot was
+# down runs once at startup instead.
+
+BATCH_SIZE = 500
+
+def parse_time(text):
+    hours, minutes = text.split(":")
+    return int(hours), int(minutes)
+
+class DailyReset:
+    def __init__(self, store, state_file, tz="UTC", at="00:00", batch_size=BATCH_SIZE, save=None):
+        self.store = store
+        self.save = save or store.put_many
+        self.state_file = state_file
+        self.tz = pytz.timezone(tz)
+        self.hour, self.minute = parse_time(at)
+        self.batch_size = batch_size
+        self.on_reset = []  # callables run with the new day after each reset
+        self.record_hooks = []  # (data, today) -> True if changed, run on every player
+
+    def game_day(self, now=None):
+        # The calendar day players are on; it flips at the reset time
+        now = now or datetime.datetime.now(self.tz)
+        shifted = now.astimezone(self.tz) - datetime.timedelta(hours=self.hour, minutes=self.minute)
+        return shifted.date()
+
+    def day_of(self, at=None):
+        # Game day of a unix time (default: now)
+        return self.game_day(None if at is None else datetime.datetime.fromtimestamp(at, self.tz))
+
+    def last_reset(self):
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("last_reset")
+
+    def reset_record(self, data, today):
+        # Mutates one player; returns True if anything changed
+        changed = False
+        for hook in self.record_hooks:
+            changed = hook(data, today) or changed
+
+        yesterday = (today - datetime.timedelta(days=1)).isoformat()
+        if data.get("daily_streak") and (data.get("last_daily") or "") < yesterday:
+            data["daily_streak"] = 0
+            changed = True
+
+        if data.get("guild_war"):
+            data["guild_war"] = False
+            data["guild_wars"] = data.get("guild_wars", 0) + 1
+            changed = True
+        return changed
+
+    def run(self, today=None):
+        today = today or self.game_day()
+        changed, total = {}, 0
+        for uid, data in self.store.scan():
+            with storage.user_lock(uid):
+                if self.reset_record(data, today):
+                    changed[uid] = data
+            if len(changed) >= self.batch_size:
+                self.save(changed)
+                total += len(changed)
+                changed = {}
+        if changed:
+            self.save(changed)
+            total += len(changed)
+        storage.atomic_write(self.state_file, json.dumps({"last_reset": today.isoformat()}))
+        print(f"⏰ Daily reset for {today}: {total} players updated")
+        for hook in self.on_reset:
+            hook(today)
+        return total
+
+    def catch_up(self):
+        today = self.game_day()
+        last = self.last_reset()
+        if last is None:
+            # first start: nothing to reset yet, just remember the day
+            storage.atomic_write(self.state_file, json.dumps({"last_reset": today.isoformat()}))
+        elif last != today.isoformat():
+            self.run(today)
+
+    def schedule(self, job_queue):
+        at = datetime.time(self.hour, self.minute, tzinfo=self.tz)
+        return job_queue.run_daily(lambda context: self.run(), at, name="daily-reset")
@@ -0,0 +1,393 @@
+import os, sys, json, copy, sqlite3, tempfile, threading
+from collections.abc import MutableMapping
+
+# ==========================
+# 💾 Storage Backends
+# ==========================
+# Every backend keeps one JSON document per Telegram user id and exposes the
+# same small interface:
+#   get(user_id) / exists(user_id)  -> point reads
+#   put_many({user_id: record})     -> point writes (one transaction)
+#   delete(user_id)
+#   scan()                          -> (user_id, record) pairs, full table
+#   count()
+# plus bytes_read / bytes_written counters (JSON text moved to or from disk).
+
+def _dumps(record):
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+def plain(record):
+    # JSON-ready dict for a record (see players.Player.to_dict)
+    return record.to_dict() if hasattr(record, "to_dict") else record
+
+# ==========================
+# 🔐 Per-user Locks
+# ==========================
+# Handlers run on several dispatcher workers, so two updates from the same
+# player can read-modify-write the same record at once. A fixed pool of
+# striped re-entrant locks serializes them without keeping one lock per
+# player ever seen.
+LOCK_STRIPES = 1024
+_user_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+def user_lock(user_id):
+    return _user_locks[hash(user_id) % LOCK_STRIPES]
+
+def atomic_write(path, text):
+    # temp file + fsync + rename: readers and crashes see either the old
+    # file or the new one, never a truncated mix
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class JsonFileStore:
+    # Legacy layout: the whole player database lives in a single users.json.
+    # Every operation parses (and every write rewrites) the entire file.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # one writer at a time
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _read(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return {}
+        self.bytes_read += os.path.getsize(self.path)
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, users):
+        text = json.dumps(users, indent=2)
+        self.bytes_written += len(text)
+        atomic_write(self.path, text)
+
+    def get(self, user_id):
+        return self._read().get(user_id)
+
+    def exists(self, user_id):
+        return user_id in self._read()
+
+    def put_many(self, records):
+        if not records:
+            return
+        with self._lock:
+            users = self._read()
+            users.update(records)
+            self._write(users)
+
+    def delete(self, user_id):
+        with self._lock:
+            users = self._read()
+            if users.pop(user_id, None) is not None:
+                self._write(users)
+
+    def scan(self):
+        return iter(self._read().items())
+
+    def count(self):
+        return len(self._read())
+
+    def close(self):
+        pass
+
+class SQLiteStore:
+    # One row per player, keyed by user id. WAL mode lets readers run while a
+    # writer commits, and a write only touches the rows that changed.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # sqlite3 connections are per-thread
+        self.bytes_read = 0
+        self.bytes_written = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id):
+        row = self._conn().execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return None
+        self.bytes_read += len(row[0])
+        return json.loads(row[0])
+
+    def exists(self, user_id):
+        return self._conn().execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def put_many(self, records):
+        if not records:
+            return
+        rows = [(uid, _dumps(rec)) for uid, rec in records.items()]
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                rows
+            )
+        self.bytes_written += sum(len(data) for _, data in rows)
+
+    def delete(self, user_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    def scan(self):
+        for uid, data in self._conn().execute("SELECT user_id, data FROM users"):
+            self.bytes_read += len(data)
+            yield uid, json.loads(data)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+BACKENDS = {"json": JsonFileStore, "sqlite": SQLiteStore}
+
+# ==========================
+# 🧠 In-Memory Cache (write-behind)
+# ==========================
+# Holds the one authoritative copy of every player in memory. Reads never
+# touch disk; writes only mark the record dirty, and a background flusher
+# persists dirty records to the backend in batches, either every
+# flush_interval seconds or as soon as flush_threshold records are dirty.
+#
+# load, if given, turns each stored JSON document into the in-memory record
+# (e.g. players.Player.load) as it is read; records with a to_dict() method
+# are written back through it.
+class CachedStore:
+    def __init__(self, backend, flush_interval=5.0, flush_threshold=200, load=None):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.load = load
+        if load is None:
+            self._records = dict(backend.scan())
+        else:
+            self._records = {uid: load(record) for uid, record in backend.scan()}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # keeps batches in order
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.before_flush = None  # e.g. flush a write-ahead log first
+
+    def get(self, user_id):
+        return self._records.get(user_id)
+
+    def exists(self, user_id):
+        return user_id in self._records
+
+    def put_many(self, records):
+        if not records:
+            return
+        if self.load is not None:
+            # plain dicts (imports, migrations) become records too
+            records = {uid: self.load(r) if type(r) is dict else r for uid, r in records.items()}
+        with self._lock:
+            self._records.update(records)
+            self._dirty.update(records)
+            if len(self._dirty) >= self.flush_threshold:
+                self._wake.set()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._records.pop(user_id, None)
+            self._dirty.discard(user_id)
+        self.backend.delete(user_id)
+
+    def scan(self):
+        return iter(list(self._records.items()))
+
+    def count(self):
+        return len(self._records)
+
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                dirty = list(self._dirty)
+                self._dirty.clear()
+            # Snapshot each record under its player's lock so a handler can't
+            # change it halfway through serialization
+            batch = {}
+            for uid in dirty:
+                with user_lock(uid):
+                    record = self._records.get(uid)
+                    if record is not None:
+                        batch[uid] = copy.deepcopy(plain(record))
+            try:
+                if self.before_flush is not None:
+                    self.before_flush()
+                self.backend.put_many(batch)
+            except Exception:
+                # Keep them dirty so the next pass retries
+                with self._lock:
+                    self._dirty.update(uid for uid in batch if uid in self._records)
+                raise
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ User flush failed, will retry: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="users-flusher", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        # Stop the flusher and persist everything still dirty
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.backend.close()
+
+def open_store(backend, path):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend} (use one of {', '.join(BACKENDS)})")
+    return BACKENDS[backend](path)
+
+# ==========================
+# 🗂 Per-request User View
+# ==========================
+# load_users() used to return the whole users.json as a dict. UserMap keeps
+# that dict-like surface for the handlers, but fetches a record only when a
+# handler touches it, so save_users() writes back just those records.
+class UserMap(MutableMapping):
+    def __init__(self, store):
+        self._store = store
+        self._records = {}
+
+    def __getitem__(self, user_id):
+        if user_id not in self._records:
+            record = self._store.get(user_id)
+            if record is None:
+                raise KeyError(user_id)
+            self._records[user_id] = record
+        return self._records[user_id]
+
+    def __setitem__(self, user_id, record):
+        self._records[user_id] = record
+
+    def __delitem__(self, user_id):
+        self._records.pop(user_id, None)
+        self._store.delete(user_id)
+
+    def __contains__(self, user_id):
+        return user_id in self._records or self._store.exists(user_id)
+
+    def __iter__(self):
+        for user_id, _ in self.items():
+            yield user_id
+
+    def __len__(self):
+        return self._store.count()
+
+    def items(self):
+        # Full scans (leaderboards) read straight from the store; records this
+        # view already holds win so in-flight changes stay visible.
+        for user_id, record in self._store.scan():
+            yield user_id, self._records.get(user_id, record)
+
+    def touched(self):
+        return self._records
+
+# ==========================
+# 🧾 Per-update Unit of Work
+# ==========================
+# The dispatcher wraps every update in a UnitOfWork. While it is open,
+# load_users() on that thread returns the unit's UserMap, so each player is
+# read at most once per update however many handlers and helpers touch it,
+# and save_users() only marks the unit dirty. The touched records are
+# committed once, after the update's last handler. Domain events the
+# handlers emit wait in the unit too and are published after the commit.
+_units = threading.local()
+
+def current_unit():
+    return getattr(_units, "current", None)
+
+class UnitOfWork:
+    def __init__(self, store, commit, publish=None):
+        self.users = UserMap(store)
+        self.commit = commit
+        self.publish = publish
+        self.dirty = False
+        self.events = []
+
+    def __enter__(self):
+        if current_unit() is not None:
+            raise RuntimeError("a unit of work is already open on this thread")
+        _units.current = self
+        return self
+
+    def __exit__(self, *exc):
+        _units.current = None
+        if self.dirty:
+            self.commit(self.users)
+        if self.events and self.publish is not None:
+            self.publish(*self.events)
+        return False
+
+# ==========================
+# 🚚 users.json Migration
+# ==========================
+def migrate_json(json_path, store, batch_size=500):
+    # One-shot import of the legacy users.json into any backend.
+    # Returns the number of players copied.
+    legacy = JsonFileStore(json_path)
+    batch, copied = {}, 0
+    for user_id, record in legacy.scan():
+        batch[user_id] = record
+        if len(batch) >= batch_size:
+            store.put_many(batch)
+            copied += len(batch)
+            batch = {}
+    store.put_many(batch)
+    return copied + len(batch)
+
+if __name__ == "__main__":
+    # python storage.py migrate [users.json] [users.db]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python storage.py migrate [users.json] [users.db]")
+        sys.exit(1)
+    src = sys.argv[2] if len(sys.argv) > 2 else "users.json"
+    dst = sys.argv[3] if len(sys.argv) > 3 else "users.db"
+    n = migrate_json(src, SQLiteStore(dst))
+    print(f"✅ Migrated {n} players from {src} to {dst}")
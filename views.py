@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# ==========================
+# 📄 Paginated Views
+# ==========================
+# Long listings (inventory, collections, gallery) are split into pages that
+# stay under Telegram's 4096-character limit and get ◀️ / ▶️ buttons.
+# Rendered pages are cached per (user, view) together with the player's
+# inventory version, so flipping pages never rebuilds anything; any
+# inventory change bumps the version and the next view re-renders once.
+
+PAGE_LINES = 20
+PAGE_CHARS = 3800  # headroom under Telegram's 4096 limit for the footer
+
+def paginate(title, lines, page_lines=PAGE_LINES, page_chars=PAGE_CHARS):
+    pages, current, size = [], [], len(title)
+    for line in lines:
+        if current and (len(current) >= page_lines or size + len(line) + 1 > page_chars):
+            pages.append(current)
+            current, size = [], len(title)
+        current.append(line)
+        size += len(line) + 1
+    if current or not pages:
+        pages.append(current)
+
+    total = len(pages)
+    rendered = []
+    for n, page in enumerate(pages, 1):
+        footer = f"\n\n📄 Page {n}/{total}" if total > 1 else ""
+        rendered.append((title + "\n\n" + "\n".join(page)).strip() + footer)
+    return tuple(rendered)
+
+def nav_keyboard(view, page, total):
+    if total <= 1:
+        return None
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Prev", callback_data=f"page_{view}_{page-1}"))
+    if page < total - 1:
+        row.append(InlineKeyboardButton("Next ▶️", callback_data=f"page_{view}_{page+1}"))
+    return InlineKeyboardMarkup([row])
+
+class PageCache:
+    # LRU of (user_id, view) -> (version, pages), bounded to max_entries
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def pages(self, user_id, view, version, build):
+        key = (user_id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        pages = build()
+        with self._lock:
+            self._entries[key] = (version, pages)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return pages
@@ -0,0 +1,93 @@
+import json, queue, logging, threading
+from flask import Flask, Response, request, jsonify
+from werkzeug.serving import make_server
+from telegram import Update
+
+# ==========================
+# 🌐 Webhook Ingestion Server
+# ==========================
+# Telegram POSTs each update to /webhook. The update is parsed and put on a
+# bounded queue that the dispatcher drains. When the queue is full we answer
+# 503 so Telegram backs off and redelivers later; nothing piles up in memory.
+#
+#   GET /healthz  -> process is up
+#   GET /readyz   -> dispatcher running and queue has room (for load balancers)
+#   GET /metrics       -> Prometheus text: latency histograms, storage bytes, cache hits, queue depths
+#   GET /metrics.json  -> the same numbers as JSON
+#
+# With record_file set, every accepted payload is also appended to that file
+# as JSON lines so benchmarks/fake_telegram.py can replay real traffic.
+
+WEBHOOK_PATH = "/webhook"
+
+def create_app(bot, update_queue, secret_token=None, ready=lambda: True, record_file=None,
+               stats=None, prometheus=None):
+    app = Flask(__name__)
+    record_lock = threading.Lock()
+
+    @app.post(WEBHOOK_PATH)
+    def webhook():
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return jsonify(ok=False, error="forbidden"), 403
+        payload = request.get_json(force=True, silent=True)
+        if not isinstance(payload, dict):
+            return jsonify(ok=False, error="bad update"), 400
+        try:
+            update_queue.put_nowait(Update.de_json(payload, bot))
+        except queue.Full:
+            return jsonify(ok=False, error="busy"), 503
+        if record_file:
+            with record_lock, open(record_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        return jsonify(ok=True)
+
+    @app.get("/healthz")
+    def healthz():
+        return jsonify(status="ok")
+
+    @app.get("/readyz")
+    def readyz():
+        depth, limit = update_queue.qsize(), update_queue.maxsize
+        is_ready = ready() and (limit <= 0 or depth < limit)
+        return jsonify(ready=is_ready, queue_depth=depth, queue_limit=limit), (200 if is_ready else 503)
+
+    add_metrics_routes(app, stats, prometheus)
+    return app
+
+def add_metrics_routes(app, stats=None, prometheus=None):
+    @app.get("/metrics")
+    def metrics_text():
+        return Response(prometheus() if prometheus else "", mimetype="text/plain; version=0.0.4")
+
+    @app.get("/metrics.json")
+    def metrics_json():
+        return jsonify(stats() if stats else {})
+
+def create_metrics_app(stats=None, prometheus=None):
+    # Just health and metrics, for polling mode where there is no webhook
+    app = Flask(__name__)
+
+    @app.get("/healthz")
+    def healthz():
+        return jsonify(status="ok")
+
+    add_metrics_routes(app, stats, prometheus)
+    return app
+
+class WebhookServer:
+    # Threaded werkzeug server that can be shut down cleanly from main()
+    def __init__(self, app, host="0.0.0.0", port=8080):
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per update
+        self._server = make_server(host, port, app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="webhook-server", daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
@@ -0,0 +1,140 @@
+import time, queue, threading, functools
+from collections import deque
+from telegram.ext import Dispatcher
+from telegram.utils.request import Request
+
+import metrics
+
+# ==========================
+# 👷 Per-user Ordered Worker Pool
+# ==========================
+# Every task carries a key (the Telegram user id). Tasks with the same key
+# run strictly one after another in submission order; tasks with different
+# keys run in parallel on any free worker. Each key has its own FIFO, and a
+# key sits on the shared ready queue at most once, so one slow player never
+# holds up anyone else's updates.
+class OrderedWorkerPool:
+    def __init__(self, workers=8, name="worker"):
+        self.workers = workers
+        self.name = name
+        self._pending = {}  # key -> deque of tasks; present while queued or running
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._queued = 0
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            self._queued += 1
+            tasks = self._pending.get(key)
+            if tasks is not None:
+                tasks.append((fn, args))
+                return
+            self._pending[key] = deque([(fn, args)])
+        self._ready.put(key)
+
+    def queue_depth(self):
+        return self._queued
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._lock:
+                fn, args = self._pending[key].popleft()
+            try:
+                fn(*args)
+            except Exception as e:
+                # A task that raises must not take its worker thread with it
+                print(f"⚠️ {self.name} task for {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._queued -= 1
+                    if self._pending[key]:
+                        requeue = True
+                    else:
+                        del self._pending[key]
+                        requeue = False
+                if requeue:
+                    self._ready.put(key)
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=30):
+        # Let already-submitted tasks finish, then stop the workers
+        deadline = time.time() + timeout
+        while self._queued and time.time() < deadline:
+            time.sleep(0.05)
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+# ==========================
+# 📬 Dispatcher Integration
+# ==========================
+def update_key(update):
+    # Same user -> same key; updates without a user need no ordering
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return ("update", update.update_id)
+
+def timed(name, callback):
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        with metrics.registry.handler(name):
+            return callback(update, context)
+    return wrapper
+
+class TimedRequest(Request):
+    # Bot API calls count as the "telegram" phase of the running handler
+    def post(self, *args, **kwargs):
+        with metrics.registry.phase("telegram"):
+            return super().post(*args, **kwargs)
+
+    def retrieve(self, *args, **kwargs):
+        with metrics.registry.phase("telegram"):
+            return super().retrieve(*args, **kwargs)
+
+class OrderedDispatcher(Dispatcher):
+    # The dispatcher thread only routes updates; handlers run on the pool.
+    # Every registered handler callback is timed under its function name.
+    # unit_of_work, if given, is a context manager factory wrapped around all
+    # the handlers of one update (see storage.UnitOfWork).
+    def __init__(self, *args, pool, unit_of_work=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+        self.unit_of_work = unit_of_work
+
+    def add_handler(self, handler, group=0):
+        if hasattr(handler, "callback"):
+            handler.callback = timed(handler.callback.__name__, handler.callback)
+        super().add_handler(handler, group)
+
+    def process_update(self, update):
+        if not hasattr(update, "effective_user"):
+            # errors and non-Update objects keep PTB's inline behaviour
+            return super().process_update(update)
+        self.pool.submit(update_key(update), self._process, update)
+
+    def _process(self, update):
+        if self.unit_of_work is None:
+            return Dispatcher.process_update(self, update)
+        with self.unit_of_work():
+            Dispatcher.process_update(self, update)
+
+    def start(self, ready=None):
+        self.pool.start()
+        super().start(ready)
+
+    def stop(self):
+        super().stop()
+        self.pool.stop()